@@ -1,6 +1,17 @@
 from flask import Flask, jsonify, session
 from flask_cors import CORS
+from config import KM_FLUSH_SECONDS
 from routes import register_routes
+from db.connection import init_app, pool_stats, PoolTimeout
+from db.leader import AdvisoryLockLeader, PAYOUT_LOCK_KEY
+from services.line_catalog import line_catalog
+from services.planner import plan_cache
+from services.recompute_queue import recompute_queue
+from services.winners_snapshot import winners_snapshot
+from db.events import event_broadcaster
+from db.versions import table_versions
+from datetime import datetime
+import atexit
 import os
 from apscheduler.schedulers.background import BackgroundScheduler
 
@@ -9,28 +20,91 @@ app.secret_key = "super-secret-key"
 CORS(app, supports_credentials=True, origins=["http://localhost:5173"])
 
 register_routes(app)
+init_app(app)
+recompute_queue.start()
+table_versions.start()
 
+# Az ütemező minden workerben elindul, de a kifizetést csak a tanácsadó zárat birtokló vezető futtatja.
+# Csak a belépési pontok indítják (wsgi.py, fejlesztői szerver); az app importja (eszközök, tesztek) nem.
+# Gunicorn esetén --preload nélkül kell indítani, hogy a szálak a fork után jöjjenek létre.
 def start_schedulers(app):
     if app.extensions.get("apscheduler"):
         return app.extensions["apscheduler"]
 
     sched = BackgroundScheduler(daemon=True)
 
+    def run_payout_catch_up():
+        with app.app_context():
+            from services.schedule_service import catch_up_missed_payouts
+            catch_up_missed_payouts()
+
+    leader = AdvisoryLockLeader(PAYOUT_LOCK_KEY, on_elected=run_payout_catch_up)
+
     def run_payout():
+        if not leader.is_leader():
+            return
         with app.app_context():
-            from services.schedule_service import payout_for_active_schedules
+            from services.schedule_service import catch_up_missed_payouts, payout_for_active_schedules
             payout_for_active_schedules()
+            # Az előző idősáv végén kimaradt tickek (késő futás, vezetőváltás) pótlása
+            catch_up_missed_payouts()
+
+    sched.add_job(leader.is_leader, "interval", seconds=leader.heartbeat_seconds, id="leader-heartbeat",
+                  next_run_time=datetime.now(), replace_existing=True)
+
+    def run_km_flush():
+        if not leader.is_leader():
+            return
+        with app.app_context():
+            from services.busz_service import flush_km_events
+            flush_km_events()
 
     sched.add_job(run_payout, "interval", minutes=10, id="payout-job", replace_existing=True)
+    sched.add_job(run_km_flush, "interval", seconds=KM_FLUSH_SECONDS, id="km-flush-job", replace_existing=True)
     sched.start()
+    atexit.register(leader.release)
     app.extensions["apscheduler"] = sched
+    app.extensions["scheduler_leader"] = leader
     return sched
 
 @app.errorhandler(ValueError)
 def handle_value_error(e):
     return jsonify({"error": str(e)}), 400
 
+@app.errorhandler(PoolTimeout)
+def handle_pool_timeout(e):
+    return jsonify({"error": "Database busy, try again later"}), 503
+
+@app.route("/health/db", methods=["GET"])
+def db_health():
+    return jsonify(pool_stats())
+
+@app.route("/health/plan-cache", methods=["GET"])
+def plan_cache_health():
+    return jsonify(plan_cache.stats())
+
+@app.route("/health/line-catalog", methods=["GET"])
+def line_catalog_health():
+    return jsonify(line_catalog.stats())
+
+@app.route("/health/recompute-queue", methods=["GET"])
+def recompute_queue_health():
+    return jsonify(recompute_queue.stats())
+
+@app.route("/health/winners-snapshot", methods=["GET"])
+def winners_snapshot_health():
+    return jsonify(winners_snapshot.stats())
+
+@app.route("/health/events", methods=["GET"])
+def events_health():
+    return jsonify(event_broadcaster.stats())
+
+@app.route("/health/table-versions", methods=["GET"])
+def table_versions_health():
+    return jsonify(table_versions.stats())
+
 if __name__ == "__main__":
+    # Fejlesztői szerver: csak a reloader gyermekfolyamata indít ütemezőt
     if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
         start_schedulers(app)
     app.run(debug=True)
@@ -0,0 +1,61 @@
+# Flotta betöltése: egy COPY-s import kontra buszonkénti create_bus hívások
+#   cd flask_app && python -m pytest benchmarks/bench_fleet_import.py
+import io
+import pytest
+from services import busz_service
+
+pytest.importorskip("pytest_benchmark")
+
+
+def seed_garage(conn):
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO garages (id, name) VALUES (1, 'Bench') ON CONFLICT DO NOTHING")
+    conn.commit()
+
+
+def clear_fleet(conn):
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM bus")
+    conn.commit()
+
+
+def fleet_rows(count):
+    return [
+        {"plate": f"IMP-{i}", "type": "Bench", "km": i, "year": 2000 + i % 20, "garage": 1,
+         "description": "", "status": "KT", "line": "-"}
+        for i in range(count)
+    ]
+
+
+def fleet_csv(rows):
+    lines = ["plate,type,km,year,garage,description,status,line"]
+    lines += [",".join(str(row[k]) for k in ("plate", "type", "km", "year", "garage", "description", "status", "line"))
+              for row in rows]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def create_one_by_one(rows):
+    for row in rows:
+        busz_service.create_bus(row)
+
+
+@pytest.mark.parametrize("buses", [100, 1000, 5000])
+def test_copy_import(benchmark, migrated_db, buses):
+    seed_garage(migrated_db)
+    body = fleet_csv(fleet_rows(buses))
+    benchmark.group = f"fleet import, {buses} buses"
+    result = benchmark.pedantic(
+        lambda: busz_service.import_fleet(io.BytesIO(body), "text/csv"),
+        setup=lambda: clear_fleet(migrated_db),
+        rounds=5,
+        iterations=1,
+    )
+    assert result["inserted"] == buses and result["rejected_count"] == 0
+
+
+@pytest.mark.parametrize("buses", [100, 1000, 5000])
+def test_create_bus_per_row(benchmark, migrated_db, buses):
+    seed_garage(migrated_db)
+    rows = fleet_rows(buses)
+    benchmark.group = f"fleet import, {buses} buses"
+    benchmark.pedantic(create_one_by_one, args=(rows,), setup=lambda: clear_fleet(migrated_db), rounds=3, iterations=1)
@@ -0,0 +1,104 @@
+# Kifizetési tick időtartama az aktív menetrendek számának függvényében
+from datetime import datetime
+import pytest
+from services import busz_service, schedule_service
+
+pytest.importorskip("pytest_benchmark")
+
+TICK_AT = datetime(2024, 1, 1, 9, 5)
+BUSES_PER_SCHEDULE = 3
+
+
+def seed_active_schedules(conn, count):
+    users = max(1, count // 4)
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO garages (id, name) VALUES (1, 'Bench')")
+        cur.execute("INSERT INTO lines (name, provider_garage_id, travel_time_garage, travel_time_line) VALUES ('B1', 1, 10, 30)")
+        cur.execute("""
+            INSERT INTO users (username, password, balance)
+            SELECT 'user' || i, 'x', 0 FROM generate_series(1, %s) i
+        """, (users,))
+        cur.execute("""
+            INSERT INTO schedules (id, username, line_name, garage_id, start_time, end_time, frequency, bid_price, status, frame)
+            SELECT i, 'user' || (i %% %s + 1), 'B1', 1, '08:00', '12:00', 30, 1000 + i %% 9000, 'active', 'midday'
+            FROM generate_series(1, %s) i
+        """, (users, count))
+        cur.execute("""
+            INSERT INTO bus (plate, type, km, year, garage, status, line, owner)
+            SELECT 'P' || s || '-' || b, 'Bench', 0, 2000, 1, 'menetrend', 'B1', 'user' || (s %% %s + 1)
+            FROM generate_series(1, %s) s, generate_series(0, %s) b
+        """, (users, count, BUSES_PER_SCHEDULE - 1))
+        cur.execute("""
+            INSERT INTO schedule_assignments (schedule_id, block_idx, bus_plate)
+            SELECT s, b, 'P' || s || '-' || b
+            FROM generate_series(1, %s) s, generate_series(0, %s) b
+        """, (count, BUSES_PER_SCHEDULE - 1))
+        cur.execute("ANALYZE")
+    conn.commit()
+
+
+def clear_ledger(conn):
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM payout_ticks")
+    conn.commit()
+
+
+# A korábbi, menetrendenkénti UPDATE-eket kiadó megvalósítás az összehasonlításhoz
+def row_by_row_payout(conn, now):
+    frame_name, start_min, _ = schedule_service._current_frame(now)
+    tick_idx = schedule_service._frame_tick_index(now, start_min)
+    with conn.cursor() as cur:
+        cur.execute("SELECT id, username, bid_price FROM schedules WHERE status = 'active' AND frame = %s", (frame_name,))
+        for row in cur.fetchall():
+            bid = int(row["bid_price"])
+            inc = bid // 24 + (1 if tick_idx < bid % 24 else 0)
+            if inc > 0:
+                cur.execute("UPDATE users SET balance = balance + %s WHERE username = %s", (inc, row["username"]))
+            cur.execute("SELECT bus_plate FROM schedule_assignments WHERE schedule_id = %s", (row["id"],))
+            for r in cur.fetchall():
+                cur.execute("UPDATE bus SET km = COALESCE(km, 0) + 10 WHERE plate = %s", (r["bus_plate"],))
+        conn.commit()
+
+
+@pytest.mark.parametrize("active_schedules", [100, 1000, 10000])
+def test_set_based_payout_tick(benchmark, bench_db, active_schedules):
+    seed_active_schedules(bench_db, active_schedules)
+    benchmark.group = f"payout tick, {active_schedules} active schedules"
+    benchmark.pedantic(
+        schedule_service.payout_for_active_schedules,
+        args=(TICK_AT,),
+        setup=lambda: clear_ledger(bench_db),
+        rounds=5,
+        iterations=1,
+    )
+
+
+@pytest.mark.parametrize("active_schedules", [100, 1000, 10000])
+def test_row_by_row_payout_tick(benchmark, bench_db, active_schedules):
+    seed_active_schedules(bench_db, active_schedules)
+    benchmark.group = f"payout tick, {active_schedules} active schedules"
+    benchmark.pedantic(row_by_row_payout, args=(bench_db, TICK_AT), rounds=5, iterations=1)
+
+
+def test_set_based_payout_matches_row_by_row(bench_db):
+    seed_active_schedules(bench_db, 200)
+    with bench_db.cursor() as cur:
+        schedule_service.payout_for_active_schedules(TICK_AT)
+        # A kilométerek a naplóban várnak, összevetés előtt beírjuk őket
+        busz_service.flush_km_events()
+        cur.execute("SELECT username, balance FROM users ORDER BY username")
+        set_based_users = cur.fetchall()
+        cur.execute("SELECT plate, km FROM bus ORDER BY plate")
+        set_based_buses = cur.fetchall()
+        cur.execute("UPDATE users SET balance = 0")
+        cur.execute("UPDATE bus SET km = 0")
+        bench_db.commit()
+
+        # Ugyanarra a tickre a napló miatt nem történik újabb kifizetés
+        assert schedule_service.payout_for_active_schedules(TICK_AT) == []
+
+        row_by_row_payout(bench_db, TICK_AT)
+        cur.execute("SELECT username, balance FROM users ORDER BY username")
+        assert cur.fetchall() == set_based_users
+        cur.execute("SELECT plate, km FROM bus ORDER BY plate")
+        assert cur.fetchall() == set_based_buses
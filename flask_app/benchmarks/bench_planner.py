@@ -0,0 +1,23 @@
+# A blokktervező futásideje szélsőséges menetrendeken (adatbázis nem szükséges)
+import pytest
+from services.planner import plan_blocks
+from services.schedule_service import generate_slots
+
+pytest.importorskip("pytest_benchmark")
+
+CASES = {
+    "1-minute headway, 4h frame": ("08:00", "12:00", 1, 10, 30),
+    "1-minute headway, long line": ("08:00", "12:00", 1, 20, 120),
+    "long travel time, 5-minute headway": ("04:00", "08:00", 5, 45, 180),
+    "full 24h window, 2-minute headway": ("00:00", "24:00", 2, 15, 40),
+    "full 24h window, 1-minute headway": ("00:00", "24:00", 1, 15, 90),
+}
+
+
+@pytest.mark.parametrize("case", list(CASES))
+def test_plan_blocks(benchmark, case):
+    start, end, frequency, travel_time_garage, travel_time_line = CASES[case]
+    slots = generate_slots(start, end, frequency)
+    benchmark.group = "planner"
+    blocks = benchmark(plan_blocks, slots, travel_time_garage, travel_time_line)
+    assert sum(len(b["departures"]) for b in blocks) == len(slots)
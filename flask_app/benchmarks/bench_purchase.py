@@ -0,0 +1,159 @@
+# Hirdetésvásárlás párhuzamos vevőkkel ("flash sale"): áteresztőképesség és p99 késleltetés.
+#   cd flask_app && python -m pytest benchmarks/bench_purchase.py -s
+# Minden vevő saját szálon, saját kapcsolattal, véletlen sorrendben próbálja megvenni a hirdetéseket.
+import random
+import threading
+import time
+from datetime import datetime
+import pytest
+from db import connection
+from services import market_service
+
+pytest.importorskip("pytest_benchmark")
+
+BUYERS = 8
+SELLERS = 10
+LISTINGS = 200
+PRICE = 1000
+
+
+def seed_flash_sale(conn, buyer_balance):
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO garages (id, name) VALUES (1, 'Bench')")
+        cur.execute("""
+            INSERT INTO users (username, password, balance)
+            SELECT 'seller' || i, 'x', 0 FROM generate_series(1, %s) i
+            UNION ALL
+            SELECT 'buyer' || i, 'x', %s FROM generate_series(1, %s) i
+        """, (SELLERS, buyer_balance, BUYERS))
+        cur.execute("INSERT INTO user_garages (username, garage_id) SELECT 'buyer' || i, 1 FROM generate_series(1, %s) i", (BUYERS,))
+        cur.execute("""
+            INSERT INTO bus (plate, type, km, year, garage, status, line, owner)
+            SELECT 'S' || i, 'Bench', 0, 2000, 1, 'KT', '-', 'seller' || (i %% %s + 1)
+            FROM generate_series(1, %s) i
+        """, (SELLERS, LISTINGS))
+        cur.execute("""
+            INSERT INTO market_listings (id, bus_plate, seller_username, price, status)
+            SELECT i, 'S' || i, 'seller' || (i %% %s + 1), %s, 'active'
+            FROM generate_series(1, %s) i
+        """, (SELLERS, PRICE, LISTINGS))
+        cur.execute("ANALYZE")
+    conn.commit()
+
+
+# A korábbi megvalósítás: a hirdetés zárolására várakozik, az egyenleget zárolás nélkül olvassa
+def legacy_purchase_listing(buyer_username, listing_id, garage_id=None):
+    conn = connection.get_connection()
+    with conn.cursor() as cur:
+        cur.execute("SELECT id, bus_plate, seller_username, price, status FROM market_listings WHERE id = %s FOR UPDATE", (listing_id,))
+        listing = cur.fetchone()
+        if not listing or listing["status"] != "active":
+            conn.rollback()
+            return {"error": "Listing not available"}, 404
+        cur.execute("SELECT owner FROM bus WHERE plate = %s", (listing["bus_plate"],))
+        if cur.fetchone()["owner"] != listing["seller_username"]:
+            conn.rollback()
+            return {"error": "Seller no longer owns this bus"}, 400
+        cur.execute("SELECT balance FROM users WHERE username = %s", (buyer_username,))
+        if cur.fetchone()["balance"] < listing["price"]:
+            conn.rollback()
+            return {"error": "Insufficient balance"}, 400
+        cur.execute("DELETE FROM schedule_assignments WHERE bus_plate = %s", (listing["bus_plate"],))
+        cur.execute("UPDATE users SET balance = balance - %s WHERE username = %s", (listing["price"], buyer_username))
+        cur.execute("UPDATE users SET balance = balance + %s WHERE username = %s", (listing["price"], listing["seller_username"]))
+        cur.execute("UPDATE bus SET owner = %s, garage = %s WHERE plate = %s", (buyer_username, garage_id, listing["bus_plate"]))
+        cur.execute("UPDATE market_listings SET status = 'sold', sold_at = %s WHERE id = %s", (datetime.utcnow(), listing_id))
+        conn.commit()
+    return {"message": "Purchase successful"}, 200
+
+
+def _buyer(purchase, username, results, start):
+    conn = connection._connect()
+    with conn.cursor() as cur:
+        cur.execute("SET search_path TO bench")
+    conn.commit()
+    token = connection._scoped_connection.set(conn)
+    listing_ids = list(range(1, LISTINGS + 1))
+    random.Random(username).shuffle(listing_ids)
+    try:
+        start.wait()
+        for listing_id in listing_ids:
+            began = time.perf_counter()
+            try:
+                _, status = purchase(username, listing_id, garage_id=1)
+            except Exception:
+                conn.rollback()
+                status = "error"
+            results.append((status, time.perf_counter() - began))
+    finally:
+        connection._scoped_connection.reset(token)
+        conn.close()
+
+
+# Egy teljes "flash sale" lefuttatása; visszatérési érték: összesítő statisztika
+def run_flash_sale(purchase):
+    results = []
+    start = threading.Barrier(BUYERS + 1)
+    threads = [
+        threading.Thread(target=_buyer, args=(purchase, f"buyer{i}", results, start))
+        for i in range(1, BUYERS + 1)
+    ]
+    for t in threads:
+        t.start()
+    start.wait()
+    began = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - began
+
+    latencies = sorted(latency for _, latency in results)
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    return {
+        "attempts": len(results),
+        "purchases": statuses.get(200, 0),
+        "statuses": statuses,
+        "attempts_per_second": round(len(results) / elapsed, 1),
+        "purchases_per_second": round(statuses.get(200, 0) / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+    }
+
+
+def check_invariants(conn, buyer_balance):
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS sold FROM market_listings WHERE status = 'sold'")
+        sold = cur.fetchone()["sold"]
+        cur.execute("SELECT SUM(balance) AS total, MIN(balance) AS lowest FROM users")
+        money = cur.fetchone()
+        cur.execute("""
+            SELECT COUNT(*) AS mismatched FROM market_listings ml JOIN bus b ON b.plate = ml.bus_plate
+            WHERE (ml.status = 'sold') <> (b.owner LIKE 'buyer%%')
+        """)
+        mismatched = cur.fetchone()["mismatched"]
+    conn.rollback()
+    assert money["total"] == BUYERS * buyer_balance
+    assert money["lowest"] >= 0
+    assert mismatched == 0
+    return sold
+
+
+@pytest.mark.parametrize("implementation", ["nowait", "legacy"])
+def test_flash_sale(benchmark, migrated_db, implementation):
+    purchase = market_service.purchase_listing if implementation == "nowait" else legacy_purchase_listing
+    seed_flash_sale(migrated_db, buyer_balance=PRICE * LISTINGS)
+    benchmark.group = f"flash sale, {BUYERS} buyers, {LISTINGS} listings"
+    stats = benchmark.pedantic(run_flash_sale, args=(purchase,), rounds=1, iterations=1)
+    benchmark.extra_info.update(stats)
+    print(f"\n{implementation}: {stats}")
+    assert check_invariants(migrated_db, PRICE * LISTINGS) == LISTINGS == stats["purchases"]
+
+
+# Kevés pénzzel rendelkező vevők párhuzamos vásárlásai sem vihetik negatívba az egyenleget
+def test_concurrent_purchases_never_overdraw(migrated_db):
+    affordable = 3
+    seed_flash_sale(migrated_db, buyer_balance=PRICE * affordable)
+    stats = run_flash_sale(market_service.purchase_listing)
+    sold = check_invariants(migrated_db, PRICE * affordable)
+    assert sold == stats["purchases"] == BUYERS * affordable
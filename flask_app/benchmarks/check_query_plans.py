@@ -0,0 +1,260 @@
+# Lekérdezési tervek ellenőrzése nagy, generált adathalmazon (elérhető PostgreSQL szükséges):
+#   cd flask_app && python -m pytest benchmarks/check_query_plans.py
+# A szolgáltatások minden utasítása előtt EXPLAIN fut; a teszt elbukik, ha bármelyik terv
+# szekvenciális táblabejárást tartalmaz a kis, referencia jellegű táblákon kívül.
+from datetime import datetime, timedelta
+from db import connection
+from services import busz_service, garage_service, hiba_service, line_service, market_service
+from services import bootstrap_service, schedule_service, user_service
+
+# Néhány soros törzsadat-táblák, ezeken a teljes bejárás a legolcsóbb terv
+SMALL_TABLES = {"garages", "lines", "schema_migrations"}
+EXPLAINED_STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+# Szándékos teljes bejárások: a kilométeróra-napló bevezetése a teljes naplót kiüríti,
+# a vonalak áttekintése pedig minden vonal összes menetrendjét visszaadja
+EXPECTED_SEQ_SCANS = {"flush_km_events": {"bus_km_events"}, "lines_overview": {"schedules"}}
+
+USERS = 50000
+BUSES = 200000
+LINES = 300
+BIDS_PER_SLOT = 20      # Ajánlatok száma vonalanként és idősávonként
+PAYOUT_AT = datetime(2024, 1, 1, 9, 5)
+
+
+def seed_large_dataset(conn):
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO garages (id, name) SELECT g, 'Garage ' || g FROM generate_series(1, 3) g")
+        cur.execute("""
+            INSERT INTO users (username, password, balance)
+            SELECT 'user' || i, 'x', 10000000 FROM generate_series(1, %s) i
+        """, (USERS,))
+        cur.execute("""
+            INSERT INTO user_garages (username, garage_id)
+            SELECT 'user' || i, g FROM generate_series(1, %s) i, generate_series(1, 3) g
+        """, (USERS,))
+        cur.execute("""
+            INSERT INTO lines (name, provider_garage_id, travel_time_garage, travel_time_line)
+            SELECT 'L' || l, l %% 3 + 1, 10, 30 FROM generate_series(1, %s) l
+        """, (LINES,))
+        # Minden tizedik busz gazdátlan (piacon vásárolható)
+        cur.execute("""
+            INSERT INTO bus (plate, type, km, year, garage, status, line, owner)
+            SELECT 'B' || i, 'Ikarus 280', i * 10, 1990 + i %% 30, i %% 3 + 1, 'KT', '-',
+                   CASE WHEN i %% 10 = 0 THEN NULL ELSE 'user' || (i %% %s + 1) END
+            FROM generate_series(1, %s) i
+        """, (USERS, BUSES))
+        # Vonalanként és idősávonként több ajánlat, ebből egy aktív; mindegyikhez kiosztott buszokkal
+        cur.execute("""
+            INSERT INTO schedules (id, username, line_name, garage_id, start_time, end_time,
+                                   frequency, bid_price, status, frame, required_blocks)
+            SELECT row_number() OVER (), 'user' || ((l * %s + b) %% %s + 1), 'L' || l, l %% 3 + 1,
+                   '08:00', '12:00', 30, 1000 + b, CASE WHEN b = 1 THEN 'active' ELSE 'pending' END, f, 3
+            FROM generate_series(1, %s) l,
+                 unnest(ARRAY['morning', 'midday', 'afternoon', 'evening', 'night']) f,
+                 generate_series(1, %s) b
+        """, (BIDS_PER_SLOT, USERS, LINES, BIDS_PER_SLOT))
+        cur.execute("SELECT setval('schedules_id_seq', (SELECT MAX(id) FROM schedules))")
+        cur.execute("""
+            INSERT INTO schedule_assignments (schedule_id, block_idx, bus_plate)
+            SELECT s.id, b, 'B' || ((s.id * 3 + b) %% %s + 1)
+            FROM schedules s, generate_series(0, 2) b
+        """, (BUSES,))
+        # Egy hétnyi, az előző tickig naprakész kifizetési napló
+        ticks = schedule_service._due_ticks(PAYOUT_AT - timedelta(days=7), PAYOUT_AT - timedelta(minutes=1))
+        cur.execute("""
+            INSERT INTO payout_ticks (pay_date, frame, tick_idx, tick_at)
+            SELECT * FROM unnest(%s::date[], %s::text[], %s::int[], %s::timestamp[])
+        """, tuple(list(column) for column in zip(*ticks)))
+        cur.execute("""
+            INSERT INTO market_listings (bus_plate, seller_username, price, status, created_at)
+            SELECT 'B' || i, 'user' || (i % 50000 + 1), 100000 + i,
+                   CASE WHEN i % 40 = 0 THEN 'active' ELSE 'sold' END,
+                   now() - i * interval '1 minute'
+            FROM generate_series(1, 20000) i
+        """)
+        cur.execute("""
+            INSERT INTO issues (bus, "time", reported_at, repair_time, repair_cost, description)
+            SELECT 'B' || (i % 200000 + 1), '2025.10.24 - 22:22:25', timestamp '2025-10-24 22:22:25' - i * interval '1 minute',
+                   interval '1 hour', 1000, 'seed'
+            FROM generate_series(1, 100000) i
+        """)
+        # Néhány kifizetési tick még be nem vezetett kilométeróra-növekményei
+        cur.execute("""
+            INSERT INTO bus_km_events (bus_plate, km)
+            SELECT sa.bus_plate, 10 FROM schedule_assignments sa, generate_series(1, 3)
+        """)
+        # Két hónapnyi lezárt hiba az archívumban
+        for month in (9, 10):
+            cur.execute(f"""
+                CREATE TABLE issues_archive_2025_{month:02} PARTITION OF issues_archive
+                FOR VALUES FROM ('2025-{month:02}-01') TO ('2025-{month + 1:02}-01')
+            """)
+        cur.execute("""
+            INSERT INTO issues_archive (id, bus, "time", reported_at, repair_time, repair_cost, description, resolved_at)
+            SELECT 1000000 + i, 'B' || (i % 200000 + 1), '2025.09.01 - 08:00:00', timestamp '2025-09-01 08:00' + i * interval '1 minute',
+                   interval '1 hour', 500, 'archived', timestamp '2025-09-02' + i * interval '1 minute'
+            FROM generate_series(1, 50000) i
+        """)
+        cur.execute("ANALYZE")
+    conn.commit()
+
+
+def seq_scans(plan):
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") not in SMALL_TABLES:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+# Minden végrehajtott utasítás tervét rögzítő kurzor
+# (nevesített kurzor esetén az EXPLAIN egy külön, névtelen kurzoron fut)
+class ExplainingCursor:
+    def __init__(self, cur, plans, conn):
+        self._cur = cur
+        self._plans = plans
+        self._conn = conn
+
+    def execute(self, query, params=None):
+        if query.split(None, 1)[0].upper() in EXPLAINED_STATEMENTS:
+            with self._conn.cursor() as explain:
+                explain.execute("EXPLAIN (FORMAT JSON) " + query, params)
+                self._plans.append((" ".join(query.split()), explain.fetchone()["QUERY PLAN"][0]["Plan"]))
+        self._cur.execute(query, params)
+
+    def executemany(self, query, params_list):
+        params_list = list(params_list)
+        for params in params_list:
+            self.execute(query, params)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith("_"):
+            super().__setattr__(name, value)
+        else:
+            setattr(self._cur, name, value)
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._cur.close()
+        return False
+
+
+class ExplainingConnection:
+    def __init__(self, conn):
+        self._conn = conn
+        self.plans = []
+
+    def cursor(self, name=None):
+        cur = self._conn.cursor(name) if name else self._conn.cursor()
+        return ExplainingCursor(cur, self.plans, self._conn)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def _scalar(conn, query, params=None):
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        return next(iter(cur.fetchone().values()))
+
+
+# A felhasználói kérések által használt szolgáltatáshívások (az adminisztrátori teljes listázások kivételével)
+def service_calls(conn):
+    user, other = "user7", "user8"
+    own_plate = "B6"
+    unowned_plate = "B10"
+    schedule_id = _scalar(conn, "SELECT id FROM schedules WHERE status = 'active' AND line_name = 'L1' AND frame = 'morning'")
+    listing_id = _scalar(conn, "SELECT id FROM market_listings WHERE status = 'active' AND seller_username <> %s LIMIT 1", (other,))
+    issue_id = _scalar(conn, "SELECT MAX(id) FROM issues")
+
+    return [
+        ("get_user_by_username", lambda: user_service.get_user_by_username(user)),
+        ("get_buses_for_user", lambda: busz_service.get_buses_for_user(user, False)),
+        ("list_buses page", lambda: busz_service.list_buses(user, False, {"fields": "plate,km", "status": "KT", "limit": "2"})),
+        ("toggle_favourite", lambda: busz_service.toggle_favourite(own_plate, user)),
+        ("list_garages_for_user", lambda: garage_service.list_garages_for_user(user)),
+        ("get_line", lambda: line_service.get_line("L1")),
+        ("lines_overview", line_service.lines_overview),
+        ("list_issues_by_bus", lambda: hiba_service.list_issues_by_bus(own_plate)),
+        ("list_issues_for_user", lambda: hiba_service.list_issues_for_user(user, False)),
+        ("create_issue", lambda: hiba_service.create_issue({
+            "bus": "B4", "time": "2025.10.24 - 22:22:25", "repair_time": "01:00:00",
+            "repair_cost": 100, "description": "check",
+        })),
+        ("create_issues_bulk", lambda: hiba_service.create_issues_bulk([
+            {"bus": f"B{i}", "time": "2025.10.24 - 22:22:25", "repair_cost": "10", "description": "telemetry"}
+            for i in range(100, 200)], user)),
+        ("remove_issue", lambda: hiba_service.remove_issue(issue_id)),
+        ("list_issue_history", lambda: hiba_service.list_issue_history({"status": "all"}, user, False)),
+        ("list_issue_history window", lambda: hiba_service.list_issue_history({
+            "status": "all", "from": "2025-10-01", "to": "2025-10-31", "bus": own_plate}, user, False)),
+        ("list_issue_history next page", lambda: hiba_service.list_issue_history({
+            "status": "resolved", "cursor": hiba_service.list_issue_history({"status": "resolved", "limit": "1"},
+                                                                            "admin", True)["next_cursor"]}, "admin", True)),
+        ("issue_summary", lambda: hiba_service.issue_summary([own_plate, unowned_plate, "B4"])),
+        ("list_market_buses", market_service.list_market_buses),
+        ("list_market_buses by price", lambda: market_service.list_market_buses({"sort": "price", "price_min": "90000"})),
+        ("list_market_buses by year", lambda: market_service.list_market_buses({"sort": "year", "order": "desc"})),
+        ("list_market_buses by type", lambda: market_service.list_market_buses({"type": "Ikarus 280", "sort": "type"})),
+        ("list_market_buses next page", lambda: market_service.list_market_buses({
+            "sort": "km", "cursor": market_service.list_market_buses({"sort": "km"})["next_cursor"]})),
+        ("list_active_listings", market_service.list_active_listings),
+        ("market_bootstrap", lambda: bootstrap_service.market_bootstrap(user)),
+        ("list_active_listings by price", lambda: market_service.list_active_listings({"sort": "price", "price_max": "105000"})),
+        ("list_active_listings for seller", lambda: market_service.list_active_listings({"seller": user})),
+        ("list_active_listings next page", lambda: market_service.list_active_listings({
+            "cursor": market_service.list_active_listings()["next_cursor"]})),
+        ("create_listing", lambda: market_service.create_listing(user, own_plate, 1000)),
+        ("cancel_listing", lambda: market_service.cancel_listing(user, _scalar(
+            conn, "SELECT id FROM market_listings WHERE bus_plate = %s AND status = 'active'", (own_plate,)))),
+        ("purchase_listing", lambda: market_service.purchase_listing(other, listing_id)),
+        ("buy_bus", lambda: market_service.buy_bus(unowned_plate, user)),
+        ("buy_buses_batch", lambda: market_service.buy_buses_batch(user, [{"rendszam": "B20"}, {"rendszam": "B30"}])),
+        ("create_listings_batch", lambda: market_service.create_listings_batch(user, [
+            {"rendszam": "B20", "price": 1000}, {"rendszam": "B30", "price": 2000}])),
+        ("purchase_new_buses_batch", lambda: market_service.purchase_new_buses_batch(user, [
+            {"model_key": "Volvo", "rendszam": "NEW-001", "leiras": "x", "garazs": 1},
+            {"model_key": "Modulo", "rendszam": "NEW-002", "leiras": "y", "garazs": 2}])),
+        ("list_schedules_for_user", lambda: schedule_service.list_schedules_for_user(user)),
+        ("list_schedules_for_line", lambda: schedule_service.list_schedules_for_line("L1")),
+        ("get_line_winners", schedule_service.get_line_winners),
+        ("has_all_assignments", lambda: schedule_service.has_all_assignments(schedule_id)),
+        ("plan_buses_for_schedule", lambda: schedule_service.plan_buses_for_schedule(schedule_id)),
+        ("select_winners", lambda: schedule_service.select_winners([("L1", "morning"), ("L2", "night")])),
+        ("payout_for_active_schedules", lambda: schedule_service.payout_for_active_schedules(PAYOUT_AT)),
+        ("get_buses_for_user after payout", lambda: busz_service.get_buses_for_user(user, False)),
+        ("flush_km_events", busz_service.flush_km_events),
+        ("create_schedule", lambda: schedule_service.create_schedule(user, {
+            "line_name": "L3", "frame": "morning", "frequency": 30, "bid_price": 500,
+        })),
+        ("delete_schedule", lambda: schedule_service.delete_schedule(schedule_id)),
+    ]
+
+
+def test_service_queries_use_indexes(migrated_db):
+    seed_large_dataset(migrated_db)
+    explaining = ExplainingConnection(migrated_db)
+    token = connection._scoped_connection.set(explaining)
+    offenders = []
+    try:
+        for name, call in service_calls(migrated_db):
+            start = len(explaining.plans)
+            call()
+            for query, plan in explaining.plans[start:]:
+                tables = [t for t in seq_scans(plan) if t not in EXPECTED_SEQ_SCANS.get(name, ())]
+                if tables:
+                    offenders.append(f"{name}: Seq Scan on {', '.join(tables)}\n    {query}")
+    finally:
+        connection._scoped_connection.reset(token)
+
+    assert explaining.plans, "no statements were explained"
+    assert not offenders, "Sequential scans on large tables:\n" + "\n".join(offenders)
@@ -0,0 +1,59 @@
+# Teljesítménymérések futtatása (pytest-benchmark és elérhető PostgreSQL szükséges):
+#   cd flask_app && python -m pytest benchmarks/bench_payout.py
+# A mérések egy ideiglenes "bench" sémában futnak, a public séma adatait nem érintik.
+from contextlib import contextmanager
+import psycopg2
+import pytest
+from db.connection import connection_scope
+from db.migrations import migrate
+
+BENCH_TABLES = ("users", "garages", "lines", "bus", "schedules", "schedule_assignments", "payout_ticks",
+                "bus_km_events")
+
+
+@contextmanager
+def _bench_schema(create):
+    try:
+        scope = connection_scope("benchmark")
+        conn = scope.__enter__()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL not reachable: {e}")
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DROP SCHEMA IF EXISTS bench CASCADE")
+            cur.execute("CREATE SCHEMA bench")
+            cur.execute("SET search_path TO bench")
+            create(conn, cur)
+        conn.commit()
+        yield conn
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute("DROP SCHEMA IF EXISTS bench CASCADE")
+            cur.execute("SET search_path TO public")
+        conn.commit()
+        scope.__exit__(None, None, None)
+
+
+def _copy_public_tables(conn, cur):
+    for table in BENCH_TABLES:
+        cur.execute(f"CREATE TABLE bench.{table} (LIKE public.{table} INCLUDING ALL)")
+
+
+def _run_migrations(conn, cur):
+    migrate(conn)
+
+
+# Üres táblák a public séma szerkezetével (indexekkel, kényszerek nélkül)
+@pytest.fixture
+def bench_db():
+    with _bench_schema(_copy_public_tables) as conn:
+        yield conn
+
+
+# Teljes séma a db.migrations migrációiból
+@pytest.fixture
+def migrated_db():
+    with _bench_schema(_run_migrations) as conn:
+        yield conn
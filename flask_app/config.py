@@ -4,3 +4,12 @@ DB_CONFIG = {
     "user": "dbuser",
     "password": "password"
 }
+
+KM_FLUSH_SECONDS = 900   # A kilométeróra-napló bus.km-be vezetésének gyakorisága
+QUERY_REPEAT_WARN = 10   # Ennél többször futó azonos alakú lekérdezés egy kérésen belül: N+1 figyelmeztetés
+
+DB_POOL = {
+    "maxconn": 10,
+    "acquire_timeout": 5.0,
+    "leak_timeout": 30.0
+}
@@ -1,9 +1,419 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from config import DB_CONFIG
+from flask import current_app, g, has_app_context, has_request_context, request
+from config import DB_CONFIG, DB_POOL, QUERY_REPEAT_WARN
 
-def get_connection():
+log = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# Korlátos, szálbiztos kapcsolatkészlet szivárgásfigyeléssel és telítettségi metrikákkal
+class ConnectionPool:
+    def __init__(self, connect, maxconn, acquire_timeout=5.0, leak_timeout=30.0):
+        self._connect = connect
+        self.maxconn = int(maxconn)
+        self.acquire_timeout = float(acquire_timeout)
+        self.leak_timeout = float(leak_timeout)
+        self._cond = threading.Condition()
+        self._idle = []
+        self._in_use = {}
+        self._opening = 0
+        self._waiting = 0
+        self._counters = {
+            "created": 0,
+            "discarded": 0,
+            "checkouts": 0,
+            "timeouts": 0,
+            "leaks": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "max_in_use": 0,
+            "max_waiting": 0,
+        }
+
+    def getconn(self, owner=None):
+        deadline = time.monotonic() + self.acquire_timeout
+        waited_from = None
+        with self._cond:
+            self._report_leaks()
+            while True:
+                while self._idle:
+                    conn = self._idle.pop()
+                    if conn.closed:
+                        self._counters["discarded"] += 1
+                        continue
+                    return self._checkout(conn, owner, waited_from)
+
+                if len(self._in_use) + self._opening < self.maxconn:
+                    self._opening += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters["timeouts"] += 1
+                    log.warning("Connection pool exhausted (%d in use, %d waiting)", len(self._in_use), self._waiting)
+                    raise PoolTimeout(f"No database connection available within {self.acquire_timeout:.1f}s")
+
+                if waited_from is None:
+                    waited_from = time.monotonic()
+                    self._counters["waits"] += 1
+                self._waiting += 1
+                self._counters["max_waiting"] = max(self._counters["max_waiting"], self._waiting)
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+        # Új kapcsolat nyitása a zár elengedése után, hogy a többi szál ne várjon a hálózatra
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._opening -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._opening -= 1
+            self._counters["created"] += 1
+            return self._checkout(conn, owner, waited_from)
+
+    def putconn(self, conn, discard=False):
+        with self._cond:
+            if self._in_use.pop(id(conn), None) is None:
+                raise ValueError("Connection does not belong to this pool")
+
+        if not discard and not conn.closed:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+
+        with self._cond:
+            if discard or conn.closed:
+                self._counters["discarded"] += 1
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            for conn in self._idle:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._idle = []
+
+    def leaked(self):
+        now = time.monotonic()
+        with self._cond:
+            return [
+                {"owner": entry["owner"], "held_seconds": round(now - entry["since"], 3)}
+                for entry in self._in_use.values()
+                if now - entry["since"] >= self.leak_timeout
+            ]
+
+    def stats(self):
+        with self._cond:
+            in_use = len(self._in_use)
+            return {
+                "maxconn": self.maxconn,
+                "in_use": in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "saturation": round(in_use / self.maxconn, 3) if self.maxconn else 1.0,
+                **self._counters,
+            }
+
+    def _checkout(self, conn, owner, waited_from):
+        self._in_use[id(conn)] = {"conn": conn, "owner": owner, "since": time.monotonic(), "reported": False}
+        self._counters["checkouts"] += 1
+        self._counters["max_in_use"] = max(self._counters["max_in_use"], len(self._in_use))
+        if waited_from is not None:
+            self._counters["wait_seconds"] += time.monotonic() - waited_from
+        return conn
+
+    def _report_leaks(self):
+        now = time.monotonic()
+        for entry in self._in_use.values():
+            if entry["reported"] or now - entry["since"] < self.leak_timeout:
+                continue
+            entry["reported"] = True
+            self._counters["leaks"] += 1
+            log.warning("Possible connection leak: held by %s for %.1fs", entry["owner"], now - entry["since"])
+
+
+# A lekérdezés "alakja": szóközök egységesítve, szöveg- és számliterálok helyén "?".
+# A paraméterezett lekérdezések (%s) alakja maga a szöveg, így az N+1 ismétlődés felismerhető.
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def fingerprint(statement):
+    if isinstance(statement, bytes):
+        statement = statement.decode(errors="replace")
+    elif not isinstance(statement, str):
+        statement = str(statement)
+    return _LITERALS.sub("?", " ".join(statement.split()))
+
+
+# Egy kérés (vagy track_queries blokk) adatbázis-forgalma: lekérdezések száma, az adatbázisban
+# töltött idő (végrehajtás és sorlekérés), a lekért sorok és lekérdezés-alakonként a futások száma
+class QueryStats:
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.statements = Counter()
+
+    def record(self, statement, seconds):
+        self.queries += 1
+        self.seconds += seconds
+        self.statements[fingerprint(statement)] += 1
+
+    def fetched(self, rows, seconds=0.0):
+        self.rows += rows
+        self.seconds += seconds
+
+    # A küszöbnél többször futó lekérdezés-alakok, a leggyakoribb elöl
+    def repeated(self, threshold=QUERY_REPEAT_WARN):
+        return [(statement, count) for statement, count in self.statements.most_common() if count > threshold]
+
+    def server_timing(self):
+        return f'db;dur={self.seconds * 1000:.1f};desc="{self.queries} queries, {self.rows} rows"'
+
+    def as_dict(self):
+        return {
+            "queries": self.queries,
+            "db_ms": round(self.seconds * 1000, 3),
+            "rows": self.rows,
+            "statements": dict(self.statements),
+        }
+
+
+_query_stats = ContextVar("query_stats", default=None)
+
+
+# Lekérdezésenként a futó QueryStats-ba jegyez (ha van); mérés nélkül csak a RealDictCursor
+class InstrumentedCursor(RealDictCursor):
+    def execute(self, query, vars=None):
+        stats = _query_stats.get()
+        if stats is None:
+            return super().execute(query, vars)
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            stats.record(query, time.perf_counter() - start)
+
+    def executemany(self, query, vars_list):
+        stats = _query_stats.get()
+        if stats is None:
+            return super().executemany(query, vars_list)
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            stats.record(query, time.perf_counter() - start)
+
+    def copy_expert(self, sql, file, size=8192):
+        stats = _query_stats.get()
+        if stats is None:
+            return super().copy_expert(sql, file, size)
+        start = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            stats.record(sql, time.perf_counter() - start)
+
+    def fetchone(self):
+        stats = _query_stats.get()
+        if stats is None:
+            return super().fetchone()
+        start = time.perf_counter()
+        row = super().fetchone()
+        stats.fetched(0 if row is None else 1, time.perf_counter() - start)
+        return row
+
+    def fetchmany(self, size=None):
+        stats = _query_stats.get()
+        if stats is None:
+            return super().fetchmany(size)
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        stats.fetched(len(rows), time.perf_counter() - start)
+        return rows
+
+    def fetchall(self):
+        stats = _query_stats.get()
+        if stats is None:
+            return super().fetchall()
+        start = time.perf_counter()
+        rows = super().fetchall()
+        stats.fetched(len(rows), time.perf_counter() - start)
+        return rows
+
+    # Nevesített kurzor bejárása: a sorok darabonként (itersize) érkeznek a szerverről
+    def __iter__(self):
+        rows = super().__iter__()
+        while True:
+            stats = _query_stats.get()
+            start = time.perf_counter()
+            try:
+                row = next(rows)
+            except StopIteration:
+                return
+            if stats is not None:
+                stats.fetched(1, time.perf_counter() - start)
+            yield row
+
+
+# Mérés egy kódblokkra (tesztek, szkriptek, benchmarkok): a blokk lekérdezései a visszaadott
+# QueryStats-ba kerülnek, a blokkban kiszolgált kéréseké is.
+@contextmanager
+def track_queries():
+    stats = QueryStats()
+    token = _query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _query_stats.reset(token)
+
+
+def current_query_stats():
+    return _query_stats.get()
+
+
+# Más kurzorok (pl. tesztbeli helyettesítők) is jelenthetnek a futó mérésbe
+def record_query(statement, seconds=0.0):
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.record(statement, seconds)
+
+
+def record_rows(rows, seconds=0.0):
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.fetched(rows, seconds)
+
+
+def _connect():
     return psycopg2.connect(
         **DB_CONFIG,
-        cursor_factory=RealDictCursor
+        cursor_factory=InstrumentedCursor
     )
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_scoped_connection = ContextVar("scoped_connection", default=None)
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(_connect, **DB_POOL)
+    return _pool
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+# A kérés (vagy ütemezett feladat) saját kapcsolatának lekérése a készletből
+def get_connection():
+    if has_app_context():
+        conn = g.get("_db_conn")
+        if conn is None:
+            owner = f"{request.method} {request.path}" if has_request_context() else "app context"
+            conn = g._db_conn = get_pool().getconn(owner)
+        return conn
+
+    conn = _scoped_connection.get()
+    if conn is None:
+        raise RuntimeError("get_connection() called outside of an app context or connection_scope()")
+    return conn
+
+
+# A kérés végén a kapcsolat visszaadása a készletbe
+def release_connection(exc=None):
+    conn = g.pop("_db_conn", None)
+    if conn is not None:
+        get_pool().putconn(conn)
+
+
+# Folyamként küldött válaszokhoz: a kérés kapcsolata kikerül a kérés-kontextusból, így a kérés végén
+# nem kerül vissza a készletbe; a hívó adja vissza (return_connection) a folyam lezárásakor.
+def detach_connection():
+    return g.pop("_db_conn", None) if has_app_context() else None
+
+
+def return_connection(conn):
+    get_pool().putconn(conn)
+
+
+# Flask alkalmazáson kívüli kód (szkriptek, háttérszálak, benchmarkok) kapcsolat-hatóköre.
+# Ha már van aktív hatókör (pl. egy kérésen belül), annak kapcsolatát használja.
+@contextmanager
+def connection_scope(owner="connection_scope"):
+    if has_app_context() or _scoped_connection.get() is not None:
+        yield get_connection()
+        return
+
+    pool = get_pool()
+    conn = pool.getconn(owner)
+    token = _scoped_connection.set(conn)
+    try:
+        yield conn
+    finally:
+        _scoped_connection.reset(token)
+        pool.putconn(conn)
+
+
+# Kérésenkénti lekérdezés-mérés: Server-Timing fejléc és N+1 figyelmeztetés.
+# Folyamként küldött válasznál csak a válasz elkészültéig futott lekérdezések számítanak.
+# Ha a kérés egy már futó mérésen belül indul (track_queries, pl. tesztben), abba számol tovább.
+def _start_query_stats():
+    if _query_stats.get() is None:
+        g._query_stats_token = _query_stats.set(QueryStats())
+
+
+def _report_query_stats(response):
+    stats = _query_stats.get()
+    if stats is None:
+        return response
+    response.headers.add("Server-Timing", stats.server_timing())
+    threshold = current_app.config.get("QUERY_REPEAT_WARN", QUERY_REPEAT_WARN)
+    for statement, count in stats.repeated(threshold):
+        log.warning("Repeated query in %s %s: %d× %s", request.method, request.path, count, statement[:200])
+    return response
+
+
+def _stop_query_stats(exc=None):
+    token = g.pop("_query_stats_token", None)
+    if token is not None:
+        _query_stats.reset(token)
+
+
+def init_app(app):
+    app.before_request(_start_query_stats)
+    app.after_request(_report_query_stats)
+    app.teardown_request(_stop_query_stats)
+    app.teardown_appcontext(release_connection)
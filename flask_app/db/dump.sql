@@ -18,6 +18,99 @@ SET xmloption = content;
 SET client_min_messages = warning;
 SET row_security = off;
 
+--
+-- Name: invalidate_schedule_plans(); Type: FUNCTION; Schema: public; Owner: postgres
+--
+
+CREATE FUNCTION public.invalidate_schedule_plans() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    UPDATE public.schedules
+    SET required_blocks = NULL, plan = NULL
+    WHERE line_name = NEW.name;
+    RETURN NEW;
+END;
+$$;
+
+
+ALTER FUNCTION public.invalidate_schedule_plans() OWNER TO postgres;
+
+--
+-- Name: notify_active_schedules(); Type: FUNCTION; Schema: public; Owner: postgres
+--
+
+CREATE FUNCTION public.notify_active_schedules() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        IF EXISTS (SELECT 1 FROM new_rows WHERE status = 'active') THEN
+            PERFORM pg_notify('bkv_table_versions', 'active_schedules');
+        END IF;
+    ELSIF TG_OP = 'DELETE' THEN
+        IF EXISTS (SELECT 1 FROM old_rows WHERE status = 'active') THEN
+            PERFORM pg_notify('bkv_table_versions', 'active_schedules');
+        END IF;
+    ELSIF EXISTS (SELECT 1 FROM new_rows WHERE status = 'active')
+          OR EXISTS (SELECT 1 FROM old_rows WHERE status = 'active') THEN
+        PERFORM pg_notify('bkv_table_versions', 'active_schedules');
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+
+ALTER FUNCTION public.notify_active_schedules() OWNER TO postgres;
+
+--
+-- Name: notify_fleet_versions(); Type: FUNCTION; Schema: public; Owner: postgres
+--
+
+CREATE FUNCTION public.notify_fleet_versions() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'bus_km_events' THEN
+        PERFORM pg_notify('bkv_table_versions', 'fleet:' || o.owner)
+        FROM (SELECT DISTINCT COALESCE(b.owner, '') AS owner FROM new_rows n JOIN bus b ON b.plate = n.bus_plate) o;
+    ELSIF TG_OP = 'INSERT' THEN
+        PERFORM pg_notify('bkv_table_versions', 'fleet:' || o.owner)
+        FROM (SELECT DISTINCT COALESCE(owner, '') AS owner FROM new_rows) o;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('bkv_table_versions', 'fleet:' || o.owner)
+        FROM (SELECT DISTINCT COALESCE(owner, '') AS owner FROM old_rows) o;
+    ELSE
+        PERFORM pg_notify('bkv_table_versions', 'fleet:' || o.owner)
+        FROM (SELECT COALESCE(owner, '') AS owner FROM new_rows
+              UNION SELECT COALESCE(owner, '') FROM old_rows) o;
+    END IF;
+    IF FOUND THEN
+        PERFORM pg_notify('bkv_table_versions', 'fleet');
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+
+ALTER FUNCTION public.notify_fleet_versions() OWNER TO postgres;
+
+--
+-- Name: notify_table_version(); Type: FUNCTION; Schema: public; Owner: postgres
+--
+
+CREATE FUNCTION public.notify_table_version() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    PERFORM pg_notify('bkv_table_versions', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$;
+
+
+ALTER FUNCTION public.notify_table_version() OWNER TO postgres;
+
 SET default_tablespace = '';
 
 SET default_table_access_method = heap;
@@ -42,6 +135,18 @@ CREATE TABLE public.bus (
 
 ALTER TABLE public.bus OWNER TO postgres;
 
+--
+-- Name: bus_km_events; Type: TABLE; Schema: public; Owner: postgres
+--
+
+CREATE TABLE public.bus_km_events (
+    bus_plate character varying(20) NOT NULL,
+    km integer NOT NULL
+);
+
+
+ALTER TABLE public.bus_km_events OWNER TO postgres;
+
 --
 -- Name: garages; Type: TABLE; Schema: public; Owner: postgres
 --
@@ -87,12 +192,32 @@ CREATE TABLE public.issues (
     "time" character varying,
     repair_time interval,
     repair_cost integer,
-    description text
+    description text,
+    reported_at timestamp without time zone
 );
 
 
 ALTER TABLE public.issues OWNER TO postgres;
 
+--
+-- Name: issues_archive; Type: TABLE; Schema: public; Owner: postgres
+--
+
+CREATE TABLE public.issues_archive (
+    id integer NOT NULL,
+    bus character varying(20),
+    "time" character varying,
+    reported_at timestamp without time zone,
+    repair_time interval,
+    repair_cost integer,
+    description text,
+    resolved_at timestamp without time zone NOT NULL
+)
+PARTITION BY RANGE (resolved_at);
+
+
+ALTER TABLE public.issues_archive OWNER TO postgres;
+
 --
 -- Name: lines; Type: TABLE; Schema: public; Owner: postgres
 --
@@ -169,6 +294,21 @@ ALTER TABLE public.muszaki_hiba_id_seq OWNER TO postgres;
 ALTER SEQUENCE public.muszaki_hiba_id_seq OWNED BY public.issues.id;
 
 
+--
+-- Name: payout_ticks; Type: TABLE; Schema: public; Owner: postgres
+--
+
+CREATE TABLE public.payout_ticks (
+    pay_date date NOT NULL,
+    frame text NOT NULL,
+    tick_idx integer NOT NULL,
+    tick_at timestamp without time zone NOT NULL,
+    paid_at timestamp without time zone DEFAULT now() NOT NULL
+);
+
+
+ALTER TABLE public.payout_ticks OWNER TO postgres;
+
 --
 -- Name: schedule_assignments; Type: TABLE; Schema: public; Owner: postgres
 --
@@ -197,6 +337,8 @@ CREATE TABLE public.schedules (
     bid_price integer DEFAULT 0,
     status text DEFAULT 'pending'::text,
     frame text,
+    required_blocks integer,
+    plan jsonb,
     CONSTRAINT schedules_frame_check CHECK ((frame = ANY (ARRAY['morning'::text, 'midday'::text, 'afternoon'::text, 'evening'::text, 'night'::text])))
 );
 
@@ -225,6 +367,19 @@ ALTER TABLE public.schedules_id_seq OWNER TO postgres;
 ALTER SEQUENCE public.schedules_id_seq OWNED BY public.schedules.id;
 
 
+--
+-- Name: schema_migrations; Type: TABLE; Schema: public; Owner: postgres
+--
+
+CREATE TABLE public.schema_migrations (
+    version integer NOT NULL,
+    name text NOT NULL,
+    applied_at timestamp without time zone DEFAULT now() NOT NULL
+);
+
+
+ALTER TABLE public.schema_migrations OWNER TO postgres;
+
 --
 -- Name: user_garages; Type: TABLE; Schema: public; Owner: postgres
 --
@@ -305,6 +460,14 @@ LOV-881	VanHool AG300	2222922	1991	2	Kocka	Service	-	testuser	t
 \.
 
 
+--
+-- Data for Name: bus_km_events; Type: TABLE DATA; Schema: public; Owner: postgres
+--
+
+COPY public.bus_km_events (bus_plate, km) FROM stdin;
+\.
+
+
 --
 -- Data for Name: garages; Type: TABLE DATA; Schema: public; Owner: postgres
 --
@@ -320,11 +483,11 @@ COPY public.garages (id, name, location) FROM stdin;
 -- Data for Name: issues; Type: TABLE DATA; Schema: public; Owner: postgres
 --
 
-COPY public.issues (id, bus, "time", repair_time, repair_cost, description) FROM stdin;
-27	FLA-420	2025.10.24 - 22:22:25	00:00:01	5000000	sad
-29	LOV-881	2025.11.03 - 19:55:58	00:00:23	412	hhh
-30	ASD-002	2025.11.08 - 17:32:25	00:00:00	1000	ijj
-36	SVA-793	2025.11.23 - 16:20:54	00:00:00	100	test
+COPY public.issues (id, bus, "time", repair_time, repair_cost, description, reported_at) FROM stdin;
+27	FLA-420	2025.10.24 - 22:22:25	00:00:01	5000000	sad	2025-10-24 22:22:25
+29	LOV-881	2025.11.03 - 19:55:58	00:00:23	412	hhh	2025-11-03 19:55:58
+30	ASD-002	2025.11.08 - 17:32:25	00:00:00	1000	ijj	2025-11-08 17:32:25
+36	SVA-793	2025.11.23 - 16:20:54	00:00:00	100	test	2025-11-23 16:20:54
 \.
 
 
@@ -359,6 +522,14 @@ COPY public.market_listings (id, bus_plate, seller_username, price, status, crea
 \.
 
 
+--
+-- Data for Name: payout_ticks; Type: TABLE DATA; Schema: public; Owner: postgres
+--
+
+COPY public.payout_ticks (pay_date, frame, tick_idx, tick_at, paid_at) FROM stdin;
+\.
+
+
 --
 -- Data for Name: schedule_assignments; Type: TABLE DATA; Schema: public; Owner: postgres
 --
@@ -378,10 +549,28 @@ COPY public.schedule_assignments (schedule_id, block_idx, bus_plate) FROM stdin;
 -- Data for Name: schedules; Type: TABLE DATA; Schema: public; Owner: postgres
 --
 
-COPY public.schedules (id, username, line_name, garage_id, start_time, end_time, frequency, bid_price, status, frame) FROM stdin;
-67	testuser2	7E	2	20:00:00	24:00:00	40	14422	active	night
-66	testuser	7E	2	16:00:00	20:00:00	40	15000	active	evening
-59	testuser	106	1	20:00:00	24:00:00	30	15000	active	night
+COPY public.schedules (id, username, line_name, garage_id, start_time, end_time, frequency, bid_price, status, frame, required_blocks, plan) FROM stdin;
+67	testuser2	7E	2	20:00:00	24:00:00	40	14422	active	night	\N	\N
+66	testuser	7E	2	16:00:00	20:00:00	40	15000	active	evening	\N	\N
+59	testuser	106	1	20:00:00	24:00:00	30	15000	active	night	\N	\N
+\.
+
+
+--
+-- Data for Name: schema_migrations; Type: TABLE DATA; Schema: public; Owner: postgres
+--
+
+COPY public.schema_migrations (version, name, applied_at) FROM stdin;
+1	baseline schema	2026-10-18 12:00:00
+2	payout tick ledger	2026-10-18 12:00:00
+3	stored schedule plans	2026-10-18 12:00:00
+4	hot query indexes	2026-10-18 12:00:00
+5	market pagination indexes	2026-10-18 12:00:00
+6	issue history and archive	2026-10-18 12:00:00
+7	bus km events	2026-10-18 12:00:00
+8	fleet version notifications	2026-10-18 12:00:00
+9	table version notifications	2026-10-18 12:00:00
+10	active schedule notifications	2026-10-18 12:00:00
 \.
 
 
@@ -476,6 +665,22 @@ ALTER TABLE ONLY public.issues
     ADD CONSTRAINT muszaki_hiba_pkey PRIMARY KEY (id);
 
 
+--
+-- Name: issues_archive issues_archive_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.issues_archive
+    ADD CONSTRAINT issues_archive_pkey PRIMARY KEY (id, resolved_at);
+
+
+--
+-- Name: payout_ticks payout_ticks_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.payout_ticks
+    ADD CONSTRAINT payout_ticks_pkey PRIMARY KEY (pay_date, frame, tick_idx);
+
+
 --
 -- Name: schedule_assignments schedule_assignments_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
 --
@@ -492,6 +697,14 @@ ALTER TABLE ONLY public.schedules
     ADD CONSTRAINT schedules_pkey PRIMARY KEY (id);
 
 
+--
+-- Name: schema_migrations schema_migrations_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
+--
+
+ALTER TABLE ONLY public.schema_migrations
+    ADD CONSTRAINT schema_migrations_pkey PRIMARY KEY (version);
+
+
 --
 -- Name: user_garages user_garages_pkey; Type: CONSTRAINT; Schema: public; Owner: postgres
 --
@@ -508,6 +721,153 @@ ALTER TABLE ONLY public.users
     ADD CONSTRAINT users_pkey PRIMARY KEY (username);
 
 
+--
+-- Name: bus_km_events_bus_plate_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX bus_km_events_bus_plate_idx ON public.bus_km_events USING btree (bus_plate);
+
+
+--
+-- Name: bus_owner_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX bus_owner_idx ON public.bus USING btree (owner);
+
+
+--
+-- Name: bus_unowned_km_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX bus_unowned_km_idx ON public.bus USING btree (km, plate) WHERE (owner IS NULL);
+
+
+--
+-- Name: bus_unowned_price_km_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX bus_unowned_price_km_idx ON public.bus USING btree (COALESCE(km, 0), plate) WHERE (owner IS NULL);
+
+
+--
+-- Name: bus_unowned_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX bus_unowned_idx ON public.bus USING btree (plate) WHERE (owner IS NULL);
+
+
+--
+-- Name: bus_unowned_type_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX bus_unowned_type_idx ON public.bus USING btree (type, plate) WHERE (owner IS NULL);
+
+
+--
+-- Name: bus_unowned_year_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX bus_unowned_year_idx ON public.bus USING btree (year, plate) WHERE (owner IS NULL);
+
+
+--
+-- Name: issues_bus_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX issues_bus_idx ON public.issues USING btree (bus);
+
+
+--
+-- Name: issues_archive_bus_reported_at_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX issues_archive_bus_reported_at_idx ON ONLY public.issues_archive USING btree (bus, reported_at DESC NULLS LAST, id DESC);
+
+
+--
+-- Name: issues_archive_reported_at_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX issues_archive_reported_at_idx ON ONLY public.issues_archive USING btree (reported_at DESC NULLS LAST, id DESC);
+
+
+--
+-- Name: issues_bus_reported_at_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX issues_bus_reported_at_idx ON public.issues USING btree (bus, reported_at DESC NULLS LAST, id DESC);
+
+
+--
+-- Name: issues_reported_at_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX issues_reported_at_idx ON public.issues USING btree (reported_at DESC NULLS LAST, id DESC);
+
+
+--
+-- Name: market_listings_active_created_at_id_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX market_listings_active_created_at_id_idx ON public.market_listings USING btree (created_at, id) WHERE ((status)::text = 'active'::text);
+
+
+--
+-- Name: market_listings_active_price_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX market_listings_active_price_idx ON public.market_listings USING btree (price, id) WHERE ((status)::text = 'active'::text);
+
+
+--
+-- Name: market_listings_active_seller_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX market_listings_active_seller_idx ON public.market_listings USING btree (seller_username, created_at, id) WHERE ((status)::text = 'active'::text);
+
+
+--
+-- Name: market_listings_bus_plate_status_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX market_listings_bus_plate_status_idx ON public.market_listings USING btree (bus_plate, status);
+
+
+--
+-- Name: payout_ticks_tick_at_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX payout_ticks_tick_at_idx ON public.payout_ticks USING btree (tick_at);
+
+
+--
+-- Name: schedule_assignments_bus_plate_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX schedule_assignments_bus_plate_idx ON public.schedule_assignments USING btree (bus_plate);
+
+
+--
+-- Name: schedules_line_name_frame_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX schedules_line_name_frame_idx ON public.schedules USING btree (line_name, frame);
+
+
+--
+-- Name: schedules_status_frame_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX schedules_status_frame_idx ON public.schedules USING btree (status, frame);
+
+
+--
+-- Name: schedules_username_start_time_idx; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX schedules_username_start_time_idx ON public.schedules USING btree (username, start_time);
+
+
 --
 -- Name: uq_listing_active_bus; Type: INDEX; Schema: public; Owner: postgres
 --
@@ -515,6 +875,104 @@ ALTER TABLE ONLY public.users
 CREATE UNIQUE INDEX uq_listing_active_bus ON public.market_listings USING btree (bus_plate) WHERE ((status)::text = 'active'::text);
 
 
+--
+-- Name: bus bus_fleet_version_delete; Type: TRIGGER; Schema: public; Owner: postgres
+--
+
+CREATE TRIGGER bus_fleet_version_delete AFTER DELETE ON public.bus REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION public.notify_fleet_versions();
+
+
+--
+-- Name: bus bus_fleet_version_insert; Type: TRIGGER; Schema: public; Owner: postgres
+--
+
+CREATE TRIGGER bus_fleet_version_insert AFTER INSERT ON public.bus REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION public.notify_fleet_versions();
+
+
+--
+-- Name: bus bus_fleet_version_update; Type: TRIGGER; Schema: public; Owner: postgres
+--
+
+CREATE TRIGGER bus_fleet_version_update AFTER UPDATE ON public.bus REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION public.notify_fleet_versions();
+
+
+--
+-- Name: bus bus_table_version; Type: TRIGGER; Schema: public; Owner: postgres
+--
+
+CREATE TRIGGER bus_table_version AFTER INSERT OR DELETE OR UPDATE OR TRUNCATE ON public.bus FOR EACH STATEMENT EXECUTE FUNCTION public.notify_table_version();
+
+
+--
+-- Name: bus_km_events bus_km_events_fleet_version; Type: TRIGGER; Schema: public; Owner: postgres
+--
+
+CREATE TRIGGER bus_km_events_fleet_version AFTER INSERT ON public.bus_km_events REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION public.notify_fleet_versions();
+
+
+--
+-- Name: garages garages_table_version; Type: TRIGGER; Schema: public; Owner: postgres
+--
+
+CREATE TRIGGER garages_table_version AFTER INSERT OR DELETE OR UPDATE OR TRUNCATE ON public.garages FOR EACH STATEMENT EXECUTE FUNCTION public.notify_table_version();
+
+
+--
+-- Name: lines lines_invalidate_schedule_plans; Type: TRIGGER; Schema: public; Owner: postgres
+--
+
+CREATE TRIGGER lines_invalidate_schedule_plans AFTER UPDATE OF travel_time_garage, travel_time_line ON public.lines FOR EACH ROW WHEN (((old.travel_time_garage IS DISTINCT FROM new.travel_time_garage) OR (old.travel_time_line IS DISTINCT FROM new.travel_time_line))) EXECUTE FUNCTION public.invalidate_schedule_plans();
+
+
+--
+-- Name: lines lines_table_version; Type: TRIGGER; Schema: public; Owner: postgres
+--
+
+CREATE TRIGGER lines_table_version AFTER INSERT OR DELETE OR UPDATE OR TRUNCATE ON public.lines FOR EACH STATEMENT EXECUTE FUNCTION public.notify_table_version();
+
+
+--
+-- Name: market_listings market_listings_table_version; Type: TRIGGER; Schema: public; Owner: postgres
+--
+
+CREATE TRIGGER market_listings_table_version AFTER INSERT OR DELETE OR UPDATE OR TRUNCATE ON public.market_listings FOR EACH STATEMENT EXECUTE FUNCTION public.notify_table_version();
+
+
+--
+-- Name: schedules schedules_active_version_delete; Type: TRIGGER; Schema: public; Owner: postgres
+--
+
+CREATE TRIGGER schedules_active_version_delete AFTER DELETE ON public.schedules REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION public.notify_active_schedules();
+
+
+--
+-- Name: schedules schedules_active_version_insert; Type: TRIGGER; Schema: public; Owner: postgres
+--
+
+CREATE TRIGGER schedules_active_version_insert AFTER INSERT ON public.schedules REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION public.notify_active_schedules();
+
+
+--
+-- Name: schedules schedules_active_version_update; Type: TRIGGER; Schema: public; Owner: postgres
+--
+
+CREATE TRIGGER schedules_active_version_update AFTER UPDATE ON public.schedules REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION public.notify_active_schedules();
+
+
+--
+-- Name: schedules schedules_table_version; Type: TRIGGER; Schema: public; Owner: postgres
+--
+
+CREATE TRIGGER schedules_table_version AFTER INSERT OR DELETE OR UPDATE OR TRUNCATE ON public.schedules FOR EACH STATEMENT EXECUTE FUNCTION public.notify_table_version();
+
+
+--
+-- Name: user_garages user_garages_table_version; Type: TRIGGER; Schema: public; Owner: postgres
+--
+
+CREATE TRIGGER user_garages_table_version AFTER INSERT OR DELETE OR UPDATE OR TRUNCATE ON public.user_garages FOR EACH STATEMENT EXECUTE FUNCTION public.notify_table_version();
+
+
 --
 -- Name: bus busz_garazs_fkey; Type: FK CONSTRAINT; Schema: public; Owner: postgres
 --
@@ -0,0 +1,218 @@
+# Valós idejű események PostgreSQL LISTEN/NOTIFY csatornán.
+# A szolgáltatások a saját tranzakciójukban küldik az eseményeket (notify), így azok csak a commit után,
+# visszagörgetéskor pedig egyáltalán nem jutnak el a feliratkozókhoz. Folyamatonként egyetlen dedikált
+# (nem a készletből származó) kapcsolat figyel a csatornán, és osztja szét az eseményeket a feliratkozók
+# (SSE kliensek) sorai között.
+import json
+import logging
+import queue
+import select
+import threading
+
+import psycopg2
+from config import DB_CONFIG
+
+log = logging.getLogger(__name__)
+
+EVENT_CHANNEL = "bkv_events"
+SUBSCRIBER_QUEUE_SIZE = 100     # Ennyi kézbesítetlen esemény után a lassú kliens újraszinkronizálást kap
+LISTEN_POLL_SECONDS = 5.0       # A figyelő szál ilyen gyakran ellenőrzi a leállítási kérést
+RECONNECT_SECONDS = 2.0         # Megszakadt figyelő kapcsolat újranyitása előtti várakozás
+
+
+def _connect():
+    return psycopg2.connect(**DB_CONFIG)
+
+
+# Események küldése a tranzakción belül, egyetlen utasítással.
+# Minden esemény egy "type" kulcsot tartalmazó, kis méretű (8000 bájt alatti) szótár.
+def notify_all(cur, events):
+    payloads = [json.dumps(event, default=str) for event in events]
+    if payloads:
+        cur.execute("SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload", (EVENT_CHANNEL, payloads))
+
+
+def notify(cur, event_type, **data):
+    notify_all(cur, [{"type": event_type, **data}])
+
+
+# Egy kliens feliratkozása. A "username" kulcsú események csak az érintett felhasználóhoz jutnak el.
+class Subscription:
+    def __init__(self, broadcaster, username=None, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        self.username = username
+        self._broadcaster = broadcaster
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._resync = threading.Event()
+
+    def wants(self, event):
+        target = event.get("username")
+        return target is None or target == self.username
+
+    def offer(self, event):
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self._resync.set()
+            return False
+
+    # Következő esemény; None, ha a várakozási idő alatt nem érkezett semmi
+    def get(self, timeout=None):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    # Igaz, ha események vesztek el (túlcsordulás vagy újracsatlakozás), és a kliensnek újra kell töltenie
+    def needs_resync(self):
+        if not self._resync.is_set():
+            return False
+        self._resync.clear()
+        return True
+
+    def request_resync(self):
+        self._resync.set()
+
+    def close(self):
+        self._broadcaster.unsubscribe(self)
+
+
+# Egy csatorna figyelése dedikált kapcsolaton, háttérszálban; a megszakadt kapcsolatot újranyitja.
+# A beérkezett üzeneteket a leszármazott publish() metódusa dolgozza fel.
+class NotificationListener:
+    thread_name = "notification-listener"
+
+    def __init__(self, channel, connect=None, poll_seconds=LISTEN_POLL_SECONDS):
+        self.channel = channel
+        self.poll_seconds = poll_seconds
+        self._connect = connect or _connect
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._connected = False
+        self._counters = {"received": 0, "reconnects": 0}
+
+    def start(self):
+        with self._lock:
+            self._start_locked()
+
+    def _start_locked(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+            self._thread.start()
+
+    def publish(self, payload):
+        raise NotImplementedError
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        conn = None
+        lost = False
+        while not self._stop.is_set():
+            try:
+                if conn is None:
+                    conn = self._listen()
+                    if lost:
+                        # A kapcsolat nélküli időszak üzenetei elvesztek
+                        self._on_reconnect()
+                if select.select([conn], [], [], self.poll_seconds) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self.publish(conn.notifies.pop(0).payload)
+            except (psycopg2.Error, OSError) as e:
+                log.warning("Listener connection on %s lost: %s", self.channel, e)
+                self._close(conn)
+                conn = None
+                lost = True
+                with self._lock:
+                    self._connected = False
+                    self._counters["reconnects"] += 1
+                self._stop.wait(RECONNECT_SECONDS)
+        self._close(conn)
+        with self._lock:
+            self._connected = False
+
+    def _listen(self):
+        conn = self._connect()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {self.channel}")
+        with self._lock:
+            self._connected = True
+        return conn
+
+    def _on_reconnect(self):
+        pass
+
+    @staticmethod
+    def _close(conn):
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+class EventBroadcaster(NotificationListener):
+    thread_name = "event-listener"
+
+    def __init__(self, connect=None, channel=EVENT_CHANNEL, poll_seconds=LISTEN_POLL_SECONDS,
+                 queue_size=SUBSCRIBER_QUEUE_SIZE):
+        super().__init__(channel, connect, poll_seconds)
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._counters.update({"delivered": 0, "dropped": 0, "invalid": 0})
+
+    # A figyelő szál az első feliratkozáskor indul, így szkriptek és tesztek nem nyitnak kapcsolatot
+    def subscribe(self, username=None):
+        subscription = Subscription(self, username, self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+            self._start_locked()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    # Egy beérkezett NOTIFY üzenet szétosztása
+    def publish(self, payload):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            with self._lock:
+                self._counters["invalid"] += 1
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._counters["received"] += 1
+        for subscription in subscribers:
+            if not subscription.wants(event):
+                continue
+            delivered = subscription.offer(event)
+            with self._lock:
+                self._counters["delivered" if delivered else "dropped"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "listening": self._connected,
+                "listener_alive": bool(self._thread and self._thread.is_alive()),
+                **self._counters,
+            }
+
+    def _on_reconnect(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.request_resync()
+
+
+event_broadcaster = EventBroadcaster()
@@ -0,0 +1,85 @@
+import logging
+import threading
+
+import psycopg2
+from config import DB_CONFIG
+
+log = logging.getLogger(__name__)
+
+PAYOUT_LOCK_KEY = 7_204_117_001      # A kifizetési ütemező tanácsadó zárjának kulcsa
+LEADER_HEARTBEAT_SECONDS = 60        # Ilyen gyakran ellenőrzi/szerzi meg a vezető szerepet minden worker
+IDLE_SESSION_TIMEOUT_VERSION = 140000
+
+
+def _connect():
+    return psycopg2.connect(**DB_CONFIG)
+
+
+# Egyetlen vezető kiválasztása több folyamat közül PostgreSQL tanácsadó zárral.
+# A zár egy dedikált (nem a készletből származó) munkamenethez tartozik: ha a vezető
+# folyamat leáll, a munkamenet megszűnik, és egy másik worker a következő próbálkozáskor átveszi.
+class AdvisoryLockLeader:
+    def __init__(self, lock_key, on_elected=None, connect=None, heartbeat_seconds=LEADER_HEARTBEAT_SECONDS):
+        self.lock_key = lock_key
+        self.on_elected = on_elected
+        self.heartbeat_seconds = heartbeat_seconds
+        self._connect = connect or _connect
+        self._conn = None
+        self._leader = False
+        self._lock = threading.Lock()
+
+    def is_leader(self):
+        with self._lock:
+            elected = self._refresh()
+        if elected and self.on_elected:
+            self.on_elected()
+        return self._leader
+
+    def release(self):
+        with self._lock:
+            if self._conn is not None and self._leader:
+                try:
+                    with self._conn.cursor() as cur:
+                        cur.execute("SELECT pg_advisory_unlock(%s)", (self.lock_key,))
+                except psycopg2.Error:
+                    pass
+            self._reset()
+
+    # Visszatérési érték: igaz, ha ez a folyamat most lett vezető
+    def _refresh(self):
+        try:
+            if self._conn is None or self._conn.closed:
+                self._reset()
+                self._conn = self._connect()
+                self._conn.autocommit = True
+                # Ha a vezető lefagy, a szerver ennyi tétlenség után bontja a munkamenetét és a zárat.
+                # Az idle_session_timeout csak PostgreSQL 14-től létezik; régebbi szerveren elmarad.
+                if self._conn.server_version >= IDLE_SESSION_TIMEOUT_VERSION:
+                    with self._conn.cursor() as cur:
+                        cur.execute("SET idle_session_timeout = %s", (f"{self.heartbeat_seconds * 3}s",))
+
+            with self._conn.cursor() as cur:
+                if self._leader:
+                    cur.execute("SELECT 1")
+                    return False
+                cur.execute("SELECT pg_try_advisory_lock(%s)", (self.lock_key,))
+                acquired = bool(cur.fetchone()[0])
+        except psycopg2.Error as e:
+            if self._leader:
+                log.warning("Lost scheduler leadership: %s", e)
+            self._reset()
+            return False
+
+        if acquired:
+            self._leader = True
+            log.info("Acquired scheduler leadership (lock %s)", self.lock_key)
+        return acquired
+
+    def _reset(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+        self._conn = None
+        self._leader = False
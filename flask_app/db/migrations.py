@@ -0,0 +1,388 @@
+# Verziózott sémamigrációk.
+# Futtatás: cd flask_app && python -m db.migrations [status]
+# Minden migráció idempotens (IF NOT EXISTS), így a dump.sql-ből visszaállított adatbázison is
+# lefuttatható; a lefutott verziókat a schema_migrations tábla tartja nyilván.
+import sys
+
+MIGRATION_LOCK_KEY = 7_204_117_002   # Párhuzamosan induló workerek ne migráljanak egyszerre
+
+
+MIGRATIONS = [
+    (1, "baseline schema", """
+        CREATE TABLE IF NOT EXISTS users (
+            username character varying NOT NULL,
+            password character varying NOT NULL,
+            balance integer DEFAULT 50000 NOT NULL,
+            is_admin boolean,
+            CONSTRAINT users_pkey PRIMARY KEY (username)
+        );
+
+        CREATE SEQUENCE IF NOT EXISTS garazs_id_seq AS integer;
+        CREATE TABLE IF NOT EXISTS garages (
+            id integer DEFAULT nextval('garazs_id_seq') NOT NULL,
+            name character varying(50),
+            location character varying(100),
+            CONSTRAINT garazs_pkey PRIMARY KEY (id)
+        );
+        ALTER SEQUENCE garazs_id_seq OWNED BY garages.id;
+
+        CREATE TABLE IF NOT EXISTS user_garages (
+            username character varying NOT NULL,
+            garage_id integer NOT NULL,
+            CONSTRAINT user_garages_pkey PRIMARY KEY (username, garage_id),
+            CONSTRAINT user_garages_username_fkey FOREIGN KEY (username) REFERENCES users(username),
+            CONSTRAINT user_garages_garage_id_fkey FOREIGN KEY (garage_id) REFERENCES garages(id)
+        );
+
+        CREATE TABLE IF NOT EXISTS lines (
+            name character varying NOT NULL,
+            provider_garage_id integer,
+            travel_time_garage integer,
+            travel_time_line integer NOT NULL,
+            CONSTRAINT lines_pkey PRIMARY KEY (name),
+            CONSTRAINT lines_provider_garage_id_fkey FOREIGN KEY (provider_garage_id) REFERENCES garages(id)
+        );
+
+        CREATE TABLE IF NOT EXISTS bus (
+            plate character varying(20) NOT NULL,
+            type character varying(50),
+            km integer,
+            year integer,
+            garage integer,
+            description text,
+            status character varying(20),
+            line character varying(20),
+            owner character varying,
+            favourite boolean DEFAULT false NOT NULL,
+            CONSTRAINT busz_pkey PRIMARY KEY (plate),
+            CONSTRAINT busz_garazs_fkey FOREIGN KEY (garage) REFERENCES garages(id),
+            CONSTRAINT owner_user_fkey FOREIGN KEY (owner) REFERENCES users(username) MATCH FULL
+        );
+
+        CREATE SEQUENCE IF NOT EXISTS muszaki_hiba_id_seq AS integer;
+        CREATE TABLE IF NOT EXISTS issues (
+            id integer DEFAULT nextval('muszaki_hiba_id_seq') NOT NULL,
+            bus character varying(20),
+            "time" character varying,
+            repair_time interval,
+            repair_cost integer,
+            description text,
+            CONSTRAINT muszaki_hiba_pkey PRIMARY KEY (id),
+            CONSTRAINT muszaki_hiba_busz_fkey FOREIGN KEY (bus) REFERENCES bus(plate)
+        );
+        ALTER SEQUENCE muszaki_hiba_id_seq OWNED BY issues.id;
+
+        CREATE SEQUENCE IF NOT EXISTS market_listings_id_seq AS integer;
+        CREATE TABLE IF NOT EXISTS market_listings (
+            id integer DEFAULT nextval('market_listings_id_seq') NOT NULL,
+            bus_plate character varying(32) NOT NULL,
+            seller_username character varying(64) NOT NULL,
+            price integer NOT NULL,
+            status character varying(16) DEFAULT 'active' NOT NULL,
+            created_at timestamp without time zone DEFAULT now() NOT NULL,
+            sold_at timestamp without time zone,
+            CONSTRAINT market_listings_pkey PRIMARY KEY (id),
+            CONSTRAINT market_listings_price_check CHECK (price >= 0),
+            CONSTRAINT market_listings_bus_rendszam_fkey FOREIGN KEY (bus_plate) REFERENCES bus(plate) ON DELETE CASCADE,
+            CONSTRAINT market_listings_seller_username_fkey FOREIGN KEY (seller_username) REFERENCES users(username) ON DELETE CASCADE
+        );
+        ALTER SEQUENCE market_listings_id_seq OWNED BY market_listings.id;
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_listing_active_bus ON market_listings (bus_plate) WHERE status = 'active';
+
+        CREATE SEQUENCE IF NOT EXISTS schedules_id_seq AS integer;
+        CREATE TABLE IF NOT EXISTS schedules (
+            id integer DEFAULT nextval('schedules_id_seq') NOT NULL,
+            username character varying,
+            line_name character varying,
+            garage_id integer,
+            start_time time without time zone NOT NULL,
+            end_time time without time zone NOT NULL,
+            frequency integer NOT NULL,
+            bid_price integer DEFAULT 0,
+            status text DEFAULT 'pending',
+            frame text,
+            CONSTRAINT schedules_pkey PRIMARY KEY (id),
+            CONSTRAINT schedules_frame_check CHECK (frame = ANY (ARRAY['morning', 'midday', 'afternoon', 'evening', 'night'])),
+            CONSTRAINT schedules_garage_id_fkey FOREIGN KEY (garage_id) REFERENCES garages(id),
+            CONSTRAINT schedules_line_name_fkey FOREIGN KEY (line_name) REFERENCES lines(name),
+            CONSTRAINT schedules_username_fkey FOREIGN KEY (username) REFERENCES users(username)
+        );
+        ALTER SEQUENCE schedules_id_seq OWNED BY schedules.id;
+
+        CREATE TABLE IF NOT EXISTS schedule_assignments (
+            schedule_id integer NOT NULL,
+            block_idx integer NOT NULL,
+            bus_plate character varying,
+            CONSTRAINT schedule_assignments_pkey PRIMARY KEY (schedule_id, block_idx)
+        );
+    """),
+
+    (2, "payout tick ledger", """
+        CREATE TABLE IF NOT EXISTS payout_ticks (
+            pay_date date NOT NULL,
+            frame text NOT NULL,
+            tick_idx integer NOT NULL,
+            tick_at timestamp without time zone NOT NULL,
+            paid_at timestamp without time zone DEFAULT now() NOT NULL,
+            CONSTRAINT payout_ticks_pkey PRIMARY KEY (pay_date, frame, tick_idx)
+        );
+        CREATE INDEX IF NOT EXISTS payout_ticks_tick_at_idx ON payout_ticks (tick_at);
+    """),
+
+    (3, "stored schedule plans", """
+        ALTER TABLE schedules ADD COLUMN IF NOT EXISTS required_blocks integer;
+        ALTER TABLE schedules ADD COLUMN IF NOT EXISTS plan jsonb;
+
+        CREATE OR REPLACE FUNCTION invalidate_schedule_plans() RETURNS trigger
+            LANGUAGE plpgsql
+            AS $$
+        BEGIN
+            UPDATE schedules
+            SET required_blocks = NULL, plan = NULL
+            WHERE line_name = NEW.name;
+            RETURN NEW;
+        END;
+        $$;
+
+        DROP TRIGGER IF EXISTS lines_invalidate_schedule_plans ON lines;
+        CREATE TRIGGER lines_invalidate_schedule_plans
+            AFTER UPDATE OF travel_time_garage, travel_time_line ON lines
+            FOR EACH ROW
+            WHEN (OLD.travel_time_garage IS DISTINCT FROM NEW.travel_time_garage
+                  OR OLD.travel_time_line IS DISTINCT FROM NEW.travel_time_line)
+            EXECUTE FUNCTION invalidate_schedule_plans();
+    """),
+
+    # A schedule_assignments(schedule_id) kereséseket az elsődleges kulcs (schedule_id, block_idx) lefedi,
+    # a market_listings(bus_plate) aktív hirdetéseit pedig az uq_listing_active_bus részleges index.
+    (4, "hot query indexes", """
+        CREATE INDEX IF NOT EXISTS schedules_status_frame_idx ON schedules (status, frame);
+        CREATE INDEX IF NOT EXISTS schedules_line_name_frame_idx ON schedules (line_name, frame);
+        CREATE INDEX IF NOT EXISTS schedules_username_start_time_idx ON schedules (username, start_time);
+        CREATE INDEX IF NOT EXISTS schedule_assignments_bus_plate_idx ON schedule_assignments (bus_plate);
+        CREATE INDEX IF NOT EXISTS market_listings_active_created_at_idx ON market_listings (created_at DESC) WHERE status = 'active';
+        CREATE INDEX IF NOT EXISTS market_listings_bus_plate_status_idx ON market_listings (bus_plate, status);
+        CREATE INDEX IF NOT EXISTS issues_bus_idx ON issues (bus);
+        CREATE INDEX IF NOT EXISTS bus_owner_idx ON bus (owner);
+        CREATE INDEX IF NOT EXISTS bus_unowned_idx ON bus (plate) WHERE owner IS NULL;
+    """),
+
+    # Keyset lapozás a piacon: minden rendezési mezőhöz (érték, azonosító) index az aktív hirdetésekre
+    # és a gazdátlan buszokra
+    (5, "market pagination indexes", """
+        DROP INDEX IF EXISTS market_listings_active_created_at_idx;
+        CREATE INDEX IF NOT EXISTS market_listings_active_created_at_id_idx ON market_listings (created_at, id) WHERE status = 'active';
+        CREATE INDEX IF NOT EXISTS market_listings_active_price_idx ON market_listings (price, id) WHERE status = 'active';
+        CREATE INDEX IF NOT EXISTS market_listings_active_seller_idx ON market_listings (seller_username, created_at, id) WHERE status = 'active';
+        CREATE INDEX IF NOT EXISTS bus_unowned_type_idx ON bus (type, plate) WHERE owner IS NULL;
+        CREATE INDEX IF NOT EXISTS bus_unowned_year_idx ON bus (year, plate) WHERE owner IS NULL;
+        CREATE INDEX IF NOT EXISTS bus_unowned_km_idx ON bus (km, plate) WHERE owner IS NULL;
+        CREATE INDEX IF NOT EXISTS bus_unowned_price_km_idx ON bus ((COALESCE(km, 0)), plate) WHERE owner IS NULL;
+    """),
+
+    # Időszűrhető hibatörténet: a szöveges "time" mellé valódi időbélyeg kerül, a javított hibák pedig
+    # törlés helyett a havonta particionált archívumba költöznek (a partíciókat a hiba_service hozza létre)
+    (6, "issue history and archive", """
+        ALTER TABLE issues ADD COLUMN IF NOT EXISTS reported_at timestamp without time zone;
+        UPDATE issues
+        SET reported_at = to_timestamp("time", 'YYYY.MM.DD - HH24:MI:SS')::timestamp
+        WHERE reported_at IS NULL AND "time" ~ '^[0-9]{4}\\.[0-9]{2}\\.[0-9]{2} - [0-9]{2}:[0-9]{2}:[0-9]{2}$';
+        CREATE INDEX IF NOT EXISTS issues_reported_at_idx ON issues (reported_at DESC NULLS LAST, id DESC);
+        CREATE INDEX IF NOT EXISTS issues_bus_reported_at_idx ON issues (bus, reported_at DESC NULLS LAST, id DESC);
+
+        CREATE TABLE IF NOT EXISTS issues_archive (
+            id integer NOT NULL,
+            bus character varying(20),
+            "time" character varying,
+            reported_at timestamp without time zone,
+            repair_time interval,
+            repair_cost integer,
+            description text,
+            resolved_at timestamp without time zone NOT NULL,
+            CONSTRAINT issues_archive_pkey PRIMARY KEY (id, resolved_at)
+        ) PARTITION BY RANGE (resolved_at);
+        CREATE INDEX IF NOT EXISTS issues_archive_reported_at_idx ON issues_archive (reported_at DESC NULLS LAST, id DESC);
+        CREATE INDEX IF NOT EXISTS issues_archive_bus_reported_at_idx ON issues_archive (bus, reported_at DESC NULLS LAST, id DESC);
+    """),
+
+    # Kilométeróra-növekmények naplója: a kifizetés csak hozzáfűz, a bus.km-be kötegekben kerülnek át
+    (7, "bus km events", """
+        CREATE TABLE IF NOT EXISTS bus_km_events (
+            bus_plate character varying(20) NOT NULL,
+            km integer NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS bus_km_events_bus_plate_idx ON bus_km_events (bus_plate);
+    """),
+
+    # Tulajdonosonkénti flottaverzió a /buszok feltételes lekéréséhez (ETag), sorzár nélkül: minden, a buszokat
+    # vagy a megjelenített km-et módosító utasítás után értesítés a táblaverziók csatornáján tulajdonosonként
+    # ("fleet:<tulajdonos>", a gazdátlan buszoké "fleet:") és összesítve ("fleet"). A számlálót a folyamat
+    # figyelője (db/versions.py) vezeti, így a vásárlások és a km-frissítések nem állnak sorba egy verziósoron.
+    (8, "fleet version notifications", """
+        CREATE OR REPLACE FUNCTION notify_fleet_versions() RETURNS trigger
+            LANGUAGE plpgsql
+            AS $$
+        BEGIN
+            IF TG_TABLE_NAME = 'bus_km_events' THEN
+                PERFORM pg_notify('bkv_table_versions', 'fleet:' || o.owner)
+                FROM (SELECT DISTINCT COALESCE(b.owner, '') AS owner FROM new_rows n JOIN bus b ON b.plate = n.bus_plate) o;
+            ELSIF TG_OP = 'INSERT' THEN
+                PERFORM pg_notify('bkv_table_versions', 'fleet:' || o.owner)
+                FROM (SELECT DISTINCT COALESCE(owner, '') AS owner FROM new_rows) o;
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM pg_notify('bkv_table_versions', 'fleet:' || o.owner)
+                FROM (SELECT DISTINCT COALESCE(owner, '') AS owner FROM old_rows) o;
+            ELSE
+                PERFORM pg_notify('bkv_table_versions', 'fleet:' || o.owner)
+                FROM (SELECT COALESCE(owner, '') AS owner FROM new_rows
+                      UNION SELECT COALESCE(owner, '') FROM old_rows) o;
+            END IF;
+            IF FOUND THEN
+                PERFORM pg_notify('bkv_table_versions', 'fleet');
+            END IF;
+            RETURN NULL;
+        END;
+        $$;
+
+        DROP TRIGGER IF EXISTS bus_fleet_version_insert ON bus;
+        CREATE TRIGGER bus_fleet_version_insert AFTER INSERT ON bus
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_fleet_versions();
+        DROP TRIGGER IF EXISTS bus_fleet_version_update ON bus;
+        CREATE TRIGGER bus_fleet_version_update AFTER UPDATE ON bus
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_fleet_versions();
+        DROP TRIGGER IF EXISTS bus_fleet_version_delete ON bus;
+        CREATE TRIGGER bus_fleet_version_delete AFTER DELETE ON bus
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_fleet_versions();
+        DROP TRIGGER IF EXISTS bus_km_events_fleet_version ON bus_km_events;
+        CREATE TRIGGER bus_km_events_fleet_version AFTER INSERT ON bus_km_events
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_fleet_versions();
+    """),
+
+    # Táblaverzió-értesítések a feltételes GET-ekhez (db/versions.py): minden módosító utasítás után a tábla
+    # neve a bkv_table_versions csatornára kerül. A NOTIFY commitkor, tranzakciónként egyszer kézbesül.
+    (9, "table version notifications", """
+        CREATE OR REPLACE FUNCTION notify_table_version() RETURNS trigger
+            LANGUAGE plpgsql
+            AS $$
+        BEGIN
+            PERFORM pg_notify('bkv_table_versions', TG_TABLE_NAME);
+            RETURN NULL;
+        END;
+        $$;
+
+        DROP TRIGGER IF EXISTS bus_table_version ON bus;
+        CREATE TRIGGER bus_table_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON bus
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_table_version();
+        DROP TRIGGER IF EXISTS garages_table_version ON garages;
+        CREATE TRIGGER garages_table_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON garages
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_table_version();
+        DROP TRIGGER IF EXISTS lines_table_version ON lines;
+        CREATE TRIGGER lines_table_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON lines
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_table_version();
+        DROP TRIGGER IF EXISTS market_listings_table_version ON market_listings;
+        CREATE TRIGGER market_listings_table_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON market_listings
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_table_version();
+        DROP TRIGGER IF EXISTS schedules_table_version ON schedules;
+        CREATE TRIGGER schedules_table_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON schedules
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_table_version();
+        DROP TRIGGER IF EXISTS user_garages_table_version ON user_garages;
+        CREATE TRIGGER user_garages_table_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON user_garages
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_table_version();
+    """),
+    # Az aktív (nyertes) menetrendek külön verziója a /lines/winners pillanatképéhez: csak akkor értesít,
+    # ha az utasítás aktív sort érintett (előtte vagy utána), a licitek és vesztes státuszok nem számítanak.
+    (10, "active schedule notifications", """
+        CREATE OR REPLACE FUNCTION notify_active_schedules() RETURNS trigger
+            LANGUAGE plpgsql
+            AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                IF EXISTS (SELECT 1 FROM new_rows WHERE status = 'active') THEN
+                    PERFORM pg_notify('bkv_table_versions', 'active_schedules');
+                END IF;
+            ELSIF TG_OP = 'DELETE' THEN
+                IF EXISTS (SELECT 1 FROM old_rows WHERE status = 'active') THEN
+                    PERFORM pg_notify('bkv_table_versions', 'active_schedules');
+                END IF;
+            ELSIF EXISTS (SELECT 1 FROM new_rows WHERE status = 'active')
+                  OR EXISTS (SELECT 1 FROM old_rows WHERE status = 'active') THEN
+                PERFORM pg_notify('bkv_table_versions', 'active_schedules');
+            END IF;
+            RETURN NULL;
+        END;
+        $$;
+
+        DROP TRIGGER IF EXISTS schedules_active_version_insert ON schedules;
+        CREATE TRIGGER schedules_active_version_insert AFTER INSERT ON schedules
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_active_schedules();
+        DROP TRIGGER IF EXISTS schedules_active_version_update ON schedules;
+        CREATE TRIGGER schedules_active_version_update AFTER UPDATE ON schedules
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_active_schedules();
+        DROP TRIGGER IF EXISTS schedules_active_version_delete ON schedules;
+        CREATE TRIGGER schedules_active_version_delete AFTER DELETE ON schedules
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_active_schedules();
+    """),
+]
+
+
+def _ensure_version_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version integer PRIMARY KEY,
+            name text NOT NULL,
+            applied_at timestamp without time zone DEFAULT now() NOT NULL
+        )
+    """)
+
+
+def applied_versions(conn):
+    with conn.cursor() as cur:
+        _ensure_version_table(cur)
+        cur.execute("SELECT version FROM schema_migrations ORDER BY version")
+        versions = [row["version"] for row in cur.fetchall()]
+    conn.commit()
+    return versions
+
+
+# A még le nem futott migrációk alkalmazása egyetlen tranzakcióban
+def migrate(conn, target=None):
+    applied = []
+    with conn.cursor() as cur:
+        _ensure_version_table(cur)
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+        cur.execute("SELECT version FROM schema_migrations")
+        done = {row["version"] for row in cur.fetchall()}
+
+        for version, name, sql in MIGRATIONS:
+            if version in done or (target is not None and version > target):
+                continue
+            cur.execute(sql)
+            cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+            applied.append(version)
+    conn.commit()
+    return applied
+
+
+def main(argv):
+    from db.connection import connection_scope
+
+    with connection_scope("migrations") as conn:
+        if argv[1:2] == ["status"]:
+            done = set(applied_versions(conn))
+            for version, name, _ in MIGRATIONS:
+                print(f"{version:>3} {'applied' if version in done else 'pending':<8} {name}")
+            return
+
+        applied = migrate(conn)
+        print(f"Applied migrations: {applied}" if applied else "Schema is up to date")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
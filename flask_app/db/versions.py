@@ -0,0 +1,106 @@
+# Táblánkénti verziószámlálók a feltételes GET-ekhez.
+# A migráció utasításszintű triggerei minden módosító utasítás után a tábla nevét küldik a csatornára.
+# A NOTIFY csak a commit után, tranzakciónként és táblánként egyszer érkezik meg, sorzárat nem igényel.
+# Folyamatonként egy figyelő számlál, így a 304-es válaszhoz nem kell adatbázis-kapcsolat.
+# A számlálók csak a figyelő kapcsolat élettartamára érvényesek: minden (újra)kapcsolódás új korszakot
+# (epoch) kezd, kapcsolat nélkül pedig nincs verzió, ilyenkor a végpontok feltétel nélkül válaszolnak.
+import secrets
+import threading
+
+from db.events import LISTEN_POLL_SECONDS, NotificationListener
+
+VERSION_CHANNEL = "bkv_table_versions"
+
+
+class TableVersions(NotificationListener):
+    thread_name = "table-versions"
+
+    def __init__(self, connect=None, channel=VERSION_CHANNEL, poll_seconds=LISTEN_POLL_SECONDS):
+        super().__init__(channel, connect, poll_seconds)
+        self._versions = {}
+        self._epoch = None
+
+    def publish(self, payload):
+        with self._lock:
+            self._versions[payload] = self._versions.get(payload, 0) + 1
+            self._counters["received"] += 1
+
+    # A táblák aktuális verziói a korszakkal együtt; None, ha a változások most nem követhetők
+    def current(self, tables):
+        with self._lock:
+            if not self._connected:
+                return None
+            return (self._epoch, *(self._versions.get(table, 0) for table in tables))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "listening": self._connected,
+                "listener_alive": bool(self._thread and self._thread.is_alive()),
+                "epoch": self._epoch,
+                "versions": dict(self._versions),
+                **self._counters,
+            }
+
+    # Az új korszak még a LISTEN előtt, kapcsolat nélküli állapotban kezdődik
+    def _listen(self):
+        with self._lock:
+            self._epoch = secrets.token_hex(4)
+        return super()._listen()
+
+
+table_versions = TableVersions()
+
+
+# Táblaverziókhoz kötött, folyamaton belüli gyorsítótár: az érték (_build) akkor épül újra, ha a
+# táblák verziója a legutóbbi építés óta változott. A verziót az építés előtt olvassa, így a közben
+# érkező változás a következő kérésnél újraépít. Amíg a verziók nem követhetők, minden kérés
+# közvetlenül épít (bypass), tárolás nélkül. A tárolt érték közös, a hívók nem módosíthatják.
+class VersionedCache:
+    def __init__(self, tables, versions=table_versions):
+        self.tables = tuple(tables)
+        self._versions = versions
+        self._value = None
+        self._loaded_version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.loads = 0
+
+    def value(self):
+        version = self._versions.current(self.tables)
+        with self._lock:
+            if version is not None and version == self._loaded_version:
+                self.hits += 1
+                return self._value
+            if version is None:
+                self.bypasses += 1
+            else:
+                self.misses += 1
+
+        value = self._build()
+        with self._lock:
+            self.loads += 1
+            if version is not None:
+                self._value = value
+                self._loaded_version = version
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_version = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.bypasses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypasses": self.bypasses,
+                "loads": self.loads,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            }
+
+    def _build(self):
+        raise NotImplementedError
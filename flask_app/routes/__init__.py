@@ -5,6 +5,8 @@ from .muszaki_hiba import hiba_bp
 from .user import user_bp
 from .market import market_bp
 from .schedules import schedule_bp
+from .events import events_bp
+from .bootstrap import bootstrap_bp
 
 def register_routes(app):
     app.register_blueprint(busz_bp)
@@ -14,4 +16,6 @@ def register_routes(app):
     app.register_blueprint(user_bp)
     app.register_blueprint(market_bp)
     app.register_blueprint(schedule_bp)
+    app.register_blueprint(events_bp)
+    app.register_blueprint(bootstrap_bp)
 
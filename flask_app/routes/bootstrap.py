@@ -0,0 +1,21 @@
+from flask import Blueprint, session
+from services.bootstrap_service import market_bootstrap
+from utils.compression import compressed_json
+
+bootstrap_bp = Blueprint("bootstrap", __name__)
+
+# A piac oldal összes kezdőadata egy (tömörített) válaszban; a "session" rész a /session válaszával egyezik
+@bootstrap_bp.route("/bootstrap/market", methods=["GET"])
+def get_market_bootstrap():
+    if "username" in session:
+        state = market_bootstrap(session["username"], session.get("is_admin", False))
+        state["session"] = {
+            "logged_in": True,
+            "username": session["username"],
+            "is_admin": session.get("is_admin", False),
+            "balance": session["balance"]
+        }
+    else:
+        state = market_bootstrap()
+        state["session"] = {"logged_in": False}
+    return compressed_json(state)
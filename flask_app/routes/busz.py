@@ -1,8 +1,12 @@
 from flask import Blueprint, request, jsonify, session
+from db.versions import table_versions
 from services.busz_service import *
+from utils.conditional import make_etag, not_modified, with_etag
 
 busz_bp = Blueprint("busz", __name__)
 
+# Mezőválasztás (fields), szűrés (garage, status), lapozás (limit, cursor) és feltételes GET:
+# változatlan flotta esetén adatbázis nélkül 304 a válasz; követhetetlen verzióknál feltétel nélkül fut
 @busz_bp.route("/buszok", methods=["GET"])
 def get_buses():
     if "username" not in session:
@@ -10,8 +14,23 @@ def get_buses():
 
     username = session["username"]
     is_admin = session.get("is_admin", False)
-    buses = get_buses_for_user(username, is_admin)
-    return jsonify(buses)
+    versions = table_versions.current((fleet_version_key(username, is_admin),))
+    if versions is None:
+        return jsonify(list_buses(username, is_admin, request.args))
+    etag = make_etag("buszok", "*" if is_admin else username, *versions, request.query_string.decode())
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    return with_etag(jsonify(list_buses(username, is_admin, request.args)), etag)
+
+# Adminisztrátori flottabetöltés CSV vagy NDJSON törzzsel; ?on_conflict=skip|update
+@busz_bp.route("/buszok/import", methods=["POST"])
+def import_buses():
+    if "username" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+    if not session.get("is_admin", False):
+        return jsonify({"error": "Admin only"}), 403
+    return jsonify(import_fleet(request.stream, request.content_type, request.args.get("on_conflict", "skip")))
 
 @busz_bp.route("/busz", methods=["POST"])
 def post_bus():
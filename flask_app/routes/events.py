@@ -0,0 +1,45 @@
+import json
+from flask import Blueprint, Response, jsonify, session
+from db.events import event_broadcaster
+
+events_bp = Blueprint("events", __name__)
+
+KEEPALIVE_SECONDS = 15      # Üres megjegyzéssor ennyi csend után, hogy a proxyk ne bontsák a kapcsolatot
+RETRY_MILLISECONDS = 3000   # A böngésző ennyi idő múlva csatlakozik újra megszakadt folyam esetén
+
+
+def _format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+# Server-sent events folyam: piaci, nyertes- és egyenlegváltozások kis deltákként.
+# A generátor nem használ adatbázis-kapcsolatot, így a nyitott folyamok nem foglalnak a készletből.
+# Minden nyitott folyam egy kiszolgáló szálat foglal: szálas (vagy gevent) workerrel kell futtatni.
+@events_bp.route("/events", methods=["GET"])
+def stream_events():
+    if "username" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    username = session["username"]
+
+    # A feliratkozás a folyam első olvasásakor történik, így a soha el nem induló folyam
+    # (HEAD kérés, az első darab előtt bontó kliens) nem hagy maga után feliratkozót
+    def stream():
+        subscription = event_broadcaster.subscribe(username)
+        try:
+            yield f"retry: {RETRY_MILLISECONDS}\n\n"
+            while True:
+                event = subscription.get(timeout=KEEPALIVE_SECONDS)
+                if subscription.needs_resync():
+                    yield _format_event({"type": "resync"})
+                if event is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield _format_event(event)
+        finally:
+            subscription.close()
+
+    return Response(stream(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
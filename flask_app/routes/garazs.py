@@ -1,9 +1,11 @@
 from flask import Blueprint, jsonify, request, session
 from services.garage_service import list_garages_for_user, unlock_garage_for_user
+from utils.conditional import versioned
 
 garage_bp = Blueprint("garage", __name__)
 
 @garage_bp.route("/garages", methods=["GET"])
+@versioned("garages", "user_garages", per_user=True)
 def get_garages():
     if "username" not in session:
         return jsonify({"error": "Unauthorized"}), 401
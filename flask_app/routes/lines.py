@@ -1,13 +1,23 @@
 from flask import Blueprint, jsonify, request
 from services.line_service import *
+from utils.compression import compressed_json
+from utils.conditional import SHARED_CACHE_CONTROL, versioned
 
 lines_bp = Blueprint("lines", __name__)
 
 @lines_bp.route("/lines", methods=["GET"])
+@versioned("lines", cache_control=SHARED_CACHE_CONTROL)
 def get_lines():
     return jsonify(list_lines())
 
+# A vonalak oldal: vonalak, menetrendjeik és a nyertesek egy (tömörített) válaszban
+@lines_bp.route("/lines/overview", methods=["GET"])
+@versioned("lines", "schedules", "garages", cache_control=SHARED_CACHE_CONTROL)
+def get_lines_overview():
+    return compressed_json(lines_overview())
+
 @lines_bp.route("/lines/<string:name>", methods=["GET"])
+@versioned("lines", cache_control=SHARED_CACHE_CONTROL)
 def get_line_details(name):
     line = get_line(name)
     if not line:
@@ -1,11 +1,15 @@
 from flask import Blueprint, jsonify, request, session
 from services.market_service import *
+from utils.conditional import SHARED_CACHE_CONTROL, make_etag, not_modified, versioned, with_etag
 
 market_bp = Blueprint("market", __name__)
 
+MODELS_CACHE_CONTROL = "public, max-age=3600"
+
 @market_bp.route("/market", methods=["GET"])
+@versioned("bus", cache_control=SHARED_CACHE_CONTROL)
 def get_market():
-    return jsonify(list_market_buses())
+    return jsonify(list_market_buses(request.args))
 
 @market_bp.route("/market/buy", methods=["POST"])
 def buy_from_market():
@@ -17,7 +21,7 @@ def buy_from_market():
     if not rendszam:
         return jsonify({"error": "No bus specified"}), 400
 
-    result = buy_bus(rendszam, session["username"],data.get("price"))
+    result = buy_bus(rendszam, session["username"])
     if isinstance(result, tuple):
         data, status = result
         return jsonify(data), status
@@ -39,9 +43,15 @@ def sell_from_market():
         return jsonify(data), status
     return jsonify(result)
 
+# A modellek a kódban rögzítettek: az ETag a tartalomból képződik, adatbázis nélkül
 @market_bp.route("/market/models", methods=["GET"])
 def get_new_bus_models():
-    return jsonify(list_new_bus_models())
+    models = list_new_bus_models()
+    etag = make_etag("models", *(sorted(model.items()) for model in models))
+    cached = not_modified(etag, MODELS_CACHE_CONTROL)
+    if cached is not None:
+        return cached
+    return with_etag(jsonify(models), etag, MODELS_CACHE_CONTROL)
 
 @market_bp.route("/market/purchase-new", methods=["POST"])
 def post_purchase_new_bus():
@@ -55,8 +65,9 @@ def post_purchase_new_bus():
     return jsonify(result)
 
 @market_bp.route("/market/listings", methods=["GET"])
+@versioned("market_listings", "bus", cache_control=SHARED_CACHE_CONTROL)
 def get_market_listings():
-    return jsonify(list_active_listings())
+    return jsonify(list_active_listings(request.args))
 
 @market_bp.route("/market/list", methods=["POST"])
 def post_create_listing():
@@ -93,4 +104,28 @@ def post_cancel_listing():
     if isinstance(result, tuple):
         body, status = result
         return jsonify(body), status
-    return jsonify(result)
\ No newline at end of file
+    return jsonify(result)
+
+@market_bp.route("/market/buy-batch", methods=["POST"])
+def post_buy_batch():
+    if "username" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    data = request.get_json() or {}
+    body, status = buy_buses_batch(session["username"], data.get("items"))
+    return jsonify(body), status
+
+@market_bp.route("/market/list-batch", methods=["POST"])
+def post_list_batch():
+    if "username" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    data = request.get_json() or {}
+    body, status = create_listings_batch(session["username"], data.get("items"))
+    return jsonify(body), status
+
+@market_bp.route("/market/purchase-new-batch", methods=["POST"])
+def post_purchase_new_batch():
+    if "username" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+    data = request.get_json() or {}
+    body, status = purchase_new_buses_batch(session["username"], data.get("items"))
+    return jsonify(body), status
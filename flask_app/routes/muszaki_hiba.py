@@ -1,5 +1,6 @@
 from flask import Blueprint, jsonify, request, session
 from services.hiba_service import *
+from utils.streaming import stream_json_array
 
 hiba_bp = Blueprint("hiba", __name__)
 
@@ -8,6 +9,18 @@ def post_issue():
     data = request.get_json()
     return jsonify(create_issue(data))
 
+# Telemetriás hibafolyam (NDJSON vagy CSV) egyetlen kérésben
+@hiba_bp.route("/hibak/bulk", methods=["POST"])
+def post_issues_bulk():
+    if "username" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+    rows = parse_issue_feed(request.get_data(as_text=True), request.content_type)
+    result = create_issues_bulk(rows, session["username"], session.get("is_admin", False))
+    if isinstance(result, tuple):
+        body, status = result
+        return jsonify(body), status
+    return jsonify(result)
+
 @hiba_bp.route("/hiba/<int:hiba_id>", methods=["DELETE"])
 def delete_issue(hiba_id):
     return jsonify(remove_issue(hiba_id))
@@ -23,11 +36,23 @@ def issues():
 
     username = session["username"]
     is_admin = session.get("is_admin", False)
-    buses = list_issues_for_user(username, is_admin)
-    return jsonify(buses)
+    return stream_json_array(iter_issues_for_user(username, is_admin))
 
 @hiba_bp.route("/hibak/all", methods=["GET"])
 def get_all_issues():
     if "username" not in session:
         return jsonify({"error": "Unauthorized"}), 401
-    return jsonify(list_all_issues())
\ No newline at end of file
+    return stream_json_array(iter_all_issues())
+
+@hiba_bp.route("/hibak/history", methods=["GET"])
+def get_issue_history():
+    if "username" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify(list_issue_history(request.args, session["username"], session.get("is_admin", False)))
+
+@hiba_bp.route("/hibak/summary", methods=["GET"])
+def get_issue_summary():
+    if "username" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+    plates = request.args.get("plates", "").split(",")
+    return jsonify(issue_summary(plates))
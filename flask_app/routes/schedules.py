@@ -1,9 +1,12 @@
-from flask import Blueprint, jsonify, request, session
+from flask import Blueprint, Response, jsonify, request, session
 from services.schedule_service import *
+from services.winners_snapshot import winners_snapshot
+from utils.conditional import SHARED_CACHE_CONTROL, versioned
 
 schedule_bp = Blueprint("schedule", __name__)
 
 @schedule_bp.route("/schedules", methods=["GET"])
+@versioned("schedules", per_user=True)
 def get_schedules():
     if "username" not in session:
         return jsonify({"error": "Unauthorized"}), 401
@@ -12,6 +15,7 @@ def get_schedules():
     return jsonify(schedules)
 
 @schedule_bp.route("/schedules/<int:schedule_id>", methods=["GET"])
+@versioned("schedules", cache_control=SHARED_CACHE_CONTROL)
 def get_schedule_details(schedule_id):
     schedule = get_schedule(schedule_id)
     if not schedule:
@@ -78,14 +82,17 @@ def save_manual_assignments(schedule_id):
     return jsonify(result)
 
 @schedule_bp.route("/lines/<line_name>/schedules", methods=["GET"])
+@versioned("schedules", cache_control=SHARED_CACHE_CONTROL)
 def get_schedules_for_line(line_name):
     schedules = list_schedules_for_line(line_name)
     return jsonify(schedules)
 
+# Az előre szerializált pillanatképből, adatbázis nélkül; ?line= és ?frame= szerint szűrhető
 @schedule_bp.route("/lines/winners", methods=["GET"])
+@versioned("active_schedules", cache_control=SHARED_CACHE_CONTROL)
 def get_all_line_winners():
-    winners = get_line_winners()
-    return jsonify(winners)
+    body = winners_snapshot.serialized(request.args.get("line"), request.args.get("frame"))
+    return Response(body, mimetype="application/json")
 
 @schedule_bp.route("/schedules/<int:schedule_id>", methods=["DELETE"])
 def delete_schedule_route(schedule_id):
@@ -0,0 +1,32 @@
+from services.busz_service import list_buses
+from services.garage_service import list_garages_for_user
+from services.hiba_service import MAX_SUMMARY_PLATES, issue_summary
+from services.market_service import list_active_listings, list_market_buses, list_new_bus_models
+
+MY_LISTINGS_LIMIT = 200
+
+# A piac oldal kezdőállapota egy dokumentumban. A szolgáltatások a kérés egyetlen kapcsolatán
+# (get_connection) futnak egymás után, a hibaösszesítő a betöltött oldalak összes buszára együtt készül.
+def market_bootstrap(username=None, is_admin=False):
+    listings = list_active_listings({"exclude_seller": username} if username else {})
+    market = list_market_buses()
+    state = {
+        "listings": listings,
+        "my_listings": [],
+        "market": market,
+        "models": list_new_bus_models(),
+        "garages": [],
+        "my_buses": [],
+    }
+    if username:
+        state["my_listings"] = list_active_listings({"seller": username, "limit": MY_LISTINGS_LIMIT})["items"]
+        state["garages"] = list_garages_for_user(username)
+        state["my_buses"] = list_buses(username, is_admin, {"fields": "plate,type"})
+
+    plates = list(dict.fromkeys(
+        [l["bus_plate"] for l in listings["items"] + state["my_listings"]] + [b["plate"] for b in market["items"]]
+    ))
+    state["issue_summary"] = {}
+    for start in range(0, len(plates), MAX_SUMMARY_PLATES):
+        state["issue_summary"].update(issue_summary(plates[start:start + MAX_SUMMARY_PLATES]))
+    return state
@@ -1,31 +1,75 @@
+import csv
+import io
+import json
+import psycopg2
 from db.connection import get_connection
+from utils.pagination import PageRequest, SortField, fetch_page, int_param
 from utils.validation import validate_fields
 
+# Lekérhető mezők és SQL kifejezésük; a km a még be nem vezetett kilométeróra-növekményekkel együtt értendő
+BUS_FIELDS = {
+    "plate": "plate",
+    "type": "type",
+    "km": "COALESCE(km, 0) + COALESCE((SELECT SUM(e.km) FROM bus_km_events e WHERE e.bus_plate = bus.plate), 0)",
+    "year": "year",
+    "garage": "garage",
+    "description": "description",
+    "status": "status",
+    "line": "line",
+    "owner": "owner",
+    "favourite": "favourite",
+}
+IMPORT_COLUMNS = ("plate", "type", "km", "year", "garage", "description", "status", "line", "owner")
+IMPORT_ERROR_LIMIT = 1000   # A válaszban legfeljebb ennyi elutasított sor szerepel
+IMPORT_CONFLICT_MODES = ("skip", "update")
+
+BUS_SORTS = {
+    "plate": SortField("plate", "plate"),
+}
+
+# A kért mezők SELECT listája (a rendszám mindig szerepel, mert a lapozás kulcsa)
+def _bus_projection(fields=None):
+    names = [f.strip() for f in (fields or "").split(",") if f.strip()] or list(BUS_FIELDS)
+    unknown = [name for name in names if name not in BUS_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    if "plate" not in names:
+        names.insert(0, "plate")
+    return ", ".join(f"{BUS_FIELDS[name]} AS {name}" for name in dict.fromkeys(names))
+
+# A felhasználó buszai (adminisztrátornak minden busz) mezőválasztással, garázs és állapot szerint szűrve.
+# Lapozási paraméter (limit, cursor) nélkül a teljes lista érkezik tömbként, egyébként egy oldal.
+def list_buses(username, is_admin, params=None):
+    params = params or {}
+    conditions, values = [], []
+    if not is_admin:
+        conditions.append("owner = %s")
+        values.append(username)
+    garage = int_param(params, "garage")
+    if garage is not None:
+        conditions.append("garage = %s")
+        values.append(garage)
+    if params.get("status"):
+        conditions.append("status = %s")
+        values.append(params["status"])
+    select_sql = f"SELECT {_bus_projection(params.get('fields'))} FROM bus"
+
+    with get_connection().cursor() as cur:
+        if params.get("limit") or params.get("cursor"):
+            page = PageRequest(params, BUS_SORTS, default_sort="plate")
+            return fetch_page(cur, select_sql, conditions, values, page, id_column="plate", id_key="plate")
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        cur.execute(f"{select_sql}{where} ORDER BY plate", tuple(values))
+        return cur.fetchall()
+
 # A buszok lekérdezése az adott felhasználónak
 def get_buses_for_user(username, is_admin):
-    conn = get_connection()
-    with conn.cursor() as cur:
-        if is_admin:
-            cur.execute("SELECT * FROM bus ORDER BY plate")
-        else:
-            cur.execute("SELECT * FROM bus WHERE owner = %s ORDER BY plate", (username,))
-        rows = cur.fetchall()
-
-    buses = []
-    for row in rows:
-        buses.append({
-            "plate": row["plate"],
-            "type": row["type"],
-            "km": row["km"],
-            "year": row["year"],
-            "garage": row["garage"],
-            "description": row["description"],
-            "status": row["status"],
-            "line": row["line"],
-            "owner": row["owner"],
-            "favourite": row["favourite"]
-        })
-    return buses
+    return list_buses(username, is_admin)
+
+# A felhasználó flottájának verziókulcsa a táblaverziók között (db/versions.py, 11-es migráció);
+# adminisztrátornál az összes flottáé együtt
+def fleet_version_key(username, is_admin):
+    return "fleet" if is_admin else f"fleet:{username}"
 
 # Új busz létrehozása
 def create_bus(data):
@@ -83,6 +127,8 @@ def update_bus(plate, data):
         ))
         if cur.rowcount == 0:
             return {"error": f"Bus with plate '{plate}' not found"}, 404
+        # A kézzel megadott km felülírja a még be nem vezetett növekményeket
+        cur.execute("DELETE FROM bus_km_events WHERE bus_plate = %s", (plate,))
         
         conn.commit()
 
@@ -96,4 +142,202 @@ def toggle_favourite(plate, username):
         if cur.rowcount == 0:
             return {"error": f"Bus with plate '{plate}' not found or not owned by user"}, 404
         conn.commit()
-    return {"message": "Favourite toggled"}
\ No newline at end of file
+    return {"message": "Favourite toggled"}
+
+# A kilométeróra-napló összevont bevezetése a bus táblába, egyetlen tranzakcióban.
+# Az olvasók a commit előtt a naplóval, utána a frissített km-mel együtt ugyanazt az összeget látják.
+def flush_km_events():
+    conn = get_connection()
+    with conn.cursor() as cur:
+        cur.execute("""
+            WITH drained AS (
+                DELETE FROM bus_km_events RETURNING bus_plate, km
+            ), totals AS (
+                SELECT bus_plate, SUM(km) AS km FROM drained GROUP BY bus_plate
+            )
+            UPDATE bus b
+            SET km = COALESCE(b.km, 0) + t.km
+            FROM totals t
+            WHERE b.plate = t.bus_plate
+        """)
+        flushed = cur.rowcount
+        conn.commit()
+    return flushed
+
+# Soronként előállított szöveg fájlszerű olvasása (a COPY ebből olvas kötegenként)
+class _LineReader:
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self._buffer = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._lines, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    readline = read
+
+# Egy betöltendő sor a COPY CSV formájában (az összes importoszlop és a hibaüzenet). NUL karaktert és
+# hibás UTF-8 kódolást (csereként dekódolva) a COPY nem fogadna el, ezért ezek is soronkénti hibák.
+def _import_line(record, error=None):
+    values = [record.get(column) for column in IMPORT_COLUMNS]
+    if error is None and any(isinstance(v, str) and ("\x00" in v or "\ufffd" in v) for v in values):
+        error = "invalid characters"
+    if error is not None:
+        plate = record.get("plate")
+        values = [plate if isinstance(plate, str) and "\x00" not in plate else None] + [None] * (len(IMPORT_COLUMNS) - 1)
+    out = io.StringIO()
+    csv.writer(out, lineterminator="\n").writerow(["" if value is None else value for value in values + [error]])
+    return out.getvalue()
+
+# NDJSON rekordok CSV sorokká alakítása; a hibás rekord üres sorként, hibaüzenettel kerül a betöltésbe
+def _ndjson_as_csv(lines):
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError
+        except ValueError:
+            yield _import_line({}, "invalid JSON record")
+            continue
+        yield _import_line(record)
+
+# A feltöltött CSV sorainak szétbontása a csv modullal; a hibás szerkezetű sor (eltérő oszlopszám,
+# értelmezhetetlen idézés) a rendszámmal és hibaüzenettel kerül a betöltésbe, a COPY nem áll le miatta
+def _csv_as_csv(text, columns):
+    reader = csv.reader(text)
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            yield _import_line({}, f"malformed CSV row: {e}")
+            continue
+        if not row:
+            continue
+        record = dict(zip(columns, row))
+        if len(row) != len(columns):
+            yield _import_line(record, f"expected {len(columns)} columns, got {len(row)}")
+            continue
+        yield _import_line({column: value if value != "" else None for column, value in record.items()})
+
+# A feltöltés COPY-ra kész formája: a sorok soronként ellenőrizve, az összes importoszlop és a hibaüzenet
+def _import_source(stream, content_type):
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    text = io.TextIOWrapper(stream, encoding="utf-8", errors="replace", newline="")
+    if content_type in ("text/csv", "application/csv"):
+        header = next(csv.reader([text.readline()]), [])
+        columns = [name.strip() for name in header]
+        unknown = [name for name in columns if name not in IMPORT_COLUMNS]
+        if unknown or "plate" not in columns or len(set(columns)) != len(columns):
+            raise ValueError(f"CSV header must contain plate and only these columns: {', '.join(IMPORT_COLUMNS)}")
+        return _LineReader(_csv_as_csv(text, columns))
+    if content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl"):
+        return _LineReader(_ndjson_as_csv(text))
+    raise ValueError("Content-Type must be text/csv or application/x-ndjson")
+
+# Flotta tömeges betöltése (adminisztrátor): a feltöltés COPY-val egy ideiglenes táblába kerül, az ellenőrzés
+# halmazszinten, SQL-ben fut, az érvényes sorok egyetlen INSERT ... ON CONFLICT utasítással kerülnek a bus táblába.
+# A hibás sorok nem szakítják meg a betöltést, hanem sorszámmal a válaszba kerülnek.
+# on_conflict: "skip" a meglévő rendszámokat kihagyja, "update" felülírja (a tulajdonost csak ha meg van adva).
+def import_fleet(stream, content_type, on_conflict="skip"):
+    if on_conflict not in IMPORT_CONFLICT_MODES:
+        raise ValueError(f"on_conflict must be one of: {', '.join(IMPORT_CONFLICT_MODES)}")
+    source = _import_source(stream, content_type)
+
+    conn = get_connection()
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TEMP TABLE fleet_import (
+                row_no serial, plate text, type text, km text, year text, garage text,
+                description text, status text, line text, owner text, error text
+            ) ON COMMIT DROP
+        """)
+        try:
+            cur.copy_expert(f"COPY fleet_import ({', '.join(IMPORT_COLUMNS)}, error) FROM STDIN WITH (FORMAT csv)", source)
+        except psycopg2.DataError as e:
+            conn.rollback()
+            raise ValueError(f"Malformed upload: {e.diag.message_primary or e}")
+
+        cur.execute("""
+            UPDATE fleet_import i
+            SET error = CASE
+                WHEN COALESCE(i.plate, '') = '' THEN 'plate is required'
+                WHEN length(i.plate) > 20 THEN 'plate must be at most 20 characters'
+                WHEN COALESCE(i.type, '') = '' THEN 'type is required'
+                WHEN length(i.type) > 50 THEN 'type must be at most 50 characters'
+                WHEN COALESCE(i.km, '') !~ '^[0-9]{1,9}$' THEN 'km must be a non-negative integer'
+                WHEN COALESCE(i.year, '') !~ '^[0-9]{4}$' THEN 'year must be a four-digit integer'
+                WHEN COALESCE(i.garage, '') !~ '^[0-9]{1,9}$' THEN 'garage must be an integer'
+                WHEN NOT EXISTS (SELECT 1 FROM garages g WHERE g.id = i.garage::int) THEN 'unknown garage'
+                WHEN length(i.status) > 20 OR length(i.line) > 20 THEN 'status and line must be at most 20 characters'
+                WHEN i.owner IS NOT NULL AND NOT EXISTS (SELECT 1 FROM users u WHERE u.username = i.owner)
+                    THEN 'unknown owner'
+            END
+            WHERE i.error IS NULL
+        """)
+        cur.execute("""
+            UPDATE fleet_import i
+            SET error = 'duplicate plate in upload'
+            FROM (
+                SELECT row_no, row_number() OVER (PARTITION BY plate ORDER BY row_no) AS n
+                FROM fleet_import WHERE error IS NULL
+            ) d
+            WHERE d.row_no = i.row_no AND d.n > 1
+        """)
+
+        # Felülírásnál a meglévő buszok frissülnek (a meg nem adott oszlopok változatlanok maradnak),
+        # a többi rendszám beszúrásra kerül; ütköző rendszámot a beszúrás kihagy
+        updated = []
+        if on_conflict == "update":
+            cur.execute("""
+                UPDATE bus b
+                SET type = i.type, km = i.km::int, year = i.year::int, garage = i.garage::int,
+                    description = COALESCE(i.description, b.description), status = COALESCE(i.status, b.status),
+                    line = COALESCE(i.line, b.line), owner = COALESCE(i.owner, b.owner)
+                FROM fleet_import i
+                WHERE i.error IS NULL AND b.plate = i.plate
+                RETURNING b.plate
+            """)
+            updated = [row["plate"] for row in cur.fetchall()]
+            cur.execute("DELETE FROM bus_km_events WHERE bus_plate = ANY(%s)", (updated,))
+        cur.execute("""
+            INSERT INTO bus (plate, type, km, year, garage, description, status, line, owner)
+            SELECT plate, type, km::int, year::int, garage::int, COALESCE(description, ''),
+                   COALESCE(status, 'KT'), COALESCE(line, '-'), owner
+            FROM fleet_import
+            WHERE error IS NULL
+            ORDER BY plate
+            ON CONFLICT (plate) DO NOTHING
+            RETURNING plate
+        """)
+        inserted = [row["plate"] for row in cur.fetchall()]
+
+        cur.execute("""
+            SELECT row_no, plate, COALESCE(error, 'plate already exists') AS error
+            FROM fleet_import
+            WHERE error IS NOT NULL OR plate <> ALL(%s)
+            ORDER BY row_no
+        """, (updated + inserted,))
+        rejected = cur.fetchall()
+        conn.commit()
+
+    return {
+        "message": f"{len(inserted)} bus(es) imported, {len(updated)} updated, {len(rejected)} rejected",
+        "inserted": len(inserted),
+        "updated": len(updated),
+        "rejected_count": len(rejected),
+        "rejected": [
+            {"row": row["row_no"], "plate": row["plate"], "error": row["error"]}
+            for row in rejected[:IMPORT_ERROR_LIMIT]
+        ],
+    }
@@ -1,37 +1,101 @@
+import csv
+import io
+import itertools
+import json
+import re
+from datetime import datetime, timedelta
 from db.connection import get_connection
+from services.recompute_queue import enqueue_winner_recompute
+from utils.pagination import PageRequest, SortField, fetch_page
 from utils.validation import validate_fields
-from services.busz_service import get_buses_for_user
+
+ISSUE_STREAM_BATCH = 500     # Szerveroldali kurzorból egyszerre lekért sorok száma
+ISSUE_TIME_FORMAT = "%Y.%m.%d - %H:%M:%S"   # A felületen megadott bejelentési időpont formátuma
+ARCHIVE_LOCK_KEY = 7_204_117_003            # Egy hónap archív partícióját egyszerre csak egy kérés hozza létre
+MAX_SUMMARY_PLATES = 200                    # Egy összesítő kérésben lekérdezhető buszok száma
+MAX_BULK_ISSUES = 5000                      # Egy tömeges feltöltés legfeljebb ennyi hibát tartalmazhat
+BULK_ISSUE_FIELDS = ("bus", "time", "repair_time", "repair_cost", "description")
+MAX_PLATE_LENGTH = 20                       # issues.bus varchar(20)
+MAX_INT = 2 ** 31 - 1                       # A PostgreSQL integer felső határa
+
+# Javítási idő: [N day(s)] HH:MM[:SS], a felületen és az adatbázis szöveges alakjában is így szerepel
+REPAIR_TIME_PATTERN = re.compile(r"^(?:(\d{1,5}) days? )?(\d{1,6}):([0-5]\d)(?::([0-5]\d))?$")
+
+HISTORY_STATUSES = ("open", "resolved", "all")
+HISTORY_SORTS = {
+    "reported_at": SortField("h.reported_at", "reported_at", nullable=True),
+}
+
+# Az időpont és a javítási idő szövegként érkezik, így a sorokat nem kell utólag átalakítani;
+# a hiányzó javítási idő JSON null (korábban a "None" szöveg volt)
+ISSUE_COLUMNS = """
+    i.id, i.bus, i."time"::text AS "time", i.repair_time::text AS repair_time, i.repair_cost, i.description
+"""
+
+_stream_ids = itertools.count(1)
+
+# Hibák soronkénti olvasása szerveroldali (nevesített) kurzorral.
+# A lekérdezés azonnal lefut, így a hibák még a válasz elküldése előtt jelentkeznek;
+# a sorok kötegenként, a visszaadott generátor bejárásakor érkeznek.
+# A kurzornév folyamonként egyedi, így egy kapcsolaton több folyam is nyitva lehet.
+def _stream_issues(query, params=None):
+    cur = get_connection().cursor(name=f"issues_stream_{next(_stream_ids)}")
+    cur.itersize = ISSUE_STREAM_BATCH
+    cur.execute(query, params)
+
+    def rows():
+        with cur:
+            yield from cur
+    return rows()
+
+# A hibatörténet mindkét rétegből (nyitott hibák és archívum) azonos oszlopokkal olvasható
+HISTORY_COLUMNS = """
+    id, bus, "time"::text AS "time", reported_at, repair_time::text AS repair_time, repair_cost, description
+"""
 
 # Hibák listázása adott buszhoz
 def list_issues_by_bus(plate: str):
     with get_connection().cursor() as cur:
-        cur.execute("SELECT * FROM issues WHERE bus = %s", (plate,))
-        rows = cur.fetchall()
-
-        for row in rows:
-            row["time"] = str(row["time"])
-            row["repair_time"] = str(row["repair_time"])
+        cur.execute(f"SELECT {ISSUE_COLUMNS} FROM issues i WHERE i.bus = %s ORDER BY i.id", (plate,))
+        return cur.fetchall()
 
-        return rows
+# Hibák a felhasználó buszaihoz (adminisztrátornak minden buszhoz) egyetlen lekérdezéssel, folyamként
+def iter_issues_for_user(username: str, is_admin: bool):
+    if is_admin:
+        return _stream_issues(f"""
+            SELECT {ISSUE_COLUMNS}
+            FROM issues i
+            JOIN bus b ON b.plate = i.bus
+            ORDER BY i.bus, i.id
+        """)
+    return _stream_issues(f"""
+        SELECT {ISSUE_COLUMNS}
+        FROM issues i
+        JOIN bus b ON b.plate = i.bus
+        WHERE b.owner = %s
+        ORDER BY i.bus, i.id
+    """, (username,))
 
 # Hibák listázása adott felhasználónak
 def list_issues_for_user(username: str, is_admin: bool):
-    buses = get_buses_for_user(username, is_admin)
-    all_issues = []
-    for bus in buses:
-        bus_issues = list_issues_by_bus(bus["plate"])
-        all_issues.extend(bus_issues)
-    return all_issues
+    return list(iter_issues_for_user(username, is_admin))
+
+# A szöveges bejelentési időpont értelmezése; ha nem a megszokott formátumú, a bejelentés pillanata számít
+def _reported_at(value):
+    try:
+        return datetime.strptime(value, ISSUE_TIME_FORMAT)
+    except (TypeError, ValueError):
+        return datetime.now().replace(microsecond=0)
 
 # Új hiba létrehozása
 def create_issue(data):
     conn = get_connection()
     with conn.cursor() as cur:
         cur.execute("""
-            INSERT INTO issues (bus, time, repair_time, repair_cost, description)
-            VALUES (%s, %s, %s, %s, %s)
+            INSERT INTO issues (bus, time, reported_at, repair_time, repair_cost, description)
+            VALUES (%s, %s, %s, %s, %s, %s)
         """, (
-            data["bus"], data["time"], data["repair_time"],
+            data["bus"], data["time"], _reported_at(data["time"]), data["repair_time"],
             int(data["repair_cost"]), data["description"]
         ))
 
@@ -59,23 +123,171 @@ def create_issue(data):
         conn.commit()
     if affected:
         try:
-            from services.schedule_service import select_winner_for_line_frame
-            seen = set()
-            for row in affected:
-                key = (row["line_name"], row["frame"])
-                if key in seen:
-                    continue
-                seen.add(key)
-                try:
-                    select_winner_for_line_frame(row["line_name"], row["frame"])
-                except Exception:
-                    pass
+            from services.schedule_service import select_winners
+            select_winners((row["line_name"], row["frame"]) for row in affected)
         except Exception:
             pass
 
     return {"message": "Issue added and bus set to service"}
 
-# Hiba törlése (pl.: javítás után)
+# Telemetriás hibafolyam beolvasása: NDJSON (soronként egy JSON objektum) vagy fejléces CSV
+def parse_issue_feed(body: str, content_type: str):
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in ("text/csv", "application/csv"):
+        rows = list(csv.DictReader(io.StringIO(body)))
+    elif content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl"):
+        rows = []
+        for line_no, line in enumerate(body.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                raise ValueError(f"Line {line_no} is not valid JSON")
+    else:
+        raise ValueError("Content-Type must be text/csv or application/x-ndjson")
+
+    if not rows:
+        raise ValueError("No issues in request")
+    if len(rows) > MAX_BULK_ISSUES:
+        raise ValueError(f"At most {MAX_BULK_ISSUES} issues can be uploaded at once")
+    return rows
+
+def _repair_time(value):
+    if value in (None, ""):
+        return None
+    match = REPAIR_TIME_PATTERN.match(str(value).strip())
+    if not match:
+        raise ValueError("repair_time must be HH:MM[:SS]")
+    days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return timedelta(days=days, hours=hours, minutes=minutes, seconds=seconds)
+
+def _repair_cost(value):
+    if value in (None, ""):
+        return None
+    try:
+        cost = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("repair_cost must be an integer")
+    if not 0 <= cost <= MAX_INT:
+        raise ValueError(f"repair_cost must be between 0 and {MAX_INT}")
+    return cost
+
+# Egy feltöltött sor ellenőrzése és oszlopértékekre bontása; hiányzó időpont esetén a feltöltés ideje számít.
+# Minden értéket itt alakít át, így a beszúrásba csak az oszloptípusoknak megfelelő sorok kerülnek.
+def _bulk_issue_values(row, now):
+    if not isinstance(row, dict):
+        raise ValueError("Issue must be an object")
+    if not row.get("bus") or not row.get("description"):
+        raise ValueError("bus and description are required")
+    bus, description = str(row["bus"]), str(row["description"])
+    issue_time = str(row.get("time") or now.strftime(ISSUE_TIME_FORMAT))
+    if len(bus) > MAX_PLATE_LENGTH:
+        raise ValueError(f"bus must be at most {MAX_PLATE_LENGTH} characters")
+    if any("\x00" in value for value in (bus, description, issue_time)):
+        raise ValueError("Text fields cannot contain NUL characters")
+    return (
+        bus, issue_time, _reported_at(issue_time),
+        _repair_time(row.get("repair_time")), _repair_cost(row.get("repair_cost")), description
+    )
+
+# Hibák tömeges felvétele: egyetlen beszúrás, halmazszintű kiosztás-törlés és státuszfrissítés,
+# az érintett (vonal, idősáv) párok nyertesei kötegenként egyszer számolódnak újra.
+# A hibás, ismeretlen vagy (nem adminisztrátornál) más felhasználó buszára vonatkozó sorok kimaradnak,
+# és a válaszban sorszámmal szerepelnek.
+def create_issues_bulk(rows, username, is_admin=False):
+    now = datetime.now().replace(microsecond=0)
+    columns = [[] for _ in BULK_ISSUE_FIELDS + ("reported_at",)]
+    line_numbers, rejected = [], []
+    for line_no, row in enumerate(rows, start=1):
+        try:
+            values = _bulk_issue_values(row, now)
+        except ValueError as e:
+            rejected.append({"line": line_no, "error": str(e)})
+            continue
+        line_numbers.append(line_no)
+        for column, value in zip(columns, values):
+            column.append(value)
+    if not line_numbers:
+        return {"error": "No valid issues", "rejected": rejected}, 400
+    buses, times, reported, repair_times, costs, descriptions = columns
+
+    conn = get_connection()
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO issues (bus, "time", reported_at, repair_time, repair_cost, description)
+            SELECT t.bus, t."time", t.reported_at, t.repair_time, t.repair_cost, t.description
+            FROM unnest(%s::varchar[], %s::varchar[], %s::timestamp[], %s::interval[], %s::int[], %s::text[])
+                 WITH ORDINALITY AS t(bus, "time", reported_at, repair_time, repair_cost, description, n)
+            JOIN bus b ON b.plate = t.bus AND (%s OR b.owner = %s)
+            ORDER BY t.n
+            RETURNING id, bus
+        """, (buses, times, reported, repair_times, costs, descriptions, is_admin, username))
+        inserted = cur.fetchall()
+        known = {row["bus"] for row in inserted}
+        plates = sorted(known)
+
+        missing = sorted(set(buses) - known)
+        existing = set()
+        if missing:
+            cur.execute("SELECT plate FROM bus WHERE plate = ANY(%s)", (missing,))
+            existing = {row["plate"] for row in cur.fetchall()}
+        for line_no, bus in zip(line_numbers, buses):
+            if bus not in known:
+                error = f"Bus {bus} is not yours" if bus in existing else f"Unknown bus {bus}"
+                rejected.append({"line": line_no, "error": error})
+        if not inserted:
+            conn.rollback()
+            return {"error": "No valid issues", "rejected": sorted(rejected, key=lambda r: r["line"])}, 400
+
+        cur.execute("""
+            SELECT DISTINCT sa.schedule_id, s.line_name, s.frame
+            FROM schedule_assignments sa
+            JOIN schedules s ON s.id = sa.schedule_id
+            WHERE sa.bus_plate = ANY(%s)
+        """, (plates,))
+        affected = cur.fetchall() or []
+
+        cur.execute("DELETE FROM schedule_assignments WHERE bus_plate = ANY(%s)", (plates,))
+        cur.execute("""
+            UPDATE bus SET status = 'Service', line = '-'
+            WHERE plate = ANY(%s)
+        """, (plates,))
+        if affected:
+            cur.execute(
+                "UPDATE schedules SET status = 'pending' WHERE id = ANY(%s) AND status = 'active'",
+                (sorted({row["schedule_id"] for row in affected}),)
+            )
+        conn.commit()
+
+    pairs = sorted({(row["line_name"], row["frame"]) for row in affected})
+    for line_name, frame in pairs:
+        enqueue_winner_recompute(line_name, frame)
+
+    return {
+        "message": f"{len(inserted)} issue(s) added, {len(plates)} bus(es) set to service",
+        "issue_ids": [row["id"] for row in inserted],
+        "rejected": sorted(rejected, key=lambda r: r["line"]),
+        "recomputed_slots": len(pairs),
+    }
+
+# A javítás hónapjának archív partíciója; hiányzó partíciót tanácsadó zár alatt hoz létre
+def _ensure_archive_partition(cur, resolved_at):
+    start = resolved_at.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    end = (start + timedelta(days=32)).replace(day=1)
+    name = f"issues_archive_{start:%Y_%m}"
+
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL AS present", (name,))
+    if cur.fetchone()["present"]:
+        return name
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (ARCHIVE_LOCK_KEY,))
+    cur.execute(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF issues_archive FOR VALUES FROM (%s) TO (%s)",
+        (start, end)
+    )
+    return name
+
+# Hiba lezárása (pl.: javítás után): a sor az archívumba költözik
 def remove_issue(issue_id: int):
     conn = get_connection()
     with conn.cursor() as cur:
@@ -85,7 +297,16 @@ def remove_issue(issue_id: int):
             return {"error": f"Issue with id {issue_id} not found"}
         bus_plate = row["bus"]
 
-        cur.execute("DELETE FROM issues WHERE id = %s", (issue_id,))
+        resolved_at = datetime.now()
+        _ensure_archive_partition(cur, resolved_at)
+        cur.execute("""
+            WITH moved AS (
+                DELETE FROM issues WHERE id = %s
+                RETURNING id, bus, "time", reported_at, repair_time, repair_cost, description
+            )
+            INSERT INTO issues_archive (id, bus, "time", reported_at, repair_time, repair_cost, description, resolved_at)
+            SELECT id, bus, "time", reported_at, repair_time, repair_cost, description, %s FROM moved
+        """, (issue_id, resolved_at))
 
         cur.execute("SELECT COUNT(*) AS issue_count FROM issues WHERE bus = %s", (bus_plate,))
         count_row = cur.fetchone()
@@ -101,16 +322,88 @@ def remove_issue(issue_id: int):
             status_msg = f"but bus {bus_plate} remains in Service due to {remaining_issues} remaining issue(s)"
 
         conn.commit()
-    return {"message": f"Issue {issue_id} deleted, {status_msg}"}
+    return {"message": f"Issue {issue_id} resolved and archived, {status_msg}"}
+
+# Minden hiba, folyamként
+def iter_all_issues():
+    return _stream_issues(f"SELECT {ISSUE_COLUMNS} FROM issues i ORDER BY i.id")
 
 # Minden hiba listázása
 def list_all_issues():
+    return list(iter_all_issues())
+
+def _time_param(params, name, end=False):
+    raw = params.get(name)
+    if not raw:
+        return None
+    try:
+        value = datetime.fromisoformat(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO date or datetime")
+    # Puszta dátum felső határként az egész napot lefedi
+    if end and len(raw) == 10:
+        value += timedelta(days=1)
+    return value
+
+def _history_source(status):
+    open_issues = f"SELECT {HISTORY_COLUMNS}, NULL::timestamp AS resolved_at, 'open' AS status FROM issues"
+    resolved = f"SELECT {HISTORY_COLUMNS}, resolved_at, 'resolved' AS status FROM issues_archive"
+    parts = {"open": [open_issues], "resolved": [resolved], "all": [open_issues, resolved]}[status]
+    return f"SELECT * FROM ({' UNION ALL '.join(parts)}) h"
+
+# Hibatörténet lapozva: állapot (open, resolved, all), bejelentési időablak [from, to) és busz szerint szűrve.
+# Nem adminisztrátor csak a saját buszai hibáit látja.
+def list_issue_history(params, username: str, is_admin: bool):
+    params = params or {}
+    status = params.get("status") or "open"
+    if status not in HISTORY_STATUSES:
+        raise ValueError(f"status must be one of: {', '.join(HISTORY_STATUSES)}")
+    page = PageRequest(params, HISTORY_SORTS, default_sort="reported_at", default_order="desc")
+
+    conditions, values = [], []
+    start, end = _time_param(params, "from"), _time_param(params, "to", end=True)
+    if start is not None:
+        conditions.append("h.reported_at >= %s")
+        values.append(start)
+    if end is not None:
+        conditions.append("h.reported_at < %s")
+        values.append(end)
+    if params.get("bus"):
+        conditions.append("h.bus = %s")
+        values.append(params["bus"])
+    if not is_admin:
+        conditions.append("h.bus IN (SELECT plate FROM bus WHERE owner = %s)")
+        values.append(username)
+
     with get_connection().cursor() as cur:
-        cur.execute("SELECT * FROM issues")
-        rows = cur.fetchall() or []
+        return fetch_page(cur, _history_source(status), conditions, values, page, id_column="h.id", id_key="id")
 
-        for row in rows:
-            row["time"] = str(row["time"])
-            row["repair_time"] = str(row["repair_time"])
+# Buszonkénti hibaösszesítő a piac nézethez: nyitott hibák száma és költsége, valamint
+# az archivált javításokkal együtt számolt teljes javítási költség
+def issue_summary(plates):
+    plates = list(dict.fromkeys(p for p in plates if p))
+    if len(plates) > MAX_SUMMARY_PLATES:
+        raise ValueError(f"At most {MAX_SUMMARY_PLATES} plates can be summarized at once")
+    if not plates:
+        return {}
 
-        return rows
\ No newline at end of file
+    with get_connection().cursor() as cur:
+        cur.execute("""
+            SELECT p.plate, o.open_issues, COALESCE(o.open_repair_cost, 0) AS open_repair_cost,
+                   COALESCE(o.open_repair_cost, 0) + COALESCE(a.resolved_repair_cost, 0) AS total_repair_cost
+            FROM unnest(%s::varchar[]) AS p(plate)
+            CROSS JOIN LATERAL (
+                SELECT COUNT(*) AS open_issues, SUM(repair_cost) AS open_repair_cost FROM issues WHERE bus = p.plate
+            ) o
+            CROSS JOIN LATERAL (
+                SELECT SUM(repair_cost) AS resolved_repair_cost FROM issues_archive WHERE bus = p.plate
+            ) a
+        """, (plates,))
+        return {
+            row["plate"]: {
+                "open_issues": row["open_issues"],
+                "open_repair_cost": row["open_repair_cost"],
+                "total_repair_cost": row["total_repair_cost"],
+            }
+            for row in cur.fetchall()
+        }
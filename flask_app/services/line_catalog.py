@@ -0,0 +1,33 @@
+from db.connection import get_connection
+from db.versions import VersionedCache, table_versions
+
+LINE_COLUMNS = ("name", "provider_garage_id", "travel_time_garage", "travel_time_line")
+
+
+# A vonalak memóriában tartott katalógusa (kicsi, ritkán változó tábla). Az első kereséskor és minden
+# változás után egyetlen lekérdezéssel töltődik be teljesen. Érvényességét a "lines" táblaverzió
+# (db/versions.py) adja, így más folyamat írása is érvényteleníti; a saját create_line azonnal.
+# A visszaadott sorok közösek, a hívók nem módosíthatják őket.
+class LineCatalog(VersionedCache):
+    def __init__(self, versions=table_versions):
+        super().__init__(("lines",), versions)
+
+    def get(self, name):
+        return self.value().get(name)
+
+    def all(self):
+        return list(self.value().values())
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats["size"] = len(self._value) if self._value is not None else None
+        return stats
+
+    def _build(self):
+        with get_connection().cursor() as cur:
+            cur.execute(f"SELECT {', '.join(LINE_COLUMNS)} FROM lines ORDER BY name")
+            return {row["name"]: dict(row) for row in cur.fetchall()}
+
+
+line_catalog = LineCatalog()
@@ -1,25 +1,17 @@
 from db.connection import get_connection
+from services.line_catalog import line_catalog
 from utils.validation import validate_fields
+from itertools import groupby
 
+LINE_OVERVIEW_COLUMNS = ("name", "provider_garage_id", "travel_time_garage", "travel_time_line", "provider_garage_name")
+WINNER_COLUMNS = ("id", "username", "start_time", "end_time", "frequency", "frame", "bid_price")
+
+# A vonalak a memóriában tartott katalógusból (services/line_catalog.py)
 def list_lines():
-    conn = get_connection()
-    with conn.cursor() as cur:
-        cur.execute("""
-            SELECT name, provider_garage_id, travel_time_garage, travel_time_line
-            FROM lines
-            ORDER BY name
-        """)
-        return cur.fetchall()
+    return line_catalog.all()
 
 def get_line(line_name):
-    conn = get_connection()
-    with conn.cursor() as cur:
-        cur.execute("""
-            SELECT name, provider_garage_id, travel_time_garage, travel_time_line
-            FROM lines
-            WHERE name = %s
-        """, (line_name,))
-        return cur.fetchone()
+    return line_catalog.get(line_name)
 
 def create_line(data):
     validate_fields(data, {
@@ -37,4 +29,48 @@ def create_line(data):
         """, (data["name"], data["provider_garage_id"], data["travel_time_garage"], data["travel_time_line"]))
         line = cur.fetchone()
         conn.commit()
-        return {"message": "Line created", "name": line["name"]}
+    line_catalog.invalidate()
+    return {"message": "Line created", "name": line["name"]}
+
+def _hhmm(value):
+    return value.strftime("%H:%M") if value else None
+
+# A vonalak oldal adatai egy lekérdezéssel: a vonalak a kiszolgáló garázs nevével és a menetrendjeikkel,
+# vonal szerint rendezve és csoportosítva; a nyertesek az aktív menetrendekből adódnak
+def lines_overview():
+    conn = get_connection()
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT l.name, l.provider_garage_id, l.travel_time_garage, l.travel_time_line,
+                   g.name AS provider_garage_name,
+                   s.id, s.username, s.start_time, s.end_time, s.frequency, s.bid_price, s.frame, s.status
+            FROM lines l
+            LEFT JOIN garages g ON g.id = l.provider_garage_id
+            LEFT JOIN schedules s ON s.line_name = l.name
+            ORDER BY l.name, s.id
+        """)
+        rows = cur.fetchall()
+
+    lines, winners = [], []
+    for name, line_rows in groupby(rows, key=lambda row: row["name"]):
+        line_rows = list(line_rows)
+        line = {k: line_rows[0][k] for k in LINE_OVERVIEW_COLUMNS}
+        line["schedules"] = [
+            {
+                "id": row["id"],
+                "username": row["username"],
+                "start_time": _hhmm(row["start_time"]),
+                "end_time": _hhmm(row["end_time"]),
+                "frequency": row["frequency"],
+                "bid_price": row["bid_price"],
+                "frame": row["frame"],
+                "status": row["status"]
+            }
+            for row in line_rows if row["id"] is not None
+        ]
+        winners += [
+            {"line_name": name, **{k: s[k] for k in WINNER_COLUMNS}}
+            for s in line["schedules"] if s["status"] == "active"
+        ]
+        lines.append(line)
+    return {"lines": lines, "winners": winners}
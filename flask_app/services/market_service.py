@@ -1,5 +1,9 @@
 from db.connection import get_connection
+from db.events import notify, notify_all
 from utils.validation import validate_fields
+from utils.pagination import PageRequest, SortField, fetch_page, int_param
+from services.recompute_queue import enqueue_winner_recompute
+from psycopg2.errors import DeadlockDetected, LockNotAvailable, UniqueViolation
 import re
 from datetime import datetime
 
@@ -10,12 +14,103 @@ NEW_BUS_MODELS = {
     "VanHool":     {"label": "VanHool AG300",     "tipus": "VanHool AG300",     "evjarat": 2002, "price": 105_000},
 }
 
-# Buszok listázása a piacon
-def list_market_buses():
+# Új busz vásárlásának kötelező mezői
+NEW_BUS_FIELDS = {
+    "model_key": str,
+    "rendszam": str,
+    "leiras": str,
+    "garazs": int,
+}
+
+USED_BUS_BASE_PRICE = 100_000    # Használt busz ára 0 km-rel
+USED_BUS_MIN_PRICE = 10_000      # Használt busz minimális ára
+USED_BUS_MAX_KM = 500_000        # Ennyi km felett a minimális ár érvényes
+
+MAX_BATCH_SIZE = 100             # Egy kötegelt kérésben kezelhető buszok száma
+
+# A hiányzó km az árban 0 km-nek számít
+PRICE_KM = "COALESCE(km, 0)"
+
+# Piaci buszok rendezési mezői; az ár a km-ből számolt, ezért fordított km sorrend
+MARKET_BUS_SORTS = {
+    "plate": SortField("plate", "plate"),
+    "type": SortField("type", "type", nullable=True),
+    "year": SortField("year", "year", nullable=True),
+    "km": SortField("km", "km", nullable=True),
+    "price": SortField(PRICE_KM, "price_km", inverted=True),
+}
+
+LISTING_SORTS = {
+    "created_at": SortField("ml.created_at", "created_at"),
+    "price": SortField("ml.price", "price"),
+    "type": SortField("b.type", "type", nullable=True),
+    "year": SortField("b.year", "year", nullable=True),
+    "km": SortField("b.km", "km", nullable=True),
+}
+
+# Használt busz ára a futott km alapján
+def used_bus_price(km):
+    price = USED_BUS_BASE_PRICE - (km or 0) / USED_BUS_MAX_KM * (USED_BUS_BASE_PRICE - USED_BUS_MIN_PRICE)
+    return int(max(price, USED_BUS_MIN_PRICE) + 0.5)
+
+# Árintervallum átszámítása km-intervallumra (a km-es indexek használatához).
+# Visszatérési érték: (km_min, km_max), vagy None, ha egy busz sem eshet az intervallumba.
+def _km_bounds_for_price(price_min, price_max):
+    span = USED_BUS_BASE_PRICE - USED_BUS_MIN_PRICE
+    km_min = km_max = None
+    if price_max is not None:
+        if price_max < USED_BUS_MIN_PRICE:
+            return None
+        if price_max < USED_BUS_BASE_PRICE:
+            # round(ár) <= price_max  <=>  ár < price_max + 0.5
+            km_min = (2 * (USED_BUS_BASE_PRICE - price_max) - 1) * USED_BUS_MAX_KM // (2 * span) + 1
+    if price_min is not None and price_min > USED_BUS_MIN_PRICE:
+        if price_min > USED_BUS_BASE_PRICE:
+            return None
+        # round(ár) >= price_min  <=>  ár >= price_min - 0.5
+        km_max = (2 * (USED_BUS_BASE_PRICE - price_min) + 1) * USED_BUS_MAX_KM // (2 * span)
+    return km_min, km_max
+
+# Közös szűrők (típus, évjárat, km) SQL feltételei
+def _bus_filters(params, prefix=""):
+    conditions, values = [], []
+    if params.get("type"):
+        conditions.append(f"{prefix}type = %s")
+        values.append(params["type"])
+    for name, column, op in (
+        ("year_min", "year", ">="), ("year_max", "year", "<="),
+        ("km_min", "km", ">="), ("km_max", "km", "<="),
+    ):
+        value = int_param(params, name)
+        if value is not None:
+            conditions.append(f"{prefix}{column} {op} %s")
+            values.append(value)
+    return conditions, values
+
+# Buszok listázása a piacon (szűrhető, keyset lapozással)
+def list_market_buses(params=None):
+    params = params or {}
+    page = PageRequest(params, MARKET_BUS_SORTS, default_sort="plate")
+    conditions, values = _bus_filters(params)
+    conditions.insert(0, "owner IS NULL")
+
+    bounds = _km_bounds_for_price(int_param(params, "price_min"), int_param(params, "price_max"))
+    if bounds is None:
+        return {"items": [], "next_cursor": None}
+    for bound, op in zip(bounds, (">=", "<=")):
+        if bound is not None:
+            conditions.append(f"{PRICE_KM} {op} %s")
+            values.append(bound)
+
     conn = get_connection()
     with conn.cursor() as cur:
-        cur.execute("SELECT * FROM bus WHERE owner IS NULL")
-        return cur.fetchall()
+        result = fetch_page(
+            cur, f"SELECT plate, type, km, year, {PRICE_KM} AS price_km FROM bus", conditions, values, page,
+            id_column="plate", id_key="plate",
+        )
+    for bus in result["items"]:
+        bus["price"] = used_bus_price(bus.pop("price_km"))
+    return result
 
 # Új buszmodellek listázása
 def list_new_bus_models():
@@ -24,21 +119,37 @@ def list_new_bus_models():
         for k, v in NEW_BUS_MODELS.items()
     ]
 
-# Aktív hirdetések listázása
-def list_active_listings():
+# Aktív hirdetések listázása (szűrhető, alapértelmezetten a legújabb elöl, keyset lapozással)
+def list_active_listings(params=None):
+    params = params or {}
+    page = PageRequest(params, LISTING_SORTS, default_sort="created_at", default_order="desc")
+    conditions, values = _bus_filters(params, prefix="b.")
+    conditions.insert(0, "ml.status = 'active'")
+    for name, op in (("price_min", ">="), ("price_max", "<=")):
+        value = int_param(params, name)
+        if value is not None:
+            conditions.append(f"ml.price {op} %s")
+            values.append(value)
+    if params.get("seller"):
+        conditions.append("ml.seller_username = %s")
+        values.append(params["seller"])
+    if params.get("exclude_seller"):
+        conditions.append("ml.seller_username <> %s")
+        values.append(params["exclude_seller"])
+
     conn = get_connection()
     with conn.cursor() as cur:
-        cur.execute(
+        return fetch_page(
+            cur,
             """
             SELECT ml.id AS listing_id, ml.bus_plate, ml.seller_username, ml.price, ml.created_at,
                    b.type, b.km, b.year, b.garage
             FROM market_listings ml
             JOIN bus b ON b.plate = ml.bus_plate
-            WHERE ml.status = 'active'
-            ORDER BY ml.created_at DESC
-            """
+            """,
+            conditions, values, page,
+            id_column="ml.id", id_key="listing_id",
         )
-        return [dict(r) for r in cur.fetchall()]
 
 # Új hirdetés létrehozása
 def create_listing(seller_username: str, bus_plate: str, price: int):
@@ -63,6 +174,8 @@ def create_listing(seller_username: str, bus_plate: str, price: int):
             (bus_plate, seller_username, int(price))
         )
         row = cur.fetchone()
+        notify(cur, "listing_created", listing_id=row["id"], bus_plate=bus_plate,
+               seller_username=seller_username, price=int(price))
         conn.commit()
         return {"message": "Listing created", "listing_id": row["id"]}, 200
 
@@ -80,105 +193,122 @@ def cancel_listing(seller_username: str, listing_id: int):
             return {"error": "Not your listing"}, 403
         
         cur.execute("UPDATE market_listings SET status = 'canceled' WHERE id = %s", (listing_id,))
+        notify(cur, "listing_canceled", listing_id=row["id"], seller_username=seller_username)
         conn.commit()
         return {"message": "Listing canceled"}, 200
 
-# Busz megvásárlása hirdetésen keresztül
+# Busz megvásárlása hirdetésen keresztül.
+# Zárolási sorrend: hirdetés (NOWAIT) és busz, majd a két felhasználó név szerinti sorrendben, így
+# egymástól vásárló felhasználók sem akadhatnak össze. Foglalt hirdetésnél a vevő azonnal 409-et kap
+# ahelyett, hogy sorban állna; a busz sorára viszont vár, így a háttérbeli km-frissítés
+# (flush_km_events) nem látszik vevői versenynek. Az egyenleget a feltételes levonás ellenőrzi. A kifizetés
+# (_pay_ticks) egyenlegfrissítésével kialakuló holtpont ugyanazt az újrapróbálható 409-et adja.
 def purchase_listing(buyer_username: str, listing_id: int, garage_id=None):
     conn = get_connection()
-    affected_pairs = []
-    with conn.cursor() as cur:
-        cur.execute(
-            """
-            SELECT id, bus_plate, seller_username, price, status
-            FROM market_listings WHERE id = %s FOR UPDATE
-            """,
-            (listing_id,)
-        )
-        listing = cur.fetchone()
-        if not listing or listing["status"] != "active":
-            return {"error": "Listing not available"}, 404
-        
-        if listing["seller_username"] == buyer_username:
-            return {"error": "Cannot buy your own listing"}, 400
-        
-
-        cur.execute("SELECT owner FROM bus WHERE plate = %s", (listing["bus_plate"],))
-        bus = cur.fetchone()
-        if not bus or bus["owner"] != listing["seller_username"]:
-            return {"error": "Seller no longer owns this bus"}, 400
-
-        cur.execute("SELECT balance FROM users WHERE username = %s", (buyer_username,))
-        buyer = cur.fetchone()
-        if not buyer or buyer["balance"] < int(listing["price"]):
-            return {"error": "Insufficient balance"}, 400
-
-        target_garage = _resolve_user_garage(cur, buyer_username, garage_id)
-        if target_garage is None:
-            return {"error": "No unlocked garage available for storage"}, 400
-
-        cur.execute(
-            """
-            SELECT DISTINCT s.line_name, s.frame
-            FROM schedule_assignments sa
-            JOIN schedules s ON s.id = sa.schedule_id
-            WHERE sa.bus_plate = %s
-            """,
-            (listing["bus_plate"],)
-        )
-        for r in cur.fetchall() or []:
-            try:
-                affected_pairs.append((r["line_name"], r["frame"]))
-            except Exception:
-                pass
-        cur.execute("DELETE FROM schedule_assignments WHERE bus_plate = %s", (listing["bus_plate"],))
-
-        price = int(listing["price"])
-
-        cur.execute("UPDATE users SET balance = balance - %s WHERE username = %s", (price, buyer_username))
-        cur.execute("UPDATE users SET balance = balance + %s WHERE username = %s", (price, listing["seller_username"]))
-
-        # Busz állapotának frissítése, alapjértelmezett státuszba állítása
-        cur.execute(
-            """
-            UPDATE bus
-            SET owner = %s,
-                garage = %s,
-                favourite = false,
-                status = 'KT',
-                line = '-'
-            WHERE plate = %s
-            """,
-            (buyer_username, target_garage, listing["bus_plate"])
-        )
-
-        cur.execute("UPDATE market_listings SET status = 'sold', sold_at = %s WHERE id = %s", (datetime.utcnow(), listing_id))
-        conn.commit()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT ml.id, ml.bus_plate, ml.seller_username, ml.price, ml.status, b.owner
+                FROM market_listings ml
+                JOIN bus b ON b.plate = ml.bus_plate
+                WHERE ml.id = %s
+                FOR UPDATE OF ml NOWAIT FOR UPDATE OF b
+                """,
+                (listing_id,)
+            )
+            listing = cur.fetchone()
+
+            error = None
+            if not listing or listing["status"] != "active":
+                error = {"error": "Listing not available"}, 404
+            elif listing["seller_username"] == buyer_username:
+                error = {"error": "Cannot buy your own listing"}, 400
+            elif listing["owner"] != listing["seller_username"]:
+                error = {"error": "Seller no longer owns this bus"}, 400
+            else:
+                target_garage = _resolve_user_garage(cur, buyer_username, garage_id)
+                if target_garage is None:
+                    error = {"error": "No unlocked garage available for storage"}, 400
+            if error:
+                conn.rollback()
+                return error
+
+            price = int(listing["price"])
+            seller_username = listing["seller_username"]
+            balances = {}
+            for username in sorted((buyer_username, seller_username)):
+                if username == buyer_username:
+                    cur.execute(
+                        "UPDATE users SET balance = balance - %s WHERE username = %s AND balance >= %s RETURNING balance",
+                        (price, buyer_username, price)
+                    )
+                    if cur.rowcount != 1:
+                        conn.rollback()
+                        return {"error": "Insufficient balance"}, 400
+                else:
+                    cur.execute(
+                        "UPDATE users SET balance = balance + %s WHERE username = %s RETURNING balance",
+                        (price, seller_username)
+                    )
+                balances[username] = cur.fetchone()["balance"]
+
+            cur.execute(
+                """
+                WITH removed AS (
+                    DELETE FROM schedule_assignments WHERE bus_plate = %s RETURNING schedule_id
+                )
+                SELECT DISTINCT s.line_name, s.frame
+                FROM removed r
+                JOIN schedules s ON s.id = r.schedule_id
+                """,
+                (listing["bus_plate"],)
+            )
+            affected_pairs = [(r["line_name"], r["frame"]) for r in cur.fetchall()]
+
+            # Busz állapotának frissítése, alapjértelmezett státuszba állítása
+            cur.execute(
+                """
+                UPDATE bus
+                SET owner = %s,
+                    garage = %s,
+                    favourite = false,
+                    status = 'KT',
+                    line = '-'
+                WHERE plate = %s
+                """,
+                (buyer_username, target_garage, listing["bus_plate"])
+            )
+
+            cur.execute("UPDATE market_listings SET status = 'sold', sold_at = %s WHERE id = %s", (datetime.utcnow(), listing_id))
+            notify_all(cur, [
+                {"type": "listing_sold", "listing_id": listing["id"], "bus_plate": listing["bus_plate"],
+                 "seller_username": seller_username, "price": price},
+                {"type": "balance_changed", "username": buyer_username, "delta": -price,
+                 "balance": balances[buyer_username], "reason": "purchase"},
+                {"type": "balance_changed", "username": seller_username, "delta": price,
+                 "balance": balances[seller_username], "reason": "sale"},
+            ])
+            conn.commit()
+    except (LockNotAvailable, DeadlockDetected):
+        conn.rollback()
+        return {"error": "Listing is being purchased by another buyer"}, 409
 
     # Aktív menetrend újraszámítása az adott vonalon és idősávban
-    if affected_pairs:
-        try:
-            from services.schedule_service import select_winner_for_line_frame
-            seen = set()
-            for line_name, frame in affected_pairs:
-                key = (line_name, frame)
-                if key in seen:
-                    continue
-                seen.add(key)
-                select_winner_for_line_frame(line_name, frame)
-        except Exception:
-            pass
+    for line_name, frame in affected_pairs:
+        enqueue_winner_recompute(line_name, frame)
 
     return {"message": "Purchase successful"}, 200
 
-# Busz vásárlása a régiségek listájáról
-def buy_bus(bus_plate, buyer_username, price, garage_id=None):
+# Busz vásárlása a régiségek listájáról; az árat a futott km alapján a szerver számolja
+def buy_bus(bus_plate, buyer_username, garage_id=None):
     conn = get_connection()
     with conn.cursor() as cur:
         cur.execute("SELECT plate, km FROM bus WHERE plate = %s AND owner IS NULL", (bus_plate,))
         bus = cur.fetchone()
         if not bus:
             return {"error": "Bus not available"}, 400
+        price = used_bus_price(bus["km"])
 
         cur.execute("SELECT balance FROM users WHERE username = %s", (buyer_username,))
         user = cur.fetchone()
@@ -211,12 +341,7 @@ def buy_bus(bus_plate, buyer_username, price, garage_id=None):
 
 # Új busz vásárlása a gyári modellek közül
 def purchase_new_bus(data, buyer_username):
-    validate_fields(data, {
-        "model_key": str,
-        "rendszam": str,
-        "leiras": str,
-        "garazs": int,
-    })
+    validate_fields(data, NEW_BUS_FIELDS)
 
     model = NEW_BUS_MODELS.get(data["model_key"])
     if not model:
@@ -277,12 +402,264 @@ def sell_bus(bus_plate, seller_username, price):
             """
             INSERT INTO market_listings (bus_plate, seller_username, price, status)
             VALUES (%s, %s, %s, 'active')
+            RETURNING id
             """,
             (bus_plate, seller_username, int(price))
         )
+        notify(cur, "listing_created", listing_id=cur.fetchone()["id"], bus_plate=bus_plate,
+               seller_username=seller_username, price=int(price))
         conn.commit()
         return {"message": f"Listing created for {bus_plate} at {int(price)}"}, 200
 
+# Kötegelt kérés tételeinek ellenőrzése
+def _batch_items(items):
+    if not isinstance(items, list) or not items:
+        raise ValueError("items must be a non-empty list")
+    if len(items) > MAX_BATCH_SIZE:
+        raise ValueError(f"At most {MAX_BATCH_SIZE} items are allowed per batch")
+    if not all(isinstance(item, dict) for item in items):
+        raise ValueError("items must be objects")
+    return items
+
+# Feltételes levonás: None, ha az egyenleg nem fedezi az összeget
+def _debit(cur, username, amount):
+    cur.execute(
+        "UPDATE users SET balance = balance - %s WHERE username = %s AND balance >= %s RETURNING balance",
+        (amount, username, amount)
+    )
+    row = cur.fetchone()
+    return row["balance"] if row else None
+
+# Kötegelt kérés lezárása: a teljes összeg levonása egyetlen UPDATE-tel.
+# Visszatérési érték: hibaválasz (a tranzakció visszagörgetve), vagy None és az új egyenleg.
+def _settle_batch(conn, cur, username, results, total):
+    if not any(r["ok"] for r in results):
+        conn.rollback()
+        return ({"error": "No items could be processed", "results": results}, 400), None
+    new_balance = _debit(cur, username, total)
+    if new_balance is None:
+        conn.rollback()
+        results = [r if not r["ok"] else _item_result(r["rendszam"], "Insufficient balance") for r in results]
+        return ({"error": "Insufficient balance", "total_price": total, "results": results}, 400), None
+    return None, new_balance
+
+# Tétel eredménye; a sikertelen tételek a köteg többi részét nem érintik
+def _item_result(rendszam, error=None, **details):
+    if error:
+        return {"rendszam": rendszam, "ok": False, "error": error}
+    return {"rendszam": rendszam, "ok": True, **details}
+
+# A kért garázs, ha fel van oldva, egyébként a legkisebb azonosítójú feloldott garázs
+def _pick_garage(unlocked, garage_id):
+    try:
+        gid = int(garage_id) if garage_id is not None and str(garage_id) != "" else None
+    except Exception:
+        gid = None
+    return gid if gid in unlocked else unlocked[0]
+
+# Több gazdátlan busz vásárlása egy tranzakcióban.
+# Tételek: {"rendszam", "garage_id"}; az árat a futott km alapján a szerver számolja.
+def buy_buses_batch(buyer_username, items):
+    items = _batch_items(items)
+    plates = [str(item.get("rendszam") or "").strip() for item in items]
+
+    conn = get_connection()
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT plate, km FROM bus WHERE plate = ANY(%s) AND owner IS NULL ORDER BY plate FOR UPDATE",
+            (sorted(set(plates)),)
+        )
+        available = {r["plate"]: r["km"] for r in cur.fetchall()}
+        cur.execute("SELECT garage_id FROM user_garages WHERE username = %s ORDER BY garage_id", (buyer_username,))
+        unlocked = [int(r["garage_id"]) for r in cur.fetchall()]
+
+        results, bought, seen, total = [], [], set(), 0
+        for item, plate in zip(items, plates):
+            if plate in seen:
+                results.append(_item_result(plate, "Duplicate bus in batch"))
+            elif plate not in available:
+                results.append(_item_result(plate, "Bus not available"))
+            elif not unlocked:
+                results.append(_item_result(plate, "No unlocked garage available for storage"))
+            else:
+                garage = _pick_garage(unlocked, item.get("garage_id"))
+                price = used_bus_price(available[plate])
+                bought.append((plate, garage))
+                total += price
+                results.append(_item_result(plate, price=price, garage_id=garage))
+            seen.add(plate)
+
+        error, new_balance = _settle_batch(conn, cur, buyer_username, results, total)
+        if error:
+            return error
+
+        cur.execute(
+            """
+            UPDATE bus b
+            SET owner = %s,
+                garage = t.garage,
+                favourite = false,
+                status = 'KT',
+                line = '-'
+            FROM unnest(%s::varchar[], %s::int[]) AS t(plate, garage)
+            WHERE b.plate = t.plate
+            """,
+            (buyer_username, [p for p, _ in bought], [g for _, g in bought])
+        )
+        conn.commit()
+
+    return {
+        "message": f"You bought {len(bought)} of {len(items)} buses for {total}",
+        "total_price": total,
+        "new_balance": new_balance,
+        "results": results,
+    }, 200
+
+# Több saját busz meghirdetése egy tranzakcióban. Tételek: {"rendszam", "price"}
+def create_listings_batch(seller_username, items):
+    items = _batch_items(items)
+    plates = [str(item.get("rendszam") or "").strip() for item in items]
+
+    conn = get_connection()
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT b.plate, b.owner, ml.id AS listing_id
+            FROM bus b
+            LEFT JOIN market_listings ml ON ml.bus_plate = b.plate AND ml.status = 'active'
+            WHERE b.plate = ANY(%s)
+            ORDER BY b.plate
+            FOR UPDATE OF b
+            """,
+            (sorted(set(plates)),)
+        )
+        buses = {r["plate"]: r for r in cur.fetchall()}
+
+        results, listed, seen = [], [], set()
+        for item, plate in zip(items, plates):
+            price = item.get("price")
+            bus = buses.get(plate)
+            if plate in seen:
+                results.append(_item_result(plate, "Duplicate bus in batch"))
+            elif not isinstance(price, int) or isinstance(price, bool) or price < 0:
+                results.append(_item_result(plate, "Invalid price"))
+            elif not bus or bus["owner"] != seller_username:
+                results.append(_item_result(plate, "You do not own this bus"))
+            elif bus["listing_id"] is not None:
+                results.append(_item_result(plate, "Bus already listed"))
+            else:
+                listed.append((plate, price))
+                results.append(_item_result(plate, price=price))
+            seen.add(plate)
+
+        if not listed:
+            conn.rollback()
+            return {"error": "No items could be processed", "results": results}, 400
+
+        try:
+            cur.execute(
+                """
+                INSERT INTO market_listings (bus_plate, seller_username, price, status)
+                SELECT t.plate, %s, t.price, 'active'
+                FROM unnest(%s::varchar[], %s::int[]) AS t(plate, price)
+                RETURNING id, bus_plate
+                """,
+                (seller_username, [p for p, _ in listed], [price for _, price in listed])
+            )
+        except UniqueViolation:
+            conn.rollback()
+            return {"error": "Bus already listed", "results": results}, 409
+        listing_ids = {r["bus_plate"]: r["id"] for r in cur.fetchall()}
+        notify_all(cur, [
+            {"type": "listing_created", "listing_id": listing_ids[plate], "bus_plate": plate,
+             "seller_username": seller_username, "price": price}
+            for plate, price in listed
+        ])
+        conn.commit()
+
+    for result in results:
+        if result["ok"]:
+            result["listing_id"] = listing_ids.get(result["rendszam"])
+    return {"message": f"Created {len(listed)} of {len(items)} listings", "results": results}, 200
+
+# Több új busz vásárlása a gyári modellek közül egy tranzakcióban.
+# Tételek: ugyanazok a mezők, mint a purchase_new_bus esetén.
+def purchase_new_buses_batch(buyer_username, items):
+    items = _batch_items(items)
+    # A hiányos tételek csak a saját eredményüket rontják el
+    invalid = {}
+    for i, item in enumerate(items):
+        try:
+            validate_fields(item, NEW_BUS_FIELDS)
+        except ValueError as e:
+            invalid[i] = str(e)
+    plates = [str(item.get("rendszam") or "").strip().upper() for item in items]
+
+    conn = get_connection()
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT garage_id FROM user_garages WHERE username = %s AND garage_id = ANY(%s)",
+            (buyer_username, sorted({item["garazs"] for i, item in enumerate(items) if i not in invalid}))
+        )
+        unlocked = {int(r["garage_id"]) for r in cur.fetchall()}
+        cur.execute("SELECT plate FROM bus WHERE plate = ANY(%s)", (sorted(set(plates)),))
+        existing = {r["plate"] for r in cur.fetchall()}
+
+        results, bought, seen, total = [], [], set(), 0
+        for i, (item, plate) in enumerate(zip(items, plates)):
+            model = None if i in invalid else NEW_BUS_MODELS.get(item["model_key"])
+            if i in invalid:
+                results.append(_item_result(plate, invalid[i]))
+            elif not model:
+                results.append(_item_result(plate, "Invalid model selected"))
+            elif not re.fullmatch(r"[A-Z]{3}-\d{3}", plate):
+                results.append(_item_result(plate, "Invalid license plate format. Expected format: ABC-123"))
+            elif plate in seen:
+                results.append(_item_result(plate, "Duplicate license plate in batch"))
+            elif item["garazs"] not in unlocked:
+                results.append(_item_result(plate, "Garage not unlocked"))
+            elif plate in existing:
+                results.append(_item_result(plate, "License plate already exists"))
+            else:
+                price = int(model["price"])
+                bought.append((plate, model, item))
+                total += price
+                results.append(_item_result(plate, price=price))
+            seen.add(plate)
+
+        error, new_balance = _settle_batch(conn, cur, buyer_username, results, total)
+        if error:
+            return error
+
+        try:
+            cur.execute(
+                """
+                INSERT INTO bus (plate, type, km, year, garage, description, status, line, owner, favourite)
+                SELECT t.plate, t.type, 0, t.year, t.garage, t.description, 'KT', '-', %s, false
+                FROM unnest(%s::varchar[], %s::varchar[], %s::int[], %s::int[], %s::text[])
+                     AS t(plate, type, year, garage, description)
+                """,
+                (
+                    buyer_username,
+                    [plate for plate, _, _ in bought],
+                    [model["tipus"] for _, model, _ in bought],
+                    [model["evjarat"] for _, model, _ in bought],
+                    [item["garazs"] for _, _, item in bought],
+                    [item["leiras"] for _, _, item in bought],
+                )
+            )
+        except UniqueViolation:
+            conn.rollback()
+            return {"error": "License plate already exists", "results": results}, 409
+        conn.commit()
+
+    return {
+        "message": f"You bought {len(bought)} of {len(items)} new buses for {total}",
+        "total_price": total,
+        "new_balance": new_balance,
+        "results": results,
+    }, 200
+
 # Segédfüggvény a felhasználó garázsainak ellenőrzéséhez   
 def _user_has_unlocked_garage(cur, username: str, garage_id: int) -> bool:
     cur.execute("SELECT 1 FROM user_garages WHERE username = %s AND garage_id = %s", (username, int(garage_id)))
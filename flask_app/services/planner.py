@@ -0,0 +1,157 @@
+import heapq
+import threading
+from collections import OrderedDict
+
+MAX_CONTINUOUS = 240          # Maximális folyamatos munkaidő (perc)
+BREAK_MINUTES = 30            # Kötelező szünet hossza (perc)
+PLAN_CACHE_SIZE = 512         # Gyorsítótárazott tervek maximális száma
+
+
+def _to_min(tstr: str) -> int:
+    h, m = map(int, tstr.split(":"))
+    return h * 60 + m
+
+def _to_str(mins: int) -> str:
+    mins_mod = mins % (24 * 60)
+    h = (mins_mod // 60) % 24
+    m = mins_mod % 60
+    return f"{h:02d}:{m:02d}"
+
+
+class _Block:
+    __slots__ = (
+        "idx",
+        "departures",
+        "breaks",
+        "duty_start",
+        "shift_start",
+        "last_trip_end",
+        "next_available",
+    )
+
+    def __init__(self, idx: int, first_dep: int, travel_time_garage: int, travel_time_line: int):
+        self.idx = idx
+        self.departures = [first_dep]
+        self.breaks = []
+        self.duty_start = first_dep - travel_time_garage
+        self.shift_start = self.duty_start
+        self.last_trip_end = first_dep + 2 * travel_time_line
+        self.next_available = self.last_trip_end
+
+
+# Buszblokkok tervezése prioritási sorral.
+# A kupac kulcsa (next_available, sorrend): az adott körben módosított buszok az azonos
+# kulcsú, változatlan buszok elé, az újonnan forgalomba állítottak mögéjük kerülnek, így a
+# kiosztás pontosan megegyezik a korábbi, minden indulásnál újrarendező mohó algoritmuséval.
+def plan_blocks(slots, travel_time_garage: int, travel_time_line: int):
+    heap = []
+    blocks = []
+    final_order = None
+    last_step = len(slots) - 1
+
+    for step, dep in enumerate(_to_min(s) for s in slots):
+        if step == last_step:
+            # A kimenet sorrendje az utolsó indulás előtti rendezett sorrend (+ az esetleges új busz)
+            final_order = [entry[2] for entry in sorted(heap)]
+
+        assigned = False
+        skipped = []
+        rank = 0
+        while heap and heap[0][0] <= dep:
+            entry = heapq.heappop(heap)
+            b = entry[2]
+            rank += 1
+
+            if dep - b.shift_start >= MAX_CONTINUOUS:
+                if dep - b.last_trip_end < BREAK_MINUTES:
+                    skipped.append(entry)
+                    continue
+
+                break_start = b.last_trip_end
+                break_end = break_start + BREAK_MINUTES
+                b.breaks.append((break_start, break_end))
+                b.shift_start = break_end
+                b.next_available = max(b.next_available, break_end)
+
+                if dep < b.next_available:
+                    heapq.heappush(heap, (b.next_available, (-step, rank), b))
+                    continue
+
+            b.departures.append(dep)
+            b.last_trip_end = dep + 2 * travel_time_line
+            b.next_available = b.last_trip_end
+            heapq.heappush(heap, (b.next_available, (-step, rank), b))
+            assigned = True
+            break
+
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+
+        if not assigned:
+            b = _Block(len(blocks) + 1, dep, travel_time_garage, travel_time_line)
+            blocks.append(b)
+            heapq.heappush(heap, (b.next_available, (1, b.idx), b))
+            if final_order is not None:
+                final_order.append(b)
+
+    if final_order is None:
+        final_order = blocks
+
+    return [
+        {
+            "bus_id": b.idx,
+            "duty_start": _to_str(b.duty_start),
+            "duty_end": _to_str(b.last_trip_end + travel_time_garage),
+            "departures": [_to_str(t) for t in b.departures],
+            "breaks": [{"start": _to_str(start), "end": _to_str(end)} for start, end in b.breaks],
+        }
+        for b in final_order
+    ]
+
+
+# Korlátos LRU gyorsítótár a tervekhez. A kulcs (travel_time_garage, travel_time_line,
+# start, end, frequency), így megváltozott menetidők esetén régi terv nem kerülhet elő,
+# kézi érvénytelenítésre nincs szükség.
+# A visszaadott terveket a hívók nem módosíthatják, mert közösek.
+class PlanCache:
+    def __init__(self, maxsize=PLAN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_build(self, key, build):
+        with self._lock:
+            plan = self._entries.get(key)
+            if plan is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return plan
+            self.misses += 1
+
+        plan = build()
+
+        with self._lock:
+            self._entries[key] = plan
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return plan
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+plan_cache = PlanCache()
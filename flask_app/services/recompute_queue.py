@@ -0,0 +1,182 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from db.connection import connection_scope
+
+log = logging.getLogger(__name__)
+
+RECOMPUTE_BATCH_SIZE = 100         # Egy menetben újraszámolt (vonal, idősáv) párok maximális száma
+RECOMPUTE_COALESCE_SECONDS = 0.25  # Ennyit vár a feldolgozó, hogy az egymás utáni kérések összevonódjanak
+RECOMPUTE_MAX_ATTEMPTS = 5         # Sikertelen újraszámítás után legfeljebb ennyiszer próbálja (utána eldobja)
+RECOMPUTE_RETRY_SECONDS = 1.0      # Az első újrapróbálás várakozása, minden további kudarc után duplázódik
+
+
+# Háttérsor a nyertesek újraszámításához: a függő (vonal, idősáv) kulcsok egyszer szerepelnek,
+# a feldolgozó szál kötegekben számolja újra őket, így a kérés nem vár a tervezésre.
+# Sikertelen köteg (pl. átmeneti adatbázishiba) párjai növekvő várakozással visszakerülnek a sorba.
+class WinnerRecomputeQueue:
+    def __init__(self, process, batch_size=RECOMPUTE_BATCH_SIZE, coalesce_seconds=RECOMPUTE_COALESCE_SECONDS,
+                 max_attempts=RECOMPUTE_MAX_ATTEMPTS, retry_seconds=RECOMPUTE_RETRY_SECONDS):
+        self._process = process
+        self.batch_size = batch_size
+        self.coalesce_seconds = coalesce_seconds
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self._pending = OrderedDict()
+        self._attempts = {}
+        self._not_before = {}
+        self._cond = threading.Condition()
+        self._run_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        self._counters = {
+            "enqueued": 0,
+            "coalesced": 0,
+            "processed": 0,
+            "batches": 0,
+            "errors": 0,
+            "retried": 0,
+            "dropped": 0,
+            "last_lag_seconds": None,
+            "max_lag_seconds": 0.0,
+        }
+
+    def enqueue(self, line_name, frame):
+        key = (line_name, frame)
+        with self._cond:
+            self._counters["enqueued"] += 1
+            if key in self._pending:
+                self._counters["coalesced"] += 1
+                return
+            self._pending[key] = time.monotonic()
+            self._cond.notify()
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="winner-recompute", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    # Minden függő újraszámítás szinkron lefuttatása a hívó szálban (tesztekhez)
+    def flush(self):
+        while True:
+            batch = self._take(None)
+            if not batch:
+                break
+            self._run_batch(batch)
+        # Megvárja a háttérszálon éppen futó köteget is
+        with self._run_lock:
+            pass
+
+    def stats(self):
+        now = time.monotonic()
+        with self._cond:
+            oldest = min(self._pending.values(), default=None)
+            return {
+                "depth": len(self._pending),
+                "retrying": len(self._not_before),
+                "oldest_pending_seconds": round(now - oldest, 3) if oldest is not None else None,
+                "worker_alive": self._thread is not None and self._thread.is_alive(),
+                **self._counters,
+            }
+
+    # Csak az esedékes kulcsok: a visszatett párok a várakozási idejük leteltéig a sorban maradnak
+    def _take(self, limit):
+        now = time.monotonic()
+        with self._cond:
+            keys = [(key, enqueued_at) for key, enqueued_at in self._pending.items()
+                    if self._not_before.get(key, 0) <= now]
+            if limit is not None:
+                keys = keys[:limit]
+            for key, _ in keys:
+                del self._pending[key]
+                self._not_before.pop(key, None)
+            return keys
+
+    # A következő esedékes kulcsig hátralévő idő (0: van esedékes, None: üres a sor); zár alatt hívandó
+    def _ready_in(self):
+        if not self._pending:
+            return None
+        now = time.monotonic()
+        return max(0.0, min(self._not_before.get(key, 0) for key in self._pending) - now)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    delay = self._ready_in()
+                    if delay == 0:
+                        break
+                    self._cond.wait(delay)
+                if self._stopping and self._ready_in() != 0:
+                    return
+            if not self._stopping:
+                time.sleep(self.coalesce_seconds)
+            batch = self._take(self.batch_size)
+            if batch:
+                self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        with self._run_lock:
+            started = time.monotonic()
+            try:
+                self._process([key for key, _ in batch])
+            except Exception:
+                log.exception("Winner recompute failed for %d pair(s)", len(batch))
+                self._retry(batch)
+                return
+
+        lag = started - min(enqueued_at for _, enqueued_at in batch)
+        with self._cond:
+            for key, _ in batch:
+                self._attempts.pop(key, None)
+            self._counters["processed"] += len(batch)
+            self._counters["batches"] += 1
+            self._counters["last_lag_seconds"] = round(lag, 3)
+            self._counters["max_lag_seconds"] = round(max(self._counters["max_lag_seconds"], lag), 3)
+
+    def _retry(self, batch):
+        now = time.monotonic()
+        dropped = []
+        with self._cond:
+            self._counters["errors"] += 1
+            for key, enqueued_at in batch:
+                attempts = self._attempts.get(key, 0) + 1
+                if attempts >= self.max_attempts:
+                    self._attempts.pop(key, None)
+                    self._counters["dropped"] += 1
+                    dropped.append(key)
+                    continue
+                self._attempts[key] = attempts
+                # Ha közben újra bekerült, az eredeti sorba kerülési idő marad
+                self._pending[key] = min(enqueued_at, self._pending.get(key, enqueued_at))
+                self._not_before[key] = now + self.retry_seconds * 2 ** (attempts - 1)
+                self._counters["retried"] += 1
+            self._cond.notify()
+        if dropped:
+            log.error("Giving up winner recompute after %d attempts for %s", self.max_attempts, dropped)
+
+
+def _recompute_winners(pairs):
+    from services.schedule_service import select_winners
+    with connection_scope("winner-recompute"):
+        select_winners(pairs)
+
+
+recompute_queue = WinnerRecomputeQueue(_recompute_winners)
+
+
+def enqueue_winner_recompute(line_name, frame):
+    recompute_queue.enqueue(line_name, frame)
@@ -1,5 +1,10 @@
 from db.connection import get_connection
+from db.events import notify_all
+from psycopg2.extras import Json
 from utils.validation import validate_fields
+from services.line_catalog import line_catalog
+from services.planner import plan_blocks, plan_cache
+from services.recompute_queue import enqueue_winner_recompute
 from datetime import datetime, timedelta
 
 # Idősávok
@@ -23,6 +28,10 @@ FRAME_CAP_MULTIPLIER = {
 INTENSITY_REF = 4.0           # Gyakorisági referenciaérték
 CAP_BASE = 10000              # Alapértelmezett licitkorlát
 CAP_K = 10000                 # Számított licitkorlát
+KM_PER_TICK = 10              # Kifizetési tickenként megtett km
+TICK_MINUTES = 10             # Kifizetési tickek közötti idő
+TICKS_PER_FRAME = 24          # Kifizetési tickek száma idősávonként
+PAYOUT_CATCHUP_HOURS = 24     # Újraindításkor legfeljebb ennyi órányi kimaradt tick pótlódik
 
 # Segédfüggvények a licitkorlát számításához
 def _intensity_from_frequency(freq_min: int) -> float:
@@ -51,8 +60,8 @@ def _now_minutes(now: datetime | None = None) -> int:
 
 def _frame_tick_index(now: datetime | None, start_min: int) -> int:
     now_min = _now_minutes(now)
-    idx = (now_min - start_min) // 10
-    return max(0, min(23, idx))
+    idx = (now_min - start_min) // TICK_MINUTES
+    return max(0, min(TICKS_PER_FRAME - 1, idx))
 
 #segédfüggvény az aktuális idősáv lekéréséhez
 def _current_frame(now: datetime | None = None):
@@ -64,50 +73,122 @@ def _current_frame(now: datetime | None = None):
             return name, start_min, end_min
     return None, None, None
 
-# Kifizetés és kilóméter óra állítása az aktív menetrendekhez
+# Esedékes kifizetési tickek (dátum, idősáv, tick index, időpont) a megadott időintervallumban
+def _due_ticks(since: datetime, until: datetime):
+    ticks = []
+    day = since.date()
+    while day <= until.date():
+        midnight = datetime.combine(day, datetime.min.time())
+        for name, (start_s, _) in FRAMES.items():
+            start_min = _parse_time(start_s)
+            for idx in range(TICKS_PER_FRAME):
+                tick_at = midnight + timedelta(minutes=start_min + TICK_MINUTES * idx)
+                if since <= tick_at <= until:
+                    ticks.append((day, name, idx, tick_at))
+        day += timedelta(days=1)
+    return ticks
+
+# A kifizetési napló legkorábbi bejegyzése (üres naplónál None)
+def _first_ledger_tick(cur):
+    cur.execute("SELECT MIN(tick_at) AS first_tick FROM payout_ticks")
+    row = cur.fetchone()
+    return row["first_tick"] if row else None
+
+# Tickek lefoglalása a naplóban és kifizetésük egy menetben, ugyanabban a tranzakcióban
+def _pay_ticks(cur, ticks):
+    if not ticks:
+        return []
+
+    cur.execute("""
+        INSERT INTO payout_ticks (pay_date, frame, tick_idx, tick_at)
+        SELECT * FROM unnest(%s::date[], %s::text[], %s::int[], %s::timestamp[])
+        ON CONFLICT DO NOTHING
+        RETURNING frame, tick_idx
+    """, (
+        [t[0] for t in ticks],
+        [t[1] for t in ticks],
+        [t[2] for t in ticks],
+        [t[3] for t in ticks],
+    ))
+    claimed = cur.fetchall()
+    if not claimed:
+        return []
+
+    frames = [r["frame"] for r in claimed]
+    tick_idxs = [r["tick_idx"] for r in claimed]
+
+    # A licit 24 részletben kerül kifizetésre, a maradékot az első tickek kapják.
+    # Pótláskor a jelenleg aktív menetrendek kapják a kimaradt részleteket.
+    cur.execute("""
+        UPDATE users u
+        SET balance = u.balance + p.amount
+        FROM (
+            SELECT s.username,
+                   SUM(s.bid_price / 24 + CASE WHEN t.tick_idx < s.bid_price %% 24 THEN 1 ELSE 0 END) AS amount
+            FROM schedules s
+            JOIN unnest(%s::text[], %s::int[]) AS t(frame, tick_idx) ON t.frame = s.frame
+            WHERE s.status = 'active'
+            GROUP BY s.username
+        ) p
+        WHERE u.username = p.username AND p.amount > 0
+        RETURNING u.username, p.amount, u.balance
+    """, (frames, tick_idxs))
+    credited = cur.fetchall()
+
+    # A megtett km csak a naplóba kerül; a bus.km-et a busz_service.flush_km_events frissíti kötegekben
+    cur.execute("""
+        INSERT INTO bus_km_events (bus_plate, km)
+        SELECT sa.bus_plate, %s * COUNT(*)
+        FROM schedule_assignments sa
+        JOIN schedules s ON s.id = sa.schedule_id
+        JOIN unnest(%s::text[], %s::int[]) AS t(frame, tick_idx) ON t.frame = s.frame
+        WHERE s.status = 'active'
+        GROUP BY sa.bus_plate
+    """, (KM_PER_TICK, frames, tick_idxs))
+
+    notify_all(cur, [
+        {"type": "balance_changed", "username": r["username"], "delta": int(r["amount"]),
+         "balance": r["balance"], "reason": "payout"}
+        for r in credited
+    ])
+    return claimed
+
+# Kifizetés és kilóméter óra állítása az aktív menetrendekhez.
+# Az aktuális idősáv még ki nem fizetett tickjeit is pótolja (pl. késve lefutó ütemező esetén).
 def payout_for_active_schedules(now: datetime | None = None):
+    now = now or datetime.now()
     frame_name, start_min, end_min = _current_frame(now)
     if not frame_name:
-        return 
+        return []
 
     tick_idx = _frame_tick_index(now, start_min)
+    frame_start = datetime.combine(now.date(), datetime.min.time()) + timedelta(minutes=start_min)
+    current_tick_at = frame_start + timedelta(minutes=TICK_MINUTES * tick_idx)
 
     conn = get_connection()
     with conn.cursor() as cur:
-        cur.execute("""
-            SELECT id, username, bid_price
-            FROM schedules
-            WHERE status = 'active' AND frame = %s
-        """, (frame_name,))
-        rows = cur.fetchall()
-
-        for row in rows:
-            bid = int(row["bid_price"])
-            base = bid // 24
-            rem = bid % 24
-            inc = base + (1 if tick_idx < rem else 0)
-            if inc > 0:
-                cur.execute("""
-                    UPDATE users SET balance = balance + %s
-                    WHERE username = %s
-                """, (inc, row["username"]))
-            print(f"Payout tick for frame '{frame_name}' on schedule '{row['id']}' completed, with balance: {inc}.")
-
-            cur.execute("""
-                SELECT bus_plate
-                FROM schedule_assignments
-                WHERE schedule_id = %s
-            """, (row["id"],))
-            assigned_buses = [r["bus_plate"] for r in cur.fetchall()]
-            for rendszam in assigned_buses:
-                cur.execute(
-                    "UPDATE bus SET km = COALESCE(km, 0) + 10 WHERE plate = %s",
-                    (rendszam,)
-                )
-            if assigned_buses:
-                print(f"Updated km (+10) for {len(assigned_buses)} bus(es) on schedule {row['id']}.")
+        first_tick = _first_ledger_tick(cur)
+        since = current_tick_at if first_tick is None else max(frame_start, min(first_tick, current_tick_at))
+        paid = _pay_ticks(cur, _due_ticks(since, now))
+        conn.commit()
+    if paid:
+        print(f"Payout for frame '{frame_name}' completed, ticks paid: {sorted(r['tick_idx'] for r in paid)}.")
+    return paid
 
+# Újraindítás utáni pótlás: a napló első bejegyzése óta kimaradt tickek kifizetése egy menetben
+def catch_up_missed_payouts(now: datetime | None = None):
+    now = now or datetime.now()
+    conn = get_connection()
+    with conn.cursor() as cur:
+        first_tick = _first_ledger_tick(cur)
+        if first_tick is None:
+            return []
+        since = max(now - timedelta(hours=PAYOUT_CATCHUP_HOURS), first_tick)
+        paid = _pay_ticks(cur, _due_ticks(since, now))
         conn.commit()
+    if paid:
+        print(f"Caught up {len(paid)} missed payout tick(s).")
+    return paid
 
 # Menetrend lekérdezése azonosító alapján
 def get_schedule(schedule_id):
@@ -120,6 +201,17 @@ def get_schedule(schedule_id):
         """, (schedule_id,))
         return cur.fetchone()
 
+# Menetrend a tárolt tervvel együtt; a terv csak a buszelosztáshoz kell, a menetrend-végpontokon nem jelenik meg
+def _get_schedule_with_plan(schedule_id):
+    conn = get_connection()
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT id, line_name, start_time, end_time, frequency, plan
+            FROM schedules
+            WHERE id = %s
+        """, (schedule_id,))
+        return cur.fetchone()
+
 # Menetrendek lekérdezése adott felhasználónak
 def list_schedules_for_user(username):
     conn = get_connection()
@@ -163,19 +255,19 @@ def create_schedule(username, data):
     if float(data["bid_price"]) > cap:
         return {"error": f"Bid exceeds cap ({cap:.2f}) for frequency {data['frequency']} min"}, 400
 
-    conn = get_connection()
+    line_row = line_catalog.get(data["line_name"])
+    if not line_row or line_row.get("provider_garage_id") is None:
+        return {"error": f"Line '{data['line_name']}' not found or missing provider garage"}, 400
+    provider_garage_id = int(line_row["provider_garage_id"])
 
-    with conn.cursor() as cur:
-        cur.execute("SELECT provider_garage_id FROM lines WHERE name = %s", (data["line_name"],))
-        line_row = cur.fetchone()
-        if not line_row or line_row.get("provider_garage_id") is None:
-            return {"error": f"Line '{data['line_name']}' not found or missing provider garage"}, 400
-        provider_garage_id = int(line_row["provider_garage_id"])
+    plan = _plan_for_line_row(line_row, start_time, end_time, data["frequency"])
 
+    conn = get_connection()
     with conn.cursor() as cur:
         cur.execute("""
-            INSERT INTO schedules (username, line_name, garage_id, frame, start_time, end_time, frequency, bid_price, status)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 'pending')
+            INSERT INTO schedules (username, line_name, garage_id, frame, start_time, end_time, frequency, bid_price, status,
+                                   required_blocks, plan)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 'pending', %s, %s)
             RETURNING id, line_name, frame
         """, (
             username,
@@ -185,12 +277,14 @@ def create_schedule(username, data):
             start_time,
             end_time,
             data["frequency"],
-            data["bid_price"]
+            data["bid_price"],
+            len(plan["blocks"]) if plan else None,
+            Json(plan) if plan else None
         ))
         schedule = cur.fetchone()
         conn.commit()
 
-    select_winner_for_line_frame(schedule["line_name"], schedule["frame"])
+    enqueue_winner_recompute(schedule["line_name"], schedule["frame"])
     return {"message": "Schedule created", "id": schedule["id"]}
 
 # Menetrend módosítása
@@ -206,21 +300,35 @@ def update_schedule(schedule_id, data):
     if float(current["bid_price"]) > cap:
         return {"error": f"Current bid ({current['bid_price']}) exceeds cap ({cap:.2f}) for new frequency {data['frequency']} min"}, 400
 
+    # A gyakoriság változásával a tárolt terv is újraszámolódik
+    travel_time_garage, travel_time_line = get_line_times(current["line_name"])
+    plan = _plan_for_line_row(
+        {"travel_time_garage": travel_time_garage, "travel_time_line": travel_time_line},
+        current["start_time"].strftime("%H:%M"),
+        current["end_time"].strftime("%H:%M"),
+        data["frequency"]
+    )
+
     conn = get_connection()
     with conn.cursor() as cur:
         cur.execute("""
             UPDATE schedules
-            SET frequency = %s
+            SET frequency = %s, required_blocks = %s, plan = %s
             WHERE id = %s
             RETURNING line_name, frame
-        """, (data["frequency"], schedule_id))
+        """, (
+            data["frequency"],
+            len(plan["blocks"]) if plan else None,
+            Json(plan) if plan else None,
+            schedule_id
+        ))
         updated = cur.fetchone()
         if not updated:
             return {"error": "Schedule not found"}, 404
         
         conn.commit()
 
-    select_winner_for_line_frame(updated["line_name"], updated["frame"])
+    enqueue_winner_recompute(updated["line_name"], updated["frame"])
     return {"message": "Schedule updated"}
 
 # Menetrend törlése
@@ -238,23 +346,15 @@ def delete_schedule(schedule_id):
         conn.commit()
 
     if schedule:
-        select_winner_for_line_frame(schedule["line_name"], schedule["frame"])
+        enqueue_winner_recompute(schedule["line_name"], schedule["frame"])
     return {"message": "Schedule deleted"}
 
-# A vonal futamidejének és garázsmeneti idejének lekérdezése
+# A vonal futamideje és garázsmeneti ideje a vonalkatalógusból
 def get_line_times(line_name):
-    conn = get_connection()
-    with conn.cursor() as cur:
-        cur.execute("""
-            SELECT travel_time_garage, travel_time_line
-            FROM lines
-            WHERE name = %s
-        """, (line_name,))
-        result = cur.fetchone()
-
-        if result:
-            return result["travel_time_garage"], result["travel_time_line"]
-        return None, None
+    line = line_catalog.get(line_name)
+    if line:
+        return line["travel_time_garage"], line["travel_time_line"]
+    return None, None
 
 # Menetrendek lekérdezése adott vonalhoz
 def list_schedules_for_line(line_name):
@@ -303,46 +403,115 @@ def get_line_winners():
             })
         return winners
 
-# Aktív menetrend kiválasztása adott vonalhoz és idősávhoz
-def select_winner_for_line_frame(line_name, frame):
-    conn = get_connection()
-    with conn.cursor() as cur:
-        cur.execute("""
-            SELECT id, frequency, bid_price
-            FROM schedules
-            WHERE line_name = %s AND frame = %s
-        """, (line_name, frame))
-        schedules = cur.fetchall()
+# Terv készítése a vonal menetidejei alapján (hiányzó menetidő esetén None)
+def _plan_for_line_row(line_row, start_time, end_time, frequency):
+    if line_row.get("travel_time_garage") is None or line_row.get("travel_time_line") is None or int(frequency) <= 0:
+        return None
+    return build_plan(int(line_row["travel_time_garage"]), int(line_row["travel_time_line"]), start_time, end_time, int(frequency))
+
+# Érvénytelenített (NULL) blokkszámok újraszámolása és tárolása
+def _backfill_required_blocks(cur, line_name, schedules):
+    stale = [s for s in schedules if s["required_blocks"] is None]
+    if not stale:
+        return
+    # Menetidő-változás után fut (a trigger nullázta a blokkszámokat), ezért a tranzakción belül olvas:
+    # a katalógus értesítése ekkor még késhet, a régi menetidővel számolt terv pedig tárolódna
+    cur.execute("SELECT travel_time_garage, travel_time_line FROM lines WHERE name = %s", (line_name,))
+    line_row = cur.fetchone() or {}
+    for s in stale:
+        plan = _plan_for_line_row(line_row, s["start_time"].strftime("%H:%M"), s["end_time"].strftime("%H:%M"), s["frequency"])
+        if plan is None:
+            s["required_blocks"] = 0
+            continue
+        s["required_blocks"] = len(plan["blocks"])
+        cur.execute(
+            "UPDATE schedules SET required_blocks = %s, plan = %s WHERE id = %s",
+            (s["required_blocks"], Json(plan), s["id"])
+        )
 
-        if not schedules:
-            return None
+# Nyertes kiválasztása egy vonal/idősáv versenyző menetrendjei közül (None, ha nincs jogosult)
+def _rank_winner(schedules, frame):
+    eligible = []
+    for s in schedules:
+        if not s["required_blocks"] or s["assigned_blocks"] != s["required_blocks"]:
+            continue
 
-        eligible = []
-        for s in schedules:
-            if not has_all_assignments(s["id"]):
-                continue
+        headway = int(s["frequency"])
+        intensity = _intensity_from_frequency(headway)
+        cap = _bid_cap_for_intensity(intensity, frame)
+        if float(s["bid_price"]) <= cap:
+            eligible.append({**s, "headway": headway, "intensity": intensity, "cap": cap})
+
+    if not eligible:
+        return None
+    eligible.sort(key=lambda s: (-s["intensity"], float(s["bid_price"])))
+    return eligible[0]["id"]
+
+# Aktív menetrendek kiválasztása több (vonal, idősáv) párhoz egy menetben.
+# Csak a ténylegesen megváltozott státuszok íródnak vissza, egyetlen UPDATE-tel.
+def select_winners(pairs):
+    pairs = list(dict.fromkeys((line_name, frame) for line_name, frame in pairs))
+    if not pairs:
+        return {}
 
-            headway = int(s["frequency"])
-            intensity = _intensity_from_frequency(headway)
-            cap = _bid_cap_for_intensity(intensity, frame)
-            if float(s["bid_price"]) <= cap:
-                eligible.append({**s, "headway": headway, "intensity": intensity, "cap": cap})
+    conn = get_connection()
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT s.id, s.line_name, s.frame, s.frequency, s.bid_price, s.status, s.start_time, s.end_time,
+                   s.required_blocks, COUNT(sa.block_idx) AS assigned_blocks
+            FROM schedules s
+            JOIN unnest(%s::text[], %s::text[]) AS p(line_name, frame)
+              ON p.line_name = s.line_name AND p.frame = s.frame
+            LEFT JOIN schedule_assignments sa ON sa.schedule_id = s.id
+            GROUP BY s.id
+            ORDER BY s.id
+        """, ([p[0] for p in pairs], [p[1] for p in pairs]))
+        rows = cur.fetchall()
+        if not rows:
+            return {pair: None for pair in pairs}
 
-        if not eligible:
+        by_pair = {}
+        by_line = {}
+        for row in rows:
+            by_pair.setdefault((row["line_name"], row["frame"]), []).append(row)
+            by_line.setdefault(row["line_name"], []).append(row)
+        for line_name, line_rows in by_line.items():
+            _backfill_required_blocks(cur, line_name, line_rows)
+
+        winners = {}
+        changed_ids, changed_statuses = [], []
+        events = []
+        for pair in pairs:
+            schedules = by_pair.get(pair, [])
+            winner_id = _rank_winner(schedules, pair[1]) if schedules else None
+            winners[pair] = winner_id
+            previous_id = next((s["id"] for s in schedules if s["status"] == "active"), None)
+            if previous_id != winner_id:
+                events.append({"type": "winner_changed", "line_name": pair[0], "frame": pair[1],
+                               "schedule_id": winner_id, "previous_id": previous_id})
             for s in schedules:
-                cur.execute("UPDATE schedules SET status = 'pending' WHERE id = %s", (s["id"],))
-            conn.commit()
-            return None
+                if winner_id is None:
+                    status = "pending"
+                else:
+                    status = "active" if s["id"] == winner_id else "lost"
+                if s["status"] != status:
+                    changed_ids.append(s["id"])
+                    changed_statuses.append(status)
 
-        eligible.sort(key=lambda s: (-s["intensity"], float(s["bid_price"])))
-        winner_id = eligible[0]["id"]
-        for s in schedules:
-            cur.execute(
-                "UPDATE schedules SET status = %s WHERE id = %s",
-                ("active" if s["id"] == winner_id else "lost", s["id"])
-            )
+        if changed_ids:
+            cur.execute("""
+                UPDATE schedules s
+                SET status = v.status
+                FROM unnest(%s::int[], %s::text[]) AS v(id, status)
+                WHERE s.id = v.id
+            """, (changed_ids, changed_statuses))
+        notify_all(cur, events)
         conn.commit()
-    return winner_id
+    return winners
+
+# Aktív menetrend kiválasztása adott vonalhoz és idősávhoz
+def select_winner_for_line_frame(line_name, frame):
+    return select_winners([(line_name, frame)]).get((line_name, frame))
 
 # Indulási időpontok generálása adott intervallumban és gyakorisággal
 def generate_slots(start_time, end_time, frequency):
@@ -370,20 +539,35 @@ def generate_slots(start_time, end_time, frequency):
         t += int(frequency)
     return slots
 
-# Menetrend elosztása buszok indulásaihoz a generált indulási időpontok alapján
+# Buszblokkok tervezése a generált indulási időpontok alapján (adatbázis-hozzáférés nélkül).
+# Az azonos bemenetű tervek a gyorsítótárból érkeznek; a kézi hozzárendelést a hívó teszi rá.
+def build_plan(travel_time_garage, travel_time_line, start_time, end_time, frequency):
+    key = (int(travel_time_garage), int(travel_time_line), start_time, end_time, int(frequency))
+
+    def build():
+        slots = generate_slots(start_time, end_time, frequency)
+        return {
+            "travel_time_line": key[1],
+            "travel_time_garage": key[0],
+            "slots": slots,
+            "blocks": plan_blocks(slots, key[0], key[1]),
+        }
+
+    return plan_cache.get_or_build(key, build)
+
+# Menetrend elosztása buszok indulásaihoz; a tárolt tervet használja, ha az még érvényes
 def plan_buses_for_schedule(schedule_id):
 
-    schedule = get_schedule(schedule_id)
+    schedule = _get_schedule_with_plan(schedule_id)
     if not schedule:
         return {"error": "Schedule not found"}, 404
 
     line_name = schedule["line_name"]
-    travel_time_garage, travel_time_line = get_line_times(line_name)
-    if travel_time_garage is None or travel_time_line is None:
-        return {"error": f"Line '{line_name}' not found or missing travel times"}, 404
-
-    travel_time_garage = int(travel_time_garage)
-    travel_time_line = int(travel_time_line)
+    plan = schedule.get("plan")
+    if plan is None:
+        travel_time_garage, travel_time_line = get_line_times(line_name)
+        if travel_time_garage is None or travel_time_line is None:
+            return {"error": f"Line '{line_name}' not found or missing travel times"}, 404
 
     start_time = schedule["start_time"].strftime("%H:%M") if schedule["start_time"] else None
     end_time = schedule["end_time"].strftime("%H:%M") if schedule["end_time"] else None
@@ -392,81 +576,9 @@ def plan_buses_for_schedule(schedule_id):
     if not start_time or not end_time or frequency <= 0:
         return {"error": "Invalid schedule time window or frequency"}, 400
 
-    slots = generate_slots(start_time, end_time, frequency)
-
-    def to_min(tstr: str) -> int:
-        h, m = map(int, tstr.split(":"))
-        return h * 60 + m
-
-    def to_str(mins: int) -> str:
-        mins_mod = mins % (24 * 60) 
-        h = (mins_mod // 60) % 24
-        m = mins_mod % 60
-        return f"{h:02d}:{m:02d}"
-
-    slot_minutes = [to_min(s) for s in slots]
-
-    MAX_CONTINUOUS = 240
-    BREAK_MINUTES = 30
-
-    class Bus:
-        __slots__ = (
-            "idx",
-            "departures",
-            "breaks",
-            "duty_start",
-            "shift_start",     
-            "last_trip_end",   
-            "next_available", 
-        )
-
-        def __init__(self, idx: int, first_dep: int):
-            self.idx = idx
-            self.departures = [first_dep]
-            self.breaks = []
-            self.duty_start = first_dep - travel_time_garage
-            self.shift_start = self.duty_start
-            self.last_trip_end = first_dep + 2 * travel_time_line
-            self.next_available = self.last_trip_end
-
-    buses = []
-
-    for dep in slot_minutes:
-        assigned = False
-
-        buses.sort(key=lambda b: b.next_available)
-
-        for b in buses:
-            if dep < b.next_available:
-                continue
-
-            worked_since_break_at_dep = dep - b.shift_start
+    if plan is None:
+        plan = build_plan(int(travel_time_garage), int(travel_time_line), start_time, end_time, frequency)
 
-            if worked_since_break_at_dep >= MAX_CONTINUOUS:
-                gap = dep - b.last_trip_end
-                if gap >= BREAK_MINUTES:
-                    break_start = b.last_trip_end
-                    break_end = break_start + BREAK_MINUTES
-                    b.breaks.append({"start": break_start, "end": break_end})
-                    b.shift_start = break_end
-                    b.next_available = max(b.next_available, break_end)
-
-                    if dep < b.next_available:
-                        continue
-                    
-                else:
-                    continue
-
-            b.departures.append(dep)
-            b.last_trip_end = dep + 2 * travel_time_line
-            b.next_available = b.last_trip_end
-            assigned = True
-            break
-
-        if not assigned:
-            buses.append(Bus(len(buses) + 1, dep))
-
-    assignments = []
     conn = get_connection()
     with conn.cursor() as cur:
         cur.execute("""
@@ -474,41 +586,44 @@ def plan_buses_for_schedule(schedule_id):
         """, (schedule_id,))
         manual = {row["block_idx"]: row["bus_plate"] for row in cur.fetchall()}
 
-    for idx, b in enumerate(buses):
-        duty_end = b.last_trip_end + travel_time_garage 
-        assignments.append({
-            "bus_id": b.idx,
-            "duty_start": to_str(b.duty_start),
-            "duty_end": to_str(duty_end),
-            "departures": [to_str(t) for t in b.departures],
-            "breaks": [{"start": to_str(br["start"]), "end": to_str(br["end"])} for br in b.breaks],
-            "assigned_bus": manual.get(idx) 
-        })
+    assignments = [
+        {**block, "assigned_bus": manual.get(idx)}
+        for idx, block in enumerate(plan["blocks"])
+    ]
 
     return {
         "schedule_id": schedule_id,
         "line_name": line_name,
-        "travel_time_line": travel_time_line,
-        "travel_time_garage": travel_time_garage,
+        "travel_time_line": plan["travel_time_line"],
+        "travel_time_garage": plan["travel_time_garage"],
         "start_time": start_time,
         "end_time": end_time,
         "frequency": frequency,
-        "slots": slots,
-        "buses_used": len(buses),
+        "slots": plan["slots"],
+        "buses_used": len(plan["blocks"]),
         "assignments": assignments,
     }
 
-# Teljes hozzárendeltség ellenőrzése
+# Teljes hozzárendeltség ellenőrzése a tárolt blokkszám alapján
 def has_all_assignments(schedule_id):
     conn = get_connection()
     with conn.cursor() as cur:
-        plan = plan_buses_for_schedule(schedule_id)
-        required_blocks = len(plan["assignments"]) if plan and "assignments" in plan else 0
-
-        cur.execute("SELECT COUNT(*) AS count FROM schedule_assignments WHERE schedule_id = %s", (schedule_id,))
+        cur.execute("""
+            SELECT s.required_blocks, COUNT(sa.block_idx) AS assigned_blocks
+            FROM schedules s
+            LEFT JOIN schedule_assignments sa ON sa.schedule_id = s.id
+            WHERE s.id = %s
+            GROUP BY s.id
+        """, (schedule_id,))
         row = cur.fetchone()
-        assigned_blocks = row["count"] if row and "count" in row else 0
-        return assigned_blocks == required_blocks and required_blocks > 0
+        if not row:
+            return False
+
+        required_blocks = row["required_blocks"]
+        if required_blocks is None:
+            plan = plan_buses_for_schedule(schedule_id)
+            required_blocks = len(plan["assignments"]) if plan and "assignments" in plan else 0
+        return row["assigned_blocks"] == required_blocks and required_blocks > 0
 
 # Buszok menetrendi elosztásának mentése
 def save_manual_assignments(schedule_id: int, assignments: dict, username: str):
@@ -586,9 +701,6 @@ def save_manual_assignments(schedule_id: int, assignments: dict, username: str):
 
         conn.commit()
 
-    # Aktív menetrend újraszámítása
-    try:
-        select_winner_for_line_frame(schedule["line_name"], schedule["frame"])
-    except Exception:
-        pass
+    # Aktív menetrend újraszámítása a háttérsorban
+    enqueue_winner_recompute(schedule["line_name"], schedule["frame"])
     return {"message": "Assignments saved"}, 200
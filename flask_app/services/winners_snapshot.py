@@ -0,0 +1,35 @@
+import json
+from db.versions import VersionedCache, table_versions
+from services.schedule_service import get_line_winners
+
+
+# A nyertesek (aktív menetrendek) előre szerializált pillanatképe a /lines/winners végponthoz.
+# Csak akkor épül újra, ha aktív menetrend változott (az "active_schedules" verzió, lásd a 10-es
+# migrációt); addig a kiszolgálás adatbázis nélkül, a kész bájtokból történik. Soronként külön
+# szerializált, így a vonal vagy idősáv szerinti szűrés is csak a kész darabok összefűzése.
+class WinnersSnapshot(VersionedCache):
+    def __init__(self, versions=table_versions):
+        super().__init__(("active_schedules",), versions)
+
+    def serialized(self, line_name=None, frame=None):
+        rows = self.value()
+        return b"[" + b",".join(
+            body for row_line, row_frame, body in rows
+            if (line_name is None or row_line == line_name) and (frame is None or row_frame == frame)
+        ) + b"]"
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats["size"] = len(self._value) if self._value is not None else None
+        return stats
+
+    def _build(self):
+        return [
+            (winner["line_name"], winner["frame"],
+             json.dumps(winner, sort_keys=True, separators=(",", ":")).encode())
+            for winner in sorted(get_line_winners(), key=lambda w: (w["line_name"], w["frame"] or "", w["id"]))
+        ]
+
+
+winners_snapshot = WinnersSnapshot()
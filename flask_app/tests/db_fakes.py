@@ -1,3 +1,18 @@
+from contextlib import contextmanager
+from db.connection import record_query, record_rows, track_queries
+
+
+# Legfeljebb max_queries lekérdezés futhat a blokkban (pl. egy végpont hívása a tesztkliensen át);
+# a helyettesítő kurzor is a futó mérésbe jelent. Túllépéskor a lekérdezés-alakok a hibaüzenetben.
+@contextmanager
+def assert_max_queries(max_queries):
+    with track_queries() as stats:
+        yield stats
+    if stats.queries > max_queries:
+        statements = "\n".join(f"  {count}× {statement}" for statement, count in stats.statements.most_common())
+        raise AssertionError(f"Expected at most {max_queries} queries, got {stats.queries}:\n{statements}")
+
+
 class StepDrivenFakeCursor:
     def __init__(self, steps=None):
         self.steps = steps or []
@@ -6,9 +21,11 @@ class StepDrivenFakeCursor:
         self.queries = []
         self.params_list = []
         self.rowcount = 0
+        self.copied = []
 
     def execute(self, query, params=None):
         normalized = " ".join(query.split())
+        record_query(normalized)
         self.queries.append(normalized)
         self.params_list.append(params)
         if self.step_index >= len(self.steps):
@@ -21,16 +38,31 @@ class StepDrivenFakeCursor:
         self.rowcount = step.get("rowcount", 0)
         self.last_step = step
         self.step_index += 1
+        if "raise" in step:
+            raise step["raise"]
 
     def fetchone(self):
         if not self.last_step or self.last_step.get("fetch") != "one":
             raise AssertionError("fetchone called without matching 'one' step")
-        return self.last_step.get("result")
+        result = self.last_step.get("result")
+        record_rows(0 if result is None else 1)
+        return result
 
     def fetchall(self):
         if not self.last_step or self.last_step.get("fetch") != "all":
             raise AssertionError("fetchall called without matching 'all' step")
-        return self.last_step.get("result") or []
+        result = self.last_step.get("result") or []
+        record_rows(len(result))
+        return result
+
+    # COPY ... FROM STDIN: a kurzornak átadott adat a "copied" listába kerül
+    def copy_expert(self, sql, file):
+        self.copied.append(file.read())
+        self.execute(sql)
+
+    # Nevesített (szerveroldali) kurzor bejárása
+    def __iter__(self):
+        return iter(self.fetchall())
 
     def __enter__(self):
         return self
@@ -44,10 +76,17 @@ class FakeConnection:
         self.cursor_obj = StepDrivenFakeCursor(steps or [])
         self.commit_called = False
         self.commit_count = 0
+        self.rollback_count = 0
+        self.cursor_names = []
 
-    def cursor(self):
+    def cursor(self, name=None):
+        if name is not None:
+            self.cursor_names.append(name)
         return self.cursor_obj
 
     def commit(self):
         self.commit_called = True
         self.commit_count += 1
+
+    def rollback(self):
+        self.rollback_count += 1
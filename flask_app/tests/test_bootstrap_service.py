@@ -0,0 +1,58 @@
+import unittest
+from contextlib import ExitStack
+from unittest.mock import patch
+from services import bootstrap_service, busz_service, garage_service, hiba_service, market_service
+from db_fakes import FakeConnection
+
+
+class TestBootstrapService(unittest.TestCase):
+    # A kérés minden szolgáltatása ugyanazt a kapcsolatot kapja, ahogy a get_connection() egy kérésen belül
+    def run_bootstrap(self, steps, *args):
+        fake_conn = FakeConnection(steps=steps)
+        with ExitStack() as stack:
+            for module in (busz_service, garage_service, hiba_service, market_service):
+                stack.enter_context(patch.object(module, 'get_connection', return_value=fake_conn))
+            return bootstrap_service.market_bootstrap(*args), fake_conn
+
+    def test_market_bootstrap_anonymous(self):
+        steps = [
+            {"expect": "FROM market_listings ml", "params": (51,), "fetch": "all", "result": [
+                {"listing_id": 3, "bus_plate": "AAA-111", "seller_username": "bob", "price": 900,
+                 "created_at": "2025-01-01", "type": "Volvo", "km": 10, "year": 2005, "garage": 1}]},
+            {"expect": "FROM bus WHERE owner IS NULL", "params": (51,), "fetch": "all", "result": [
+                {"plate": "BBB-222", "type": "Ikarus", "km": 0, "year": 1999, "price_km": 0}]},
+            {"expect": "FROM unnest(%s::varchar[]) AS p(plate)", "params": (["AAA-111", "BBB-222"],), "fetch": "all",
+             "result": [{"plate": "AAA-111", "open_issues": 1, "open_repair_cost": 50, "total_repair_cost": 70}]},
+        ]
+        state, fake_conn = self.run_bootstrap(steps)
+        self.assertEqual([l["listing_id"] for l in state["listings"]["items"]], [3])
+        self.assertEqual(state["market"]["items"][0]["price"], 100000)
+        self.assertEqual(state["my_listings"], [])
+        self.assertEqual(state["garages"], [])
+        self.assertEqual(state["my_buses"], [])
+        self.assertTrue(state["models"])
+        self.assertEqual(state["issue_summary"]["AAA-111"]["open_issues"], 1)
+        self.assertFalse(fake_conn.commit_called)
+
+    def test_market_bootstrap_for_user(self):
+        listing = {"listing_id": 4, "bus_plate": "MY-1", "seller_username": "alice", "price": 900,
+                   "created_at": "2025-01-01", "type": "Volvo", "km": 10, "year": 2005, "garage": 1}
+        steps = [
+            {"expect": "AND ml.seller_username <> %s", "params": ("alice", 51), "fetch": "all", "result": []},
+            {"expect": "FROM bus WHERE owner IS NULL", "fetch": "all", "result": []},
+            {"expect": "AND ml.seller_username = %s", "params": ("alice", 201), "fetch": "all", "result": [listing]},
+            {"expect": "LEFT JOIN user_garages", "params": ("alice",), "fetch": "all", "result": [{"id": 1, "unlocked": True}]},
+            {"expect": "SELECT plate AS plate, type AS type FROM bus WHERE owner = %s", "params": ("alice",),
+             "fetch": "all", "result": [{"plate": "MY-1", "type": "Volvo"}]},
+            {"expect": "FROM unnest(%s::varchar[])", "params": (["MY-1"],), "fetch": "all", "result": []},
+        ]
+        state, fake_conn = self.run_bootstrap(steps, "alice")
+        self.assertEqual(state["my_listings"], [listing])
+        self.assertEqual(state["garages"], [{"id": 1, "unlocked": True}])
+        self.assertEqual(state["my_buses"], [{"plate": "MY-1", "type": "Volvo"}])
+        self.assertEqual(state["issue_summary"], {})
+        self.assertEqual(fake_conn.cursor().step_index, len(steps))
+
+
+if __name__ == "__main__":
+    unittest.main()
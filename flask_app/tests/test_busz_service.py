@@ -1,7 +1,18 @@
+import io
 import unittest
 from unittest.mock import patch
+from flask import Flask
+from routes import busz as busz_route
 from services import busz_service
-from db_fakes import FakeConnection
+from db_fakes import FakeConnection, assert_max_queries
+
+
+class FakeVersions:
+    def __init__(self, versions):
+        self.versions = versions
+
+    def current(self, tables):
+        return None if self.versions is None else ("epoch", *(self.versions.get(t, 0) for t in tables))
 
 class TestBuszService(unittest.TestCase):
 
@@ -24,6 +35,8 @@ class TestBuszService(unittest.TestCase):
         self.assertIn("WHERE owner = %s", fake_conn.cursor().queries[0])
         self.assertEqual(fake_conn.cursor().params_list[0], ("alice",))
         self.assertEqual(result[0]["owner"], "alice")
+        # A km a még be nem vezetett növekményekkel együtt érkezik
+        self.assertIn("FROM bus_km_events e WHERE e.bus_plate = bus.plate", fake_conn.cursor().queries[0])
 
         # Lekérdezés nem létező felhasználóra
         steps = [{
@@ -72,6 +85,138 @@ class TestBuszService(unittest.TestCase):
                 busz_service.create_bus(bad_data)
         self.assertFalse(fake_conn.commit_called)
 
+    def test_list_buses_projection_filters_and_paging(self):
+        # Csak a kért mezők (és a rendszám) kerülnek a lekérdezésbe
+        steps = [{"expect": "SELECT plate AS plate, type AS type FROM bus WHERE owner = %s AND garage = %s AND status = %s "
+                            "ORDER BY plate ASC, plate ASC LIMIT %s",
+                  "params": ("alice", 2, "KT", 3), "fetch": "all",
+                  "result": [{"plate": "A"}, {"plate": "B"}, {"plate": "C"}]}]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(busz_service, 'get_connection', return_value=fake_conn):
+            page = busz_service.list_buses("alice", False, {"fields": "type", "garage": "2", "status": "KT", "limit": "2"})
+        self.assertEqual(page["items"], [{"plate": "A"}, {"plate": "B"}])
+        self.assertIsNotNone(page["next_cursor"])
+
+        # A következő oldal a kurzor utáni rendszámokkal folytatódik; adminisztrátornál nincs tulajdonos-szűrés
+        steps = [{"expect": "FROM bus WHERE (plate, plate) > (%s, %s) ORDER BY plate", "params": ("B", "B", 51),
+                  "fetch": "all", "result": []}]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(busz_service, 'get_connection', return_value=fake_conn):
+            page = busz_service.list_buses("admin", True, {"cursor": page["next_cursor"]})
+        self.assertEqual(page, {"items": [], "next_cursor": None})
+
+        with self.assertRaises(ValueError):
+            busz_service.list_buses("alice", False, {"fields": "plate,password"})
+
+    def test_buses_conditional_get(self):
+        # A flottaverzió a figyelő számlálója: a 304-hez nem kell adatbázis-lekérdezés
+        app = Flask(__name__)
+        app.secret_key = "test"
+        app.register_blueprint(busz_route.busz_bp)
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess["username"] = "alice"
+        versions = FakeVersions({"fleet:alice": 2})
+        with patch.object(busz_route, "table_versions", versions), \
+                patch.object(busz_route, "list_buses", return_value=[{"plate": "AAA-111"}]) as list_buses:
+            etag = client.get("/buszok").headers["ETag"]
+            with assert_max_queries(0):
+                self.assertEqual(client.get("/buszok", headers={"If-None-Match": etag}).status_code, 304)
+            # Más tulajdonos flottája nem érinti, a saját változása igen
+            versions.versions["fleet:bob"] = 5
+            self.assertEqual(client.get("/buszok", headers={"If-None-Match": etag}).status_code, 304)
+            versions.versions["fleet:alice"] = 3
+            self.assertEqual(client.get("/buszok", headers={"If-None-Match": etag}).status_code, 200)
+            versions.versions = None
+            response = client.get("/buszok", headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("ETag", response.headers)
+        self.assertEqual(list_buses.call_count, 3)
+        self.assertEqual(busz_service.fleet_version_key("admin", True), "fleet")
+
+    def test_import_fleet_csv(self):
+        # A feltöltés COPY-val az ideiglenes táblába kerül, az ellenőrzés és a beszúrás halmazszintű
+        body = b"plate,type,km,year,garage\nIMP-1,Volvo,10,2001,1\nIMP-2,Volvo,x,2001,1\n"
+        steps = [
+            {"expect": "CREATE TEMP TABLE fleet_import"},
+            {"expect": "COPY fleet_import (plate, type, km, year, garage, description, status, line, owner, error) FROM STDIN"},
+            {"expect": "SET error = CASE"},
+            {"expect": "SET error = 'duplicate plate in upload'"},
+            {"expect": "ON CONFLICT (plate) DO NOTHING RETURNING plate", "fetch": "all", "result": [{"plate": "IMP-1"}]},
+            {"expect": "WHERE error IS NOT NULL OR plate <> ALL(%s)", "params": (["IMP-1"],), "fetch": "all",
+             "result": [{"row_no": 2, "plate": "IMP-2", "error": "km must be a non-negative integer"}]},
+        ]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(busz_service, 'get_connection', return_value=fake_conn):
+            res = busz_service.import_fleet(io.BytesIO(body), "text/csv")
+        self.assertEqual(res["inserted"], 1)
+        self.assertEqual(res["rejected"], [{"row": 2, "plate": "IMP-2", "error": "km must be a non-negative integer"}])
+        self.assertEqual(fake_conn.cursor().copied, ["IMP-1,Volvo,10,2001,1,,,,,\nIMP-2,Volvo,x,2001,1,,,,,\n"])
+        self.assertEqual(fake_conn.commit_count, 1)
+
+    def test_import_fleet_csv_malformed_rows(self):
+        # Szerkezetileg hibás sorok (oszlopszám, NUL karakter) nem állítják le a COPY-t, soronként hibák
+        body = (b"plate,type,km,year,garage\nIMP-1,Volvo,10,2001,1\nIMP-2,Volvo,10\n\n"
+                b"IMP-3,Volvo,10,2001,1,extra\nIMP-4,Vol\x00vo,1,2001,1\nIMP-5,\"Volvo, 7700\",1,2001,1\n")
+        steps = [
+            {"expect": "CREATE TEMP TABLE fleet_import"},
+            {"expect": "COPY fleet_import"},
+            {"expect": "SET error = CASE"},
+            {"expect": "SET error = 'duplicate plate in upload'"},
+            {"expect": "INSERT INTO bus", "fetch": "all", "result": [{"plate": "IMP-1"}, {"plate": "IMP-5"}]},
+            {"expect": "plate <> ALL(%s)", "fetch": "all", "result": []},
+        ]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(busz_service, 'get_connection', return_value=fake_conn):
+            busz_service.import_fleet(io.BytesIO(body), "text/csv")
+        self.assertEqual(fake_conn.cursor().copied, [
+            "IMP-1,Volvo,10,2001,1,,,,,\n"
+            "IMP-2,,,,,,,,,\"expected 5 columns, got 3\"\n"
+            "IMP-3,,,,,,,,,\"expected 5 columns, got 6\"\n"
+            "IMP-4,,,,,,,,,invalid characters\n"
+            "IMP-5,\"Volvo, 7700\",1,2001,1,,,,,\n"
+        ])
+
+    def test_import_fleet_ndjson_update(self):
+        # Felülírásnál előbb a meglévő buszok frissülnek; a hibás JSON rekord hibaüzenettel kerül a betöltésbe
+        body = b'{"plate": "OLD-1", "type": "Volvo", "km": 5, "year": 2001, "garage": 1}\nnot json\n'
+        steps = [
+            {"expect": "CREATE TEMP TABLE fleet_import"},
+            {"expect": "COPY fleet_import (plate, type, km, year, garage, description, status, line, owner, error)"},
+            {"expect": "SET error = CASE"},
+            {"expect": "SET error = 'duplicate plate in upload'"},
+            {"expect": "UPDATE bus b SET type = i.type", "fetch": "all", "result": [{"plate": "OLD-1"}]},
+            {"expect": "DELETE FROM bus_km_events WHERE bus_plate = ANY(%s)", "params": (["OLD-1"],)},
+            {"expect": "INSERT INTO bus", "fetch": "all", "result": []},
+            {"expect": "plate <> ALL(%s)", "params": (["OLD-1"],), "fetch": "all",
+             "result": [{"row_no": 2, "plate": None, "error": "invalid JSON record"}]},
+        ]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(busz_service, 'get_connection', return_value=fake_conn):
+            res = busz_service.import_fleet(io.BytesIO(body), "application/x-ndjson", on_conflict="update")
+        self.assertEqual((res["inserted"], res["updated"], res["rejected_count"]), (0, 1, 1))
+        self.assertEqual(fake_conn.cursor().copied, ["OLD-1,Volvo,5,2001,1,,,,,\n,,,,,,,,,invalid JSON record\n"])
+
+    def test_import_fleet_rejects_bad_uploads(self):
+        for body, content_type, mode in [
+            (b"plate,password\n", "text/csv", "skip"),
+            (b"type\n", "text/csv", "skip"),
+            (b"{}", "application/json", "skip"),
+            (b"plate\n", "text/csv", "replace"),
+        ]:
+            with self.assertRaises(ValueError):
+                busz_service.import_fleet(io.BytesIO(body), content_type, mode)
+
+    def test_flush_km_events(self):
+        # A napló kiürítése és a buszonként összevont növekmények bevezetése egyetlen utasítás
+        steps = [{"expect": "WITH drained AS ( DELETE FROM bus_km_events RETURNING bus_plate, km )", "rowcount": 3}]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(busz_service, 'get_connection', return_value=fake_conn):
+            flushed = busz_service.flush_km_events()
+        self.assertEqual(flushed, 3)
+        self.assertEqual(fake_conn.commit_count, 1)
+        self.assertIn("SET km = COALESCE(b.km, 0) + t.km", fake_conn.cursor().queries[0])
+
     def test_update_bus(self):
         # Busz sikeres frissítése
         data = {
@@ -84,6 +229,10 @@ class TestBuszService(unittest.TestCase):
             "fetch": None,
             "result": None,
             "rowcount": 1,
+        }, {
+            # A kézzel megadott km mellett a függő növekmények elvesznek
+            "expect": "DELETE FROM bus_km_events WHERE bus_plate = %s",
+            "params": ("AAA-111",),
         }]
         fake_conn = FakeConnection(steps=steps)
         with patch.object(busz_service, 'get_connection', return_value=fake_conn):
@@ -0,0 +1,33 @@
+import gzip
+import json
+import unittest
+from flask import Flask
+from utils.compression import MIN_COMPRESS_BYTES, compressed_json
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+
+    def test_large_document_is_gzipped_when_accepted(self):
+        payload = {"items": ["x" * 10] * MIN_COMPRESS_BYTES}
+        with self.app.test_request_context(headers={"Accept-Encoding": "gzip, deflate"}):
+            response = compressed_json(payload)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+        self.assertEqual(json.loads(gzip.decompress(response.get_data())), payload)
+
+        with self.app.test_request_context():
+            response = compressed_json(payload)
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.get_json(), payload)
+
+    def test_small_document_is_sent_as_is(self):
+        with self.app.test_request_context(headers={"Accept-Encoding": "gzip"}):
+            response = compressed_json({"ok": True})
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.get_json(), {"ok": True})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+from unittest.mock import patch
+from flask import Flask, jsonify, session
+from utils import conditional
+from utils.conditional import make_etag, not_modified, versioned, with_etag
+
+
+class FakeVersions:
+    def __init__(self, versions=None):
+        self.versions = versions
+
+    def current(self, tables):
+        if self.versions is None:
+            return None
+        return ("epoch", *(self.versions.get(table, 0) for table in tables))
+
+
+class TestConditional(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+
+    def test_etag_depends_on_every_part(self):
+        self.assertEqual(make_etag("buszok", "alice", "3", ""), make_etag("buszok", "alice", "3", ""))
+        self.assertNotEqual(make_etag("buszok", "alice", "3", ""), make_etag("buszok", "alice", "4", ""))
+        self.assertNotEqual(make_etag("buszok", "alice", "3", ""), make_etag("buszok", "alice", "3", "fields=plate"))
+
+    def test_matching_if_none_match_gives_304(self):
+        etag = make_etag("x", 1)
+        with self.app.test_request_context(headers={"If-None-Match": f'W/"{etag}"'}):
+            response = not_modified(etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["ETag"], f'W/"{etag}"')
+        self.assertEqual(response.headers["Cache-Control"], "private, no-cache")
+
+        with self.app.test_request_context(headers={"If-None-Match": '"other"'}):
+            self.assertIsNone(not_modified(etag))
+            response = with_etag(jsonify([]), etag)
+        self.assertEqual(response.headers["ETag"], f'W/"{etag}"')
+
+    def test_versioned_view_answers_304_without_running(self):
+        self.app.secret_key = "test"
+        calls = []
+
+        @self.app.route("/garages")
+        @versioned("garages", "user_garages", per_user=True)
+        def garages():
+            calls.append(session.get("username"))
+            return jsonify([{"id": 1}])
+
+        @self.app.route("/private")
+        @versioned("garages")
+        def private():
+            return jsonify({"error": "Unauthorized"}), 401
+
+        versions = FakeVersions({"garages": 3})
+        client = self.app.test_client()
+        with patch.object(conditional, "table_versions", versions):
+            with client.session_transaction() as sess:
+                sess["username"] = "alice"
+            first = client.get("/garages")
+            etag = first.headers["ETag"]
+            self.assertEqual(first.status_code, 200)
+            self.assertEqual(first.headers["Cache-Control"], "private, no-cache")
+            self.assertEqual(client.get("/garages", headers={"If-None-Match": etag}).status_code, 304)
+            self.assertEqual(calls, ["alice"])
+
+            # Más felhasználó vagy újabb táblaverzió esetén a nézet lefut
+            with client.session_transaction() as sess:
+                sess["username"] = "bob"
+            self.assertEqual(client.get("/garages", headers={"If-None-Match": etag}).status_code, 200)
+            with client.session_transaction() as sess:
+                sess["username"] = "alice"
+            versions.versions = {"garages": 3, "user_garages": 1}
+            self.assertEqual(client.get("/garages", headers={"If-None-Match": etag}).status_code, 200)
+            self.assertEqual(calls, ["alice", "bob", "alice"])
+
+            # Hibás válasz nem kap ETag-et; követhetetlen verzióknál nincs feltételes válasz
+            self.assertNotIn("ETag", client.get("/private").headers)
+            versions.versions = None
+            response = client.get("/garages", headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("ETag", response.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
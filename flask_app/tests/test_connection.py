@@ -0,0 +1,188 @@
+import threading
+import unittest
+from unittest.mock import patch
+from flask import Flask, jsonify
+from db import connection
+from db.connection import ConnectionPool, PoolTimeout, fingerprint, record_query, record_rows, track_queries
+from db_fakes import assert_max_queries
+from utils.streaming import stream_json_array
+
+
+class FakePgConnection:
+    def __init__(self):
+        self.closed = 0
+        self.rollback_count = 0
+
+    def rollback(self):
+        self.rollback_count += 1
+
+    def close(self):
+        self.closed = 1
+
+
+class TestConnectionPool(unittest.TestCase):
+    def test_reuses_returned_connection(self):
+        created = []
+        pool = ConnectionPool(lambda: created.append(FakePgConnection()) or created[-1], maxconn=2)
+        conn = pool.getconn("a")
+        pool.putconn(conn)
+        again = pool.getconn("b")
+        self.assertIs(conn, again)
+        self.assertEqual(len(created), 1)
+        self.assertEqual(conn.rollback_count, 1)
+
+    def test_bounded_pool_times_out(self):
+        pool = ConnectionPool(FakePgConnection, maxconn=1, acquire_timeout=0.05)
+        pool.getconn("holder")
+        with self.assertRaises(PoolTimeout):
+            pool.getconn("waiter")
+        stats = pool.stats()
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertEqual(stats["in_use"], 1)
+        self.assertEqual(stats["saturation"], 1.0)
+
+    def test_waiter_gets_released_connection(self):
+        pool = ConnectionPool(FakePgConnection, maxconn=1, acquire_timeout=2)
+        conn = pool.getconn("holder")
+        timer = threading.Timer(0.05, pool.putconn, args=(conn,))
+        timer.start()
+        self.assertIs(pool.getconn("waiter"), conn)
+        timer.join()
+        self.assertEqual(pool.stats()["waits"], 1)
+
+    def test_closed_connection_is_discarded(self):
+        pool = ConnectionPool(FakePgConnection, maxconn=1)
+        conn = pool.getconn()
+        conn.close()
+        pool.putconn(conn)
+        self.assertIsNot(pool.getconn(), conn)
+        self.assertEqual(pool.stats()["discarded"], 1)
+
+    def test_leak_detection(self):
+        pool = ConnectionPool(FakePgConnection, maxconn=2, leak_timeout=0)
+        pool.getconn("GET /hibak")
+        with self.assertLogs("db.connection", level="WARNING") as logs:
+            pool.getconn("other")
+        self.assertIn("GET /hibak", logs.output[0])
+        self.assertEqual(pool.stats()["leaks"], 1)
+        self.assertEqual(pool.leaked()[0]["owner"], "GET /hibak")
+
+
+class TestRequestScope(unittest.TestCase):
+    def setUp(self):
+        self.pool = ConnectionPool(FakePgConnection, maxconn=2)
+        patcher = patch.object(connection, "get_pool", return_value=self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_one_connection_per_app_context(self):
+        app = Flask(__name__)
+        connection.init_app(app)
+        with app.app_context():
+            first = connection.get_connection()
+            self.assertIs(connection.get_connection(), first)
+            self.assertEqual(self.pool.stats()["in_use"], 1)
+        self.assertEqual(self.pool.stats()["in_use"], 0)
+        self.assertEqual(first.rollback_count, 1)
+
+    def test_connection_scope(self):
+        with connection.connection_scope("script") as conn:
+            self.assertIs(connection.get_connection(), conn)
+        self.assertEqual(self.pool.stats()["in_use"], 0)
+        with self.assertRaises(RuntimeError):
+            connection.get_connection()
+
+    def test_nested_scope_reuses_connection(self):
+        with connection.connection_scope("outer") as outer:
+            with connection.connection_scope("inner") as inner:
+                self.assertIs(inner, outer)
+            self.assertEqual(self.pool.stats()["in_use"], 1)
+        self.assertEqual(self.pool.stats()["checkouts"], 1)
+
+    def test_streamed_response_keeps_connection_until_closed(self):
+        app = Flask(__name__)
+        connection.init_app(app)
+        with app.test_request_context():
+            conn = connection.get_connection()
+            response = stream_json_array(iter([{"id": 1}, {"id": 2}]))
+        # A kérés vége után a folyam még használja a kapcsolatot
+        self.assertEqual(self.pool.stats()["in_use"], 1)
+        self.assertEqual("".join(response.response), '[{"id": 1},{"id": 2}]')
+        response.close()
+        self.assertEqual(self.pool.stats()["in_use"], 0)
+        self.assertEqual(conn.rollback_count, 1)
+
+    def test_unstarted_stream_returns_connection(self):
+        app = Flask(__name__)
+        connection.init_app(app)
+        closed = []
+
+        def rows():
+            try:
+                yield {"id": 1}
+            finally:
+                closed.append(True)
+
+        @app.route("/rows", methods=["GET"])
+        def stream_rows():
+            connection.get_connection()
+            return stream_json_array(rows())
+
+        client = app.test_client()
+        for _ in range(3):
+            client.head("/rows").close()
+        self.assertEqual(self.pool.stats()["in_use"], 0)
+
+        # Félbehagyott folyam: a sorok forrása is lezárul
+        response = client.get("/rows")
+        self.assertEqual(next(response.response), b"[")
+        self.assertEqual(next(response.response), b'{"id": 1}')
+        response.close()
+        self.assertEqual(closed, [True])
+        self.assertEqual(self.pool.stats()["in_use"], 0)
+
+
+class TestQueryInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["QUERY_REPEAT_WARN"] = 2
+        connection.init_app(self.app)
+
+        @self.app.route("/plates")
+        def plates():
+            # N+1: buszonként egy lekérdezés
+            for plate in ("AAA-001", "AAA-002", "AAA-003"):
+                record_query(f"SELECT *  FROM bus WHERE plate = '{plate}'")
+                record_rows(1)
+            return jsonify([])
+
+    def test_fingerprint_ignores_literals_and_whitespace(self):
+        self.assertEqual(fingerprint("SELECT * FROM bus\n  WHERE plate = 'AAA-001' AND km > 100"),
+                         "SELECT * FROM bus WHERE plate = ? AND km > ?")
+        self.assertEqual(fingerprint("SELECT 1 FROM t WHERE id = %s"), "SELECT ? FROM t WHERE id = %s")
+
+    def test_request_reports_server_timing_and_repeats(self):
+        with self.assertLogs("db.connection", level="WARNING") as logs:
+            response = self.app.test_client().get("/plates")
+        self.assertIn('desc="3 queries, 3 rows"', response.headers["Server-Timing"])
+        self.assertIn("GET /plates: 3× SELECT * FROM bus WHERE plate = ?", logs.output[0])
+        self.assertIsNone(connection.current_query_stats())
+
+    def test_track_queries_includes_requests(self):
+        with track_queries() as stats:
+            record_query("SELECT 1")
+            self.app.test_client().get("/plates")
+        self.assertEqual((stats.queries, stats.rows), (4, 3))
+        self.assertEqual(stats.repeated(2), [("SELECT * FROM bus WHERE plate = ?", 3)])
+        record_query("SELECT 1")
+        self.assertEqual(stats.queries, 4)
+
+    def test_assert_max_queries(self):
+        with self.assertRaises(AssertionError) as ctx:
+            with assert_max_queries(2):
+                self.app.test_client().get("/plates")
+        self.assertIn("3× SELECT * FROM bus WHERE plate = ?", str(ctx.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+import json
+import socket
+import time
+import unittest
+from collections import namedtuple
+from unittest.mock import patch
+from flask import Flask
+from db.events import EventBroadcaster, notify_all
+from routes import events as events_route
+from db.versions import TableVersions
+from db_fakes import FakeConnection
+
+Notify = namedtuple("Notify", "channel payload")
+
+
+class FakeListenCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        self.conn.queries.append(query)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+# Socketpair alapú kapcsolat: a select() a valódi fájlleírón várakozik
+class FakeListenConnection:
+    def __init__(self):
+        self._reader, self._writer = socket.socketpair()
+        self.notifies = []
+        self.queries = []
+        self.autocommit = False
+        self.closed = 0
+
+    def fileno(self):
+        return self._reader.fileno()
+
+    def cursor(self):
+        return FakeListenCursor(self)
+
+    def poll(self):
+        self._reader.recv(4096)
+
+    def send(self, event):
+        self.notifies.append(Notify("bkv_events", json.dumps(event)))
+        self._writer.send(b"x")
+
+    def close(self):
+        self.closed = 1
+        self._reader.close()
+        self._writer.close()
+
+
+class TestEventBroadcaster(unittest.TestCase):
+    def setUp(self):
+        self.conn = FakeListenConnection()
+        self.broadcaster = EventBroadcaster(connect=lambda: self.conn, poll_seconds=0.05)
+
+    def tearDown(self):
+        self.broadcaster.stop(timeout=1)
+
+    def _wait_listening(self):
+        deadline = time.monotonic() + 2
+        while not self.broadcaster.stats()["listening"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(self.broadcaster.stats()["listening"])
+
+    def test_delivers_public_and_user_events(self):
+        alice = self.broadcaster.subscribe("alice")
+        bob = self.broadcaster.subscribe("bob")
+        self._wait_listening()
+        self.assertTrue(self.conn.autocommit)
+        self.assertEqual(self.conn.queries, ["LISTEN bkv_events"])
+
+        self.conn.send({"type": "listing_sold", "listing_id": 7})
+        self.conn.send({"type": "balance_changed", "username": "alice", "delta": 100, "balance": 1100})
+
+        self.assertEqual(alice.get(timeout=1)["type"], "listing_sold")
+        self.assertEqual(alice.get(timeout=1)["balance"], 1100)
+        self.assertEqual(bob.get(timeout=1)["type"], "listing_sold")
+        self.assertIsNone(bob.get(timeout=0.1))
+
+        bob.close()
+        self.assertEqual(self.broadcaster.stats()["subscribers"], 1)
+
+    def test_slow_subscriber_is_told_to_resync(self):
+        self.broadcaster.queue_size = 1
+        sub = self.broadcaster.subscribe("alice")
+        self.broadcaster.publish(json.dumps({"type": "listing_created", "listing_id": 1}))
+        self.broadcaster.publish(json.dumps({"type": "listing_created", "listing_id": 2}))
+        self.broadcaster.publish("not json")
+
+        self.assertTrue(sub.needs_resync())
+        self.assertFalse(sub.needs_resync())
+        self.assertEqual(sub.get(timeout=0)["listing_id"], 1)
+        stats = self.broadcaster.stats()
+        self.assertEqual((stats["delivered"], stats["dropped"], stats["invalid"]), (1, 1, 1))
+
+    def test_stream_subscribes_only_while_running(self):
+        app = Flask(__name__)
+        app.secret_key = "test"
+        app.register_blueprint(events_route.events_bp)
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess["username"] = "alice"
+        with patch.object(events_route, "event_broadcaster", self.broadcaster):
+            client.head("/events").close()
+            self.assertEqual(self.broadcaster.stats()["subscribers"], 0)
+
+            response = client.get("/events")
+            self.assertTrue(next(response.response).startswith(b"retry:"))
+            self.assertEqual(self.broadcaster.stats()["subscribers"], 1)
+            response.close()
+        self.assertEqual(self.broadcaster.stats()["subscribers"], 0)
+
+    def test_table_versions_count_notifications_per_epoch(self):
+        versions = TableVersions(connect=lambda: self.conn, poll_seconds=0.05)
+        self.assertIsNone(versions.current(("lines",)))
+        versions.start()
+        try:
+            deadline = time.monotonic() + 2
+            while versions.current(("lines",)) is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(self.conn.queries, ["LISTEN bkv_table_versions"])
+            epoch, lines = versions.current(("lines",))
+            self.assertEqual(lines, 0)
+
+            versions.publish("lines")
+            versions.publish("schedules")
+            versions.publish("lines")
+            self.assertEqual(versions.current(("lines", "schedules", "garages")), (epoch, 2, 1, 0))
+        finally:
+            versions.stop(timeout=1)
+        self.assertIsNone(versions.current(("lines",)))
+
+    def test_notify_all_sends_one_statement(self):
+        conn = FakeConnection(steps=[{"expect": "SELECT pg_notify(%s, payload) FROM unnest(%s::text[])"}])
+        with conn.cursor() as cur:
+            notify_all(cur, [{"type": "a"}, {"type": "b", "id": 1}])
+            notify_all(cur, [])
+        self.assertEqual(conn.cursor().params_list, [("bkv_events", ['{"type": "a"}', '{"type": "b", "id": 1}'])])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+from datetime import datetime, timedelta
 from unittest.mock import patch
 from services import hiba_service
 from db_fakes import FakeConnection
@@ -6,11 +7,11 @@ from db_fakes import FakeConnection
 class TestHibaService(unittest.TestCase):
     def test_list_issues_by_bus(self):
         rows = [
-            {"id": 1, "bus": "AAA-111", "time": "2024-01-01 10:00:00", "repair_time": "2024-01-02 10:00:00", "repair_cost": 1000, "description": "desc1"},
-            {"id": 2, "bus": "AAA-111", "time": "2024-01-03 11:00:00", "repair_time": "2024-01-04 11:00:00", "repair_cost": 2000, "description": "desc2"},
+            {"id": 1, "bus": "AAA-111", "time": "2024-01-01 10:00:00", "repair_time": "01:00:00", "repair_cost": 1000, "description": "desc1"},
+            {"id": 2, "bus": "AAA-111", "time": "2024-01-03 11:00:00", "repair_time": None, "repair_cost": 2000, "description": "desc2"},
         ]
         steps = [{
-            "expect": "FROM issues WHERE bus = %s",
+            "expect": "FROM issues i WHERE i.bus = %s",
             "params": ("AAA-111",),
             "fetch": "all",
             "result": rows,
@@ -18,44 +19,54 @@ class TestHibaService(unittest.TestCase):
         fake_conn = FakeConnection(steps=steps)
         with patch.object(hiba_service, 'get_connection', return_value=fake_conn):
             res = hiba_service.list_issues_by_bus("AAA-111")
-        self.assertEqual(len(res), 2)
-        self.assertIn("SELECT * FROM issues", fake_conn.cursor().queries[0])
-        self.assertEqual(fake_conn.cursor().params_list[0], ("AAA-111",))
-        self.assertIsInstance(res[0]["time"], str)
-        self.assertIsInstance(res[0]["repair_time"], str)
+        self.assertEqual(res, rows)
+        # A szöveges átalakítás a lekérdezésben történik
+        self.assertIn('i."time"::text AS "time", i.repair_time::text AS repair_time', fake_conn.cursor().queries[0])
 
     def test_list_issues_for_user(self):
-        buses = [{"plate": "AAA-111"}, {"plate": "BBB-222"}]
-        steps = [
-            {
-                "expect": "FROM issues WHERE bus = %s",
-                "params": ("AAA-111",),
-                "fetch": "all",
-                "result": [{"id": 1, "bus": "AAA-111", "time": "x", "repair_time": "y", "repair_cost": 100, "description": "a"}],
-            },
-            {
-                "expect": "FROM issues WHERE bus = %s",
-                "params": ("BBB-222",),
-                "fetch": "all",
-                "result": [
-                    {"id": 2, "bus": "BBB-222", "time": "x2", "repair_time": "y2", "repair_cost": 200, "description": "b"},
-                    {"id": 3, "bus": "BBB-222", "time": "x3", "repair_time": "y3", "repair_cost": 300, "description": "c"},
-                ],
-            },
+        # Egyetlen összekapcsolt lekérdezés, szerveroldali kurzorral
+        rows = [
+            {"id": 1, "bus": "AAA-111", "time": "x", "repair_time": "01:00:00", "repair_cost": 100, "description": "a"},
+            {"id": 2, "bus": "BBB-222", "time": "x2", "repair_time": "02:00:00", "repair_cost": 200, "description": "b"},
         ]
+        steps = [{
+            "expect": "FROM issues i JOIN bus b ON b.plate = i.bus WHERE b.owner = %s ORDER BY i.bus, i.id",
+            "params": ("alice",),
+            "fetch": "all",
+            "result": rows,
+        }]
         fake_conn = FakeConnection(steps=steps)
         with patch.object(hiba_service, 'get_connection', return_value=fake_conn):
-            with patch.object(hiba_service, 'get_buses_for_user', return_value=buses):
-                res = hiba_service.list_issues_for_user("alice", False)
-        self.assertEqual(len(res), 3)
-        q = fake_conn.cursor().queries
-        self.assertIn("FROM issues WHERE bus = %s", q[0])
-        self.assertIn("FROM issues WHERE bus = %s", q[1])
+            stream = hiba_service.iter_issues_for_user("alice", False)
+            self.assertEqual(len(fake_conn.cursor().queries), 1)
+            self.assertEqual(list(stream), rows)
+        self.assertTrue(fake_conn.cursor_names[0].startswith("issues_stream_"))
+        self.assertEqual(fake_conn.cursor().itersize, hiba_service.ISSUE_STREAM_BATCH)
+
+        # Adminisztrátor: minden busz hibái, tulajdonos szerinti szűrés nélkül
+        steps = [{"expect": "FROM issues i JOIN bus b ON b.plate = i.bus ORDER BY i.bus, i.id", "params": None, "fetch": "all", "result": rows}]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(hiba_service, 'get_connection', return_value=fake_conn):
+            res = hiba_service.list_issues_for_user("admin", True)
+        self.assertEqual(len(res), 2)
+        self.assertNotIn("owner", fake_conn.cursor().queries[0])
+
+    def test_list_all_issues(self):
+        steps = [{"expect": "FROM issues i ORDER BY i.id", "fetch": "all", "result": [{"id": 1}]}]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(hiba_service, 'get_connection', return_value=fake_conn):
+            res = hiba_service.list_all_issues()
+        self.assertEqual(res, [{"id": 1}])
+        # Egy kapcsolaton két folyam: eltérő kurzornevek
+        fake_conn.cursor_obj.steps.append(steps[0])
+        with patch.object(hiba_service, 'get_connection', return_value=fake_conn):
+            hiba_service.list_all_issues()
+        self.assertEqual(len(set(fake_conn.cursor_names)), 2)
 
     def test_create_issue(self):
         data = {
             "bus": "AAA-111",
-            "time": "2024-01-01 10:00:00",
+            "time": "2024.01.01 - 10:00:00",
             "repair_time": "2024-01-02 10:00:00",
             "repair_cost": 1500,
             "description": "brake issue",
@@ -63,7 +74,8 @@ class TestHibaService(unittest.TestCase):
         steps = [
             {
                 "expect": "INSERT INTO issues",
-                "params": ("AAA-111", "2024-01-01 10:00:00", "2024-01-02 10:00:00", 1500, "brake issue"),
+                "params": ("AAA-111", "2024.01.01 - 10:00:00", datetime(2024, 1, 1, 10, 0),
+                           "2024-01-02 10:00:00", 1500, "brake issue"),
                 "fetch": None,
                 "result": None,
             },
@@ -97,6 +109,79 @@ class TestHibaService(unittest.TestCase):
         self.assertIn("DELETE FROM schedule_assignments", q[2])
         self.assertIn("UPDATE bus SET status = 'Service', line = '-'", q[3])
 
+    def test_parse_issue_feed(self):
+        rows = hiba_service.parse_issue_feed(
+            "bus,time,repair_time,repair_cost,description\nAAA-111,2024.01.01 - 10:00:00,01:00:00,100,brake\n",
+            "text/csv; charset=utf-8")
+        self.assertEqual(rows[0]["bus"], "AAA-111")
+        self.assertEqual(rows[0]["repair_cost"], "100")
+
+        rows = hiba_service.parse_issue_feed('{"bus": "A", "description": "x"}\n\n{"bus": "B", "description": "y"}\n',
+                                             "application/x-ndjson")
+        self.assertEqual([r["bus"] for r in rows], ["A", "B"])
+
+        for body, content_type in [('{"bus": "A"}\nnot json', "application/x-ndjson"), ("", "text/csv"),
+                                   ('{"bus": "A"}', "application/json")]:
+            with self.assertRaises(ValueError):
+                hiba_service.parse_issue_feed(body, content_type)
+
+    def test_create_issues_bulk(self):
+        # Egy beszúrás, halmazszintű mellékhatások; az érintett idősávok egyszer kerülnek újraszámításra
+        rows = [
+            {"bus": "AAA-111", "time": "2024.01.01 - 10:00:00", "repair_cost": "100", "description": "brake"},
+            {"bus": "AAA-111", "description": "door"},
+            {"bus": "ZZZ-999", "description": "unknown bus"},
+            {"bus": "BBB-222", "description": "x", "repair_cost": "lots"},
+            {"bus": "CCC-333", "description": "someone else's bus"},
+            {"bus": "BBB-222", "description": "engine", "repair_time": "1 day 02:30"},
+            {"bus": "BBB-222", "description": "y", "repair_time": "soon"},
+            {"bus": "BBB-222", "description": "z", "repair_cost": "99999999999"},
+        ]
+        steps = [
+            {"expect": "INSERT INTO issues", "fetch": "all",
+             "result": [{"id": 1, "bus": "AAA-111"}, {"id": 2, "bus": "AAA-111"}, {"id": 3, "bus": "BBB-222"}]},
+            {"expect": "SELECT plate FROM bus WHERE plate = ANY(%s)", "params": (["CCC-333", "ZZZ-999"],),
+             "fetch": "all", "result": [{"plate": "CCC-333"}]},
+            {"expect": "WHERE sa.bus_plate = ANY(%s)", "params": (["AAA-111", "BBB-222"],), "fetch": "all",
+             "result": [{"schedule_id": 10, "line_name": "L1", "frame": "morning"},
+                        {"schedule_id": 11, "line_name": "L1", "frame": "morning"},
+                        {"schedule_id": 12, "line_name": "L2", "frame": "night"}]},
+            {"expect": "DELETE FROM schedule_assignments WHERE bus_plate = ANY(%s)", "params": (["AAA-111", "BBB-222"],)},
+            {"expect": "UPDATE bus SET status = 'Service', line = '-' WHERE plate = ANY(%s)", "params": (["AAA-111", "BBB-222"],)},
+            {"expect": "UPDATE schedules SET status = 'pending' WHERE id = ANY(%s)", "params": ([10, 11, 12],)},
+        ]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(hiba_service, 'get_connection', return_value=fake_conn), \
+             patch.object(hiba_service, 'enqueue_winner_recompute') as enqueue:
+            res = hiba_service.create_issues_bulk(rows, "alice")
+        self.assertEqual(res["issue_ids"], [1, 2, 3])
+        self.assertEqual(res["rejected"], [
+            {"line": 3, "error": "Unknown bus ZZZ-999"},
+            {"line": 4, "error": "repair_cost must be an integer"},
+            {"line": 5, "error": "Bus CCC-333 is not yours"},
+            {"line": 7, "error": "repair_time must be HH:MM[:SS]"},
+            {"line": 8, "error": "repair_cost must be between 0 and 2147483647"},
+        ])
+        # Csak az ellenőrzött sorok, már átalakított értékekkel kerülnek a beszúrásba; nem
+        # adminisztrátornál csak a saját buszokra
+        buses, _, _, repair_times, costs, _, is_admin, username = fake_conn.cursor().params_list[0]
+        self.assertEqual(buses, ["AAA-111", "AAA-111", "ZZZ-999", "CCC-333", "BBB-222"])
+        self.assertEqual(repair_times, [None, None, None, None, timedelta(days=1, hours=2, minutes=30)])
+        self.assertEqual(costs, [100, None, None, None, None])
+        self.assertEqual((is_admin, username), (False, "alice"))
+        self.assertIn("JOIN bus b ON b.plate = t.bus AND (%s OR b.owner = %s)", fake_conn.cursor().queries[0])
+        self.assertEqual(fake_conn.commit_count, 1)
+        self.assertEqual([c.args for c in enqueue.call_args_list], [("L1", "morning"), ("L2", "night")])
+
+        # Az egyetlen beszúrás oszloptömbökben kapja az öt érvényes sort
+        reported = fake_conn.cursor().params_list[0][2]
+        self.assertEqual(reported[0], datetime(2024, 1, 1, 10, 0))
+
+    def test_create_issues_bulk_without_valid_rows(self):
+        res, status = hiba_service.create_issues_bulk([{"bus": "AAA-111"}, "x"], "alice")
+        self.assertEqual(status, 400)
+        self.assertEqual([r["line"] for r in res["rejected"]], [1, 2])
+
     def test_remove_issue(self):
         # Hiba nem található
         steps = [{
@@ -120,12 +205,8 @@ class TestHibaService(unittest.TestCase):
                 "fetch": "one",
                 "result": {"bus": "AAA-111"},
             },
-            {
-                "expect": "DELETE FROM issues WHERE id = %s",
-                "params": (7,),
-                "fetch": None,
-                "result": None,
-            },
+            {"expect": "SELECT to_regclass(%s)", "fetch": "one", "result": {"present": True}},
+            {"expect": "WITH moved AS ( DELETE FROM issues WHERE id = %s", "fetch": None, "result": None},
             {
                 "expect": "SELECT COUNT(*) AS issue_count FROM issues WHERE bus = %s",
                 "params": ("AAA-111",),
@@ -153,12 +234,8 @@ class TestHibaService(unittest.TestCase):
                 "fetch": "one",
                 "result": {"bus": "BBB-222"},
             },
-            {
-                "expect": "DELETE FROM issues WHERE id = %s",
-                "params": (8,),
-                "fetch": None,
-                "result": None,
-            },
+            {"expect": "SELECT to_regclass(%s)", "fetch": "one", "result": {"present": True}},
+            {"expect": "WITH moved AS ( DELETE FROM issues WHERE id = %s", "fetch": None, "result": None},
             {
                 "expect": "SELECT COUNT(*) AS issue_count FROM issues WHERE bus = %s",
                 "params": ("BBB-222",),
@@ -172,5 +249,75 @@ class TestHibaService(unittest.TestCase):
         self.assertIn("remains in Service", res["message"])
         self.assertTrue(fake_conn.commit_called)
 
+    def test_remove_issue_archives_into_monthly_partition(self):
+        # A hónap első lezárása létrehozza a partíciót, a sor ugyanabban a tranzakcióban költözik át
+        steps = [
+            {"expect": "SELECT bus FROM issues WHERE id = %s", "params": (7,), "fetch": "one", "result": {"bus": "AAA-111"}},
+            {"expect": "SELECT to_regclass(%s)", "params": ("issues_archive_2026_12",), "fetch": "one", "result": {"present": False}},
+            {"expect": "pg_advisory_xact_lock", "params": (hiba_service.ARCHIVE_LOCK_KEY,)},
+            {"expect": "CREATE TABLE IF NOT EXISTS issues_archive_2026_12 PARTITION OF issues_archive",
+             "params": (datetime(2026, 12, 1), datetime(2027, 1, 1))},
+            {"expect": "INSERT INTO issues_archive", "params": (7, datetime(2026, 12, 31, 23, 59))},
+            {"expect": "SELECT COUNT(*) AS issue_count FROM issues WHERE bus = %s", "fetch": "one", "result": {"issue_count": 1}},
+        ]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(hiba_service, 'get_connection', return_value=fake_conn), \
+             patch.object(hiba_service, 'datetime', wraps=datetime) as clock:
+            clock.now.return_value = datetime(2026, 12, 31, 23, 59)
+            res = hiba_service.remove_issue(7)
+        self.assertIn("archived", res["message"])
+        self.assertEqual(fake_conn.commit_count, 1)
+
+    def test_list_issue_history(self):
+        rows = [{"id": 5, "bus": "AAA-111", "reported_at": datetime(2025, 11, 3, 19, 55), "status": "resolved"}]
+        steps = [{
+            "expect": "FROM issues UNION ALL SELECT",
+            "params": (datetime(2025, 11, 1), datetime(2025, 12, 1), "alice", 2),
+            "fetch": "all",
+            "result": rows + [{"id": 4, "bus": "AAA-111", "reported_at": datetime(2025, 11, 2), "status": "open"}],
+        }]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(hiba_service, 'get_connection', return_value=fake_conn):
+            page = hiba_service.list_issue_history(
+                {"status": "all", "from": "2025-11-01", "to": "2025-11-30", "limit": "1"}, "alice", False)
+        self.assertEqual(page["items"], rows)
+        query = fake_conn.cursor().queries[0]
+        self.assertIn("FROM issues_archive", query)
+        self.assertIn("h.bus IN (SELECT plate FROM bus WHERE owner = %s)", query)
+        self.assertIn("ORDER BY h.reported_at DESC NULLS LAST, h.id DESC", query)
+
+        # A következő oldal a kurzor utáni sorokkal folytatódik; csak az archívumot olvassa
+        steps = [{"expect": "FROM issues_archive) h WHERE (h.reported_at < %s", "fetch": "all", "result": []}]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(hiba_service, 'get_connection', return_value=fake_conn):
+            page = hiba_service.list_issue_history({"status": "resolved", "cursor": page["next_cursor"]}, "admin", True)
+        self.assertEqual(page, {"items": [], "next_cursor": None})
+        self.assertNotIn("owner", fake_conn.cursor().queries[0])
+
+    def test_list_issue_history_rejects_bad_filters(self):
+        for params in ({"status": "closed"}, {"from": "yesterday"}, {"sort": "repair_cost"}):
+            with self.assertRaises(ValueError):
+                hiba_service.list_issue_history(params, "alice", False)
+
+    def test_issue_summary(self):
+        steps = [{
+            "expect": "FROM unnest(%s::varchar[]) AS p(plate)",
+            "params": (["AAA-111", "BBB-222"],),
+            "fetch": "all",
+            "result": [
+                {"plate": "AAA-111", "open_issues": 2, "open_repair_cost": 300, "total_repair_cost": 1300},
+                {"plate": "BBB-222", "open_issues": 0, "open_repair_cost": 0, "total_repair_cost": 0},
+            ],
+        }]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(hiba_service, 'get_connection', return_value=fake_conn):
+            res = hiba_service.issue_summary(["AAA-111", "BBB-222", "AAA-111", ""])
+        self.assertEqual(res["AAA-111"], {"open_issues": 2, "open_repair_cost": 300, "total_repair_cost": 1300})
+        self.assertEqual(res["BBB-222"]["open_issues"], 0)
+
+        self.assertEqual(hiba_service.issue_summary([""]), {})
+        with self.assertRaises(ValueError):
+            hiba_service.issue_summary([f"P{i}" for i in range(hiba_service.MAX_SUMMARY_PLATES + 1)])
+
 if __name__ == "__main__":
     unittest.main()
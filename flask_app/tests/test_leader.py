@@ -0,0 +1,79 @@
+import unittest
+import psycopg2
+from db.leader import AdvisoryLockLeader
+
+
+class FakeLockCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        self.conn.queries.append(query)
+        if self.conn.fail:
+            raise psycopg2.OperationalError("server closed the connection")
+
+    def fetchone(self):
+        return (self.conn.lock_free,)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class FakeLockConnection:
+    def __init__(self, lock_free=True, server_version=160000):
+        self.lock_free = lock_free
+        self.server_version = server_version
+        self.fail = False
+        self.closed = 0
+        self.autocommit = False
+        self.queries = []
+
+    def cursor(self):
+        return FakeLockCursor(self)
+
+    def close(self):
+        self.closed = 1
+
+
+class TestAdvisoryLockLeader(unittest.TestCase):
+    def test_acquires_and_keeps_leadership(self):
+        conn = FakeLockConnection(lock_free=True)
+        elected = []
+        leader = AdvisoryLockLeader(42, on_elected=lambda: elected.append(1), connect=lambda: conn)
+        self.assertTrue(leader.is_leader())
+        self.assertTrue(leader.is_leader())
+        self.assertEqual(elected, [1])
+        self.assertTrue(conn.autocommit)
+        self.assertTrue(any("pg_try_advisory_lock" in q for q in conn.queries))
+        self.assertEqual(conn.queries[-1], "SELECT 1")
+        self.assertTrue(any("idle_session_timeout" in q for q in conn.queries))
+
+    def test_old_server_skips_idle_session_timeout(self):
+        conn = FakeLockConnection(server_version=130011)
+        leader = AdvisoryLockLeader(42, connect=lambda: conn)
+        self.assertTrue(leader.is_leader())
+        self.assertFalse(any("idle_session_timeout" in q for q in conn.queries))
+
+    def test_follower_when_lock_is_held(self):
+        conn = FakeLockConnection(lock_free=False)
+        leader = AdvisoryLockLeader(42, connect=lambda: conn)
+        self.assertFalse(leader.is_leader())
+        conn.lock_free = True
+        self.assertTrue(leader.is_leader())
+
+    def test_lost_connection_drops_leadership(self):
+        conns = [FakeLockConnection(), FakeLockConnection()]
+        leader = AdvisoryLockLeader(42, connect=lambda: conns.pop(0))
+        self.assertTrue(leader.is_leader())
+        first = leader._conn
+        first.fail = True
+        self.assertFalse(leader.is_leader())
+        self.assertEqual(first.closed, 1)
+        self.assertTrue(leader.is_leader())
+
+
+if __name__ == "__main__":
+    unittest.main()
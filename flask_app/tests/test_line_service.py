@@ -1,61 +1,125 @@
 import unittest
+from datetime import time
 from unittest.mock import patch
-from services import line_service
-from db_fakes import FakeConnection
+from flask import Flask
+from routes.lines import lines_bp
+from services import line_catalog, line_service
+from services.line_catalog import LineCatalog
+from db_fakes import FakeConnection, assert_max_queries
+
+
+class FakeVersions:
+    def __init__(self, version):
+        self.version = version
+
+    def current(self, tables):
+        return None if self.version is None else ("epoch", self.version)
+
 
 class TestLineService(unittest.TestCase):
-    def test_list_lines(self):
-        rows = [
+    def setUp(self):
+        self.rows = [
             {"name": "10", "provider_garage_id": 1, "travel_time_garage": 12, "travel_time_line": 30},
             {"name": "12A", "provider_garage_id": 2, "travel_time_garage": 8, "travel_time_line": 25},
         ]
-        steps = [{
-            "expect": "FROM lines",
-            "params": None,
-            "fetch": "all",
-            "result": rows,
-        }]
-        fake_conn = FakeConnection(steps=steps)
-        with patch.object(line_service, 'get_connection', return_value=fake_conn):
+        self.versions = FakeVersions(1)
+        self.catalog = LineCatalog(versions=self.versions)
+
+    def load_step(self):
+        return {"expect": "FROM lines ORDER BY name", "params": None, "fetch": "all", "result": self.rows}
+
+    def test_list_lines(self):
+        fake_conn = FakeConnection(steps=[self.load_step()])
+        with patch.object(line_service, 'line_catalog', self.catalog), \
+                patch.object(line_catalog, 'get_connection', return_value=fake_conn):
             res = line_service.list_lines()
-        self.assertEqual(res, rows)
+            self.assertEqual(line_service.list_lines(), res)
+        self.assertEqual(res, self.rows)
         q = fake_conn.cursor().queries[0]
         self.assertIn("SELECT name, provider_garage_id, travel_time_garage, travel_time_line", q)
-        self.assertIn("FROM lines", q)
-        self.assertIn("ORDER BY name", q)
-        self.assertIsNone(fake_conn.cursor().params_list[0])
+        # A második hívás már a memóriából szolgál ki
+        self.assertEqual(len(fake_conn.cursor().queries), 1)
+        self.assertEqual((self.catalog.hits, self.catalog.misses), (1, 1))
         self.assertFalse(fake_conn.commit_called)
 
     def test_get_line(self):
-        # Létező vonal lekérdezése
-        row = {"name": "12A", "provider_garage_id": 2, "travel_time_garage": 8, "travel_time_line": 25}
-        steps = [{
-            "expect": "FROM lines",
-            "params": ("12A",),
-            "fetch": "one",
-            "result": row,
-        }]
-        fake_conn = FakeConnection(steps=steps)
-        with patch.object(line_service, 'get_connection', return_value=fake_conn):
-            res = line_service.get_line("12A")
-        self.assertEqual(res, row)
-        q = fake_conn.cursor().queries[0]
-        self.assertIn("WHERE name = %s", q)
-        self.assertEqual(fake_conn.cursor().params_list[0], ("12A",))
+        fake_conn = FakeConnection(steps=[self.load_step()])
+        with patch.object(line_service, 'line_catalog', self.catalog), \
+                patch.object(line_catalog, 'get_connection', return_value=fake_conn):
+            self.assertEqual(line_service.get_line("12A"), self.rows[1])
+            self.assertIsNone(line_service.get_line("ZZZ"))
+        self.assertEqual(len(fake_conn.cursor().queries), 1)
         self.assertFalse(fake_conn.commit_called)
 
-        # Nem létező vonal lekérdezése
-        steps = [{
-            "expect": "WHERE name = %s",
-            "params": ("ZZZ",),
-            "fetch": "one",
-            "result": None,
-        }]
+    def test_catalog_reloads_on_version_change_and_bypasses_without_versions(self):
+        steps = [self.load_step(), self.load_step(), self.load_step(), self.load_step()]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(line_catalog, 'get_connection', return_value=fake_conn):
+            self.catalog.get("10")
+            self.versions.version = 2          # Másik folyamat írása
+            self.catalog.get("10")
+            self.catalog.invalidate()          # Saját create_line
+            self.catalog.get("10")
+            self.versions.version = None       # A figyelő nem kapcsolódik
+            self.catalog.get("10")
+        stats = self.catalog.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["bypasses"], stats["loads"]), (0, 3, 1, 4))
+
+    def test_create_line_invalidates_catalog(self):
+        steps = [{"expect": "INSERT INTO lines", "params": ("14", 1, 5, 20), "fetch": "one", "result": {"name": "14"}}]
         fake_conn = FakeConnection(steps=steps)
+        self.catalog._loaded_version = ("epoch", 1)
+        with patch.object(line_service, 'line_catalog', self.catalog), \
+                patch.object(line_service, 'get_connection', return_value=fake_conn):
+            res = line_service.create_line(
+                {"name": "14", "provider_garage_id": 1, "travel_time_garage": 5, "travel_time_line": 20})
+        self.assertEqual(res["name"], "14")
+        self.assertTrue(fake_conn.commit_called)
+        self.assertIsNone(self.catalog._loaded_version)
+
+    def test_lines_overview(self):
+        # Egy lekérdezés; menetrend nélküli vonal üres listát kap, a nyertesek az aktív menetrendek
+        base = {"provider_garage_id": 1, "travel_time_garage": 10, "travel_time_line": 30, "provider_garage_name": "Main"}
+        schedule = {"username": "alice", "start_time": time(6, 0), "end_time": time(10, 0),
+                    "frequency": 15, "bid_price": 500, "frame": "morning"}
+        rows = [
+            {**base, "name": "10", "id": 1, **schedule, "status": "active"},
+            {**base, "name": "10", "id": 2, **schedule, "username": "bob", "status": "lost"},
+            {**base, "name": "12A", "id": None, "username": None, "start_time": None, "end_time": None,
+             "frequency": None, "bid_price": None, "frame": None, "status": None},
+        ]
+        fake_conn = FakeConnection(steps=[{"expect": "LEFT JOIN schedules s ON s.line_name = l.name", "fetch": "all", "result": rows}])
         with patch.object(line_service, 'get_connection', return_value=fake_conn):
-            res = line_service.get_line("ZZZ")
-        self.assertIsNone(res)
+            res = line_service.lines_overview()
+        self.assertEqual([l["name"] for l in res["lines"]], ["10", "12A"])
+        self.assertEqual(res["lines"][0]["provider_garage_name"], "Main")
+        self.assertEqual([s["username"] for s in res["lines"][0]["schedules"]], ["alice", "bob"])
+        self.assertEqual(res["lines"][0]["schedules"][0]["start_time"], "06:00")
+        self.assertEqual(res["lines"][1]["schedules"], [])
+        self.assertEqual(res["winners"], [{
+            "line_name": "10", "id": 1, "username": "alice", "start_time": "06:00", "end_time": "10:00",
+            "frequency": 15, "frame": "morning", "bid_price": 500,
+        }])
+        self.assertEqual(len(fake_conn.cursor().queries), 1)
+        self.assertIn("ORDER BY l.name, s.id", fake_conn.cursor().queries[0])
         self.assertFalse(fake_conn.commit_called)
 
+    def test_line_endpoints_query_budget(self):
+        # A vonalak oldal egy lekérdezés; a vonallista a katalógus betöltése után adatbázis nélkül
+        app = Flask(__name__)
+        app.register_blueprint(lines_bp)
+        client = app.test_client()
+        overview_conn = FakeConnection(steps=[{"expect": "LEFT JOIN schedules", "fetch": "all", "result": []}])
+        with patch.object(line_service, 'get_connection', return_value=overview_conn), assert_max_queries(1):
+            self.assertEqual(client.get("/lines/overview").status_code, 200)
+
+        fake_conn = FakeConnection(steps=[self.load_step()])
+        with patch.object(line_service, 'line_catalog', self.catalog), \
+                patch.object(line_catalog, 'get_connection', return_value=fake_conn):
+            with assert_max_queries(1):
+                client.get("/lines")
+            with assert_max_queries(0):
+                self.assertEqual(client.get("/lines").get_json(), self.rows)
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,49 +1,130 @@
+import json
 import unittest
+from datetime import datetime
 from unittest.mock import patch
 from services import market_service
 from db_fakes import FakeConnection
+from psycopg2.errors import DeadlockDetected, LockNotAvailable, UniqueViolation
+
+
+def _events(fake_conn):
+    return [json.loads(p) for q, params in zip(fake_conn.cursor().queries, fake_conn.cursor().params_list)
+            if "pg_notify" in q for p in params[1]]
 
 class TestMarketService(unittest.TestCase):
     def test_list_market_buses(self):
         rows = [
-            {"plate": "AAA-111", "type": "Volvo", "km": 1000, "year": 2005, "garage": None, "owner": None},
-            {"plate": "BBB-222", "type": "Ikarus", "km": 2000, "year": 1999, "garage": None, "owner": None},
+            {"plate": "AAA-111", "type": "Volvo", "km": 1000, "year": 2005, "price_km": 1000},
+            {"plate": "BBB-222", "type": "Ikarus", "km": 250000, "year": 1999, "price_km": 250000},
+            {"plate": "CCC-333", "type": "Ikarus", "km": None, "year": 1999, "price_km": 0},
         ]
         steps = [{
-            "expect": "FROM bus WHERE owner IS NULL",
-            "params": None,
+            "expect": "SELECT plate, type, km, year, COALESCE(km, 0) AS price_km FROM bus WHERE owner IS NULL",
+            "params": (51,),
             "fetch": "all",
             "result": rows,
         }]
         fake_conn = FakeConnection(steps=steps)
         with patch.object(market_service, 'get_connection', return_value=fake_conn):
             res = market_service.list_market_buses()
-        self.assertEqual(res, rows)
-        self.assertIn("FROM bus WHERE owner IS NULL", fake_conn.cursor().queries[0])
-        self.assertIsNone(fake_conn.cursor().params_list[0])
+        self.assertIsNone(res["next_cursor"])
+        self.assertEqual([b["plate"] for b in res["items"]], ["AAA-111", "BBB-222", "CCC-333"])
+        # A km nélküli busz 0 km-es áron szerepel, a segédoszlop nem kerül a válaszba
+        self.assertEqual([b["price"] for b in res["items"]], [99820, 55000, 100000])
+        self.assertNotIn("price_km", res["items"][2])
+        self.assertIn("ORDER BY plate ASC, plate ASC LIMIT %s", fake_conn.cursor().queries[0])
         self.assertFalse(fake_conn.commit_called)
 
-    def test_list_new_bus_models(self):
-        res = market_service.list_new_bus_models()
-        self.assertTrue(isinstance(res, list) and len(res) > 0)
-        self.assertTrue(all(set(["key", "label", "tipus", "evjarat", "price"]).issubset(r.keys()) for r in res))
+    def test_list_market_buses_filters_and_cursor(self):
+        # Első oldal: ár szerint csökkenő sorrend = km szerint növekvő, az ár km-feltétellé alakul;
+        # a km nélküli buszok 0 km-nek számítanak
+        rows = [
+            {"plate": "AAA-111", "type": "Ikarus", "km": None, "year": 1990, "price_km": 0},
+            {"plate": "BBB-222", "type": "Ikarus", "km": 1000, "year": 1991, "price_km": 1000},
+            {"plate": "CCC-333", "type": "Ikarus", "km": 2000, "year": 1992, "price_km": 2000},
+        ]
+        params = {"type": "Ikarus", "year_min": "1990", "price_min": "50000", "sort": "price", "order": "desc", "limit": "2"}
+        steps = [{
+            "expect": "WHERE owner IS NULL AND type = %s AND year >= %s AND COALESCE(km, 0) <= %s "
+                      "ORDER BY COALESCE(km, 0) ASC, plate ASC",
+            "params": ("Ikarus", 1990, 277780, 3),
+            "fetch": "all",
+            "result": rows,
+        }]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(market_service, 'get_connection', return_value=fake_conn):
+            res = market_service.list_market_buses(params)
+        self.assertEqual([b["plate"] for b in res["items"]], ["AAA-111", "BBB-222"])
+        self.assertIsNotNone(res["next_cursor"])
+
+        # Következő oldal a kurzor után
+        steps = [{
+            "expect": "AND (COALESCE(km, 0), plate) > (%s, %s)",
+            "params": ("Ikarus", 1990, 277780, 1000, "BBB-222", 3),
+            "fetch": "all",
+            "result": rows[2:],
+        }]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(market_service, 'get_connection', return_value=fake_conn):
+            res = market_service.list_market_buses({**params, "cursor": res["next_cursor"]})
+        self.assertEqual([b["plate"] for b in res["items"]], ["CCC-333"])
+        self.assertIsNone(res["next_cursor"])
+
+    def test_list_market_buses_invalid_params(self):
+        with self.assertRaises(ValueError):
+            market_service.list_market_buses({"sort": "owner"})
+        with self.assertRaises(ValueError):
+            market_service.list_market_buses({"km_max": "sok"})
+        with self.assertRaises(ValueError):
+            market_service.list_market_buses({"cursor": "nem-kurzor"})
+        # Az árkorlát alatt egy busz sem lehet, lekérdezés nélkül üres
+        self.assertEqual(market_service.list_market_buses({"price_max": "5000"}), {"items": [], "next_cursor": None})
+
+    def test_used_bus_price_bounds(self):
+        for price_min, price_max in [(50000, None), (None, 50000), (10001, 20000), (99999, None)]:
+            km_min, km_max = market_service._km_bounds_for_price(price_min, price_max)
+            edges = [b + d for b in (km_min, km_max) if b is not None for d in (-1, 0, 1)]
+            for km in [*range(0, 600001, 97), *edges]:
+                price = market_service.used_bus_price(km)
+                expected = (price_min is None or price >= price_min) and (price_max is None or price <= price_max)
+                inside = (km_min is None or km >= km_min) and (km_max is None or km <= km_max)
+                if expected != inside:
+                    self.fail(f"km {km} (price {price}) misclassified for {price_min}..{price_max}")
 
     def test_list_active_listings(self):
+        created = datetime(2025, 1, 2, 3, 4, 5)
         rows = [
-            {"listing_id": 1, "bus_plate": "AAA-111", "seller_username": "bob", "price": 120000, "created_at": "t",
+            {"listing_id": 7, "bus_plate": "AAA-111", "seller_username": "bob", "price": 120000, "created_at": created,
              "type": "Volvo", "km": 1000, "year": 2005, "garage": 1},
+            {"listing_id": 6, "bus_plate": "BBB-222", "seller_username": "eve", "price": 90000, "created_at": created,
+             "type": "Volvo", "km": 5000, "year": 2001, "garage": 2},
         ]
+        params = {"exclude_seller": "alice", "price_max": "150000", "limit": "1"}
         steps = [{
-            "expect": "FROM market_listings ml",
-            "params": None,
+            "expect": "WHERE ml.status = 'active' AND ml.price <= %s AND ml.seller_username <> %s ORDER BY ml.created_at DESC, ml.id DESC LIMIT %s",
+            "params": (150000, "alice", 2),
             "fetch": "all",
             "result": rows,
         }]
         fake_conn = FakeConnection(steps=steps)
         with patch.object(market_service, 'get_connection', return_value=fake_conn):
-            res = market_service.list_active_listings()
-        self.assertEqual(res, rows)
-        self.assertIn("WHERE ml.status = 'active'", fake_conn.cursor().queries[0])
+            first = market_service.list_active_listings(params)
+        self.assertEqual(first["items"], rows[:1])
+
+        steps = [{
+            "expect": "AND (ml.created_at, ml.id) < (%s, %s)",
+            "params": (150000, "alice", created.isoformat(), 7, 2),
+            "fetch": "all",
+            "result": rows[1:],
+        }]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(market_service, 'get_connection', return_value=fake_conn):
+            res = market_service.list_active_listings({**params, "cursor": first["next_cursor"]})
+        self.assertEqual(res, {"items": rows[1:], "next_cursor": None})
+
+        # Más rendezéshez készült kurzor nem használható
+        with self.assertRaises(ValueError):
+            market_service.list_active_listings({"sort": "price", "cursor": first["next_cursor"]})
 
     def test_create_listing(self):
         # Sikeres hirdetés létrehozás
@@ -51,6 +132,7 @@ class TestMarketService(unittest.TestCase):
             {"expect": "SELECT owner FROM bus", "params": ("AAA-111",), "fetch": "one", "result": {"owner": "alice"}},
             {"expect": "SELECT 1 FROM market_listings", "params": ("AAA-111",), "fetch": "one", "result": None},
             {"expect": "INSERT INTO market_listings", "params": ("AAA-111", "alice", 130000), "fetch": "one", "result": {"id": 10}},
+            {"expect": "pg_notify"},
         ]
         fake_conn = FakeConnection(steps=steps)
         with patch.object(market_service, 'get_connection', return_value=fake_conn):
@@ -58,6 +140,9 @@ class TestMarketService(unittest.TestCase):
         self.assertEqual(status, 200)
         self.assertEqual(res["listing_id"], 10)
         self.assertTrue(fake_conn.commit_called)
+        self.assertEqual(_events(fake_conn), [{
+            "type": "listing_created", "listing_id": 10, "bus_plate": "AAA-111", "seller_username": "alice", "price": 130000,
+        }])
 
         # Sikertelen hirdetés létrehozás - nem a felhasználó a tulajdonos
         steps = [{"expect": "SELECT owner FROM bus", "params": ("AAA-111",), "fetch": "one", "result": {"owner": "bob"}}]
@@ -103,6 +188,7 @@ class TestMarketService(unittest.TestCase):
         steps = [
             {"expect": "SELECT id, seller_username, status FROM market_listings", "params": (5,), "fetch": "one", "result": {"id": 5, "seller_username": "alice", "status": "active"}},
             {"expect": "UPDATE market_listings SET status = 'canceled'", "params": (5,), "fetch": None, "result": None},
+            {"expect": "pg_notify"},
         ]
         fake_conn = FakeConnection(steps=steps)
         with patch.object(market_service, 'get_connection', return_value=fake_conn):
@@ -110,30 +196,79 @@ class TestMarketService(unittest.TestCase):
         self.assertEqual(status, 200)
         self.assertIn("canceled", res["message"])
         self.assertTrue(fake_conn.commit_called)
+        self.assertEqual(_events(fake_conn), [{"type": "listing_canceled", "listing_id": 5, "seller_username": "alice"}])
 
     def test_purchase_listing(self):
-        # Sikeres hirdetés vásárlás
+        lock = "FOR UPDATE OF ml NOWAIT FOR UPDATE OF b"
+        listing = {"id": 7, "bus_plate": "AAA-111", "seller_username": "bob", "price": 120000, "status": "active", "owner": "bob"}
+
+        # Sikeres hirdetés vásárlás: a felhasználók név szerinti sorrendben zárolódnak (alice, bob)
         steps = [
-            {"expect": "FROM market_listings WHERE id = %s FOR UPDATE", "params": (7,), "fetch": "one", "result": {"id": 7, "bus_plate": "AAA-111", "seller_username": "bob", "price": 120000, "status": "active"}},
-            {"expect": "SELECT owner FROM bus", "params": ("AAA-111",), "fetch": "one", "result": {"owner": "bob"}},
-            {"expect": "SELECT balance FROM users", "params": ("alice",), "fetch": "one", "result": {"balance": 200000}},
+            {"expect": lock, "params": (7,), "fetch": "one", "result": listing},
             {"expect": "SELECT 1 FROM user_garages", "params": ("alice", 3), "fetch": "one", "result": {"x": 1}},
-            {"expect": "FROM schedule_assignments sa", "params": ("AAA-111",), "fetch": "all", "result": []},
-            {"expect": "DELETE FROM schedule_assignments", "params": ("AAA-111",), "fetch": None, "result": None},
-            {"expect": "UPDATE users SET balance = balance -", "params": (120000, "alice"), "fetch": None, "result": None},
-            {"expect": "UPDATE users SET balance = balance +", "params": (120000, "bob"), "fetch": None, "result": None},
-            {"expect": "UPDATE bus", "params": ("alice", 3, "AAA-111"), "fetch": None, "result": None},
-            {"expect": "UPDATE market_listings SET status = 'sold'", "fetch": None, "result": None},
+            {"expect": "UPDATE users SET balance = balance - %s WHERE username = %s AND balance >= %s RETURNING balance",
+             "params": (120000, "alice", 120000), "rowcount": 1, "fetch": "one", "result": {"balance": 30000}},
+            {"expect": "UPDATE users SET balance = balance +", "params": (120000, "bob"), "rowcount": 1, "fetch": "one", "result": {"balance": 220000}},
+            {"expect": "DELETE FROM schedule_assignments WHERE bus_plate = %s RETURNING schedule_id", "params": ("AAA-111",), "fetch": "all", "result": [{"line_name": "7E", "frame": "night"}]},
+            {"expect": "UPDATE bus", "params": ("alice", 3, "AAA-111")},
+            {"expect": "UPDATE market_listings SET status = 'sold'"},
+            {"expect": "pg_notify"},
         ]
         fake_conn = FakeConnection(steps=steps)
-        with patch.object(market_service, 'get_connection', return_value=fake_conn):
+        with patch.object(market_service, 'get_connection', return_value=fake_conn), \
+                patch.object(market_service, 'enqueue_winner_recompute') as enqueue:
             res, status = market_service.purchase_listing("alice", 7, garage_id=3)
         self.assertEqual(status, 200)
         self.assertIn("Purchase successful", res["message"])
         self.assertTrue(fake_conn.commit_called)
+        enqueue.assert_called_once_with("7E", "night")
+        self.assertEqual(_events(fake_conn), [
+            {"type": "listing_sold", "listing_id": 7, "bus_plate": "AAA-111", "seller_username": "bob", "price": 120000},
+            {"type": "balance_changed", "username": "alice", "delta": -120000, "balance": 30000, "reason": "purchase"},
+            {"type": "balance_changed", "username": "bob", "delta": 120000, "balance": 220000, "reason": "sale"},
+        ])
+
+        # Fordított névsor esetén az eladó jóváírása történik előbb
+        steps = [
+            {"expect": lock, "params": (7,), "fetch": "one", "result": {**listing, "seller_username": "aaron", "owner": "aaron"}},
+            {"expect": "SELECT 1 FROM user_garages", "params": ("zoe", 3), "fetch": "one", "result": {"x": 1}},
+            {"expect": "UPDATE users SET balance = balance +", "params": (120000, "aaron"), "rowcount": 1, "fetch": "one", "result": {"balance": 1}},
+            {"expect": "UPDATE users SET balance = balance -", "params": (120000, "zoe", 120000), "rowcount": 1, "fetch": "one", "result": {"balance": 2}},
+            {"expect": "DELETE FROM schedule_assignments", "fetch": "all", "result": []},
+            {"expect": "UPDATE bus", "params": ("zoe", 3, "AAA-111")},
+            {"expect": "UPDATE market_listings SET status = 'sold'"},
+            {"expect": "pg_notify"},
+        ]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(market_service, 'get_connection', return_value=fake_conn):
+            res, status = market_service.purchase_listing("zoe", 7, garage_id=3)
+        self.assertEqual(status, 200)
+
+        # Sikertelen hirdetés vásárlás - a hirdetést éppen más vásárolja (nem várakozik)
+        steps = [{"expect": lock, "params": (7,), "raise": LockNotAvailable("could not obtain lock")}]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(market_service, 'get_connection', return_value=fake_conn):
+            res, status = market_service.purchase_listing("alice", 7)
+        self.assertEqual(status, 409)
+        self.assertEqual(fake_conn.rollback_count, 1)
+        self.assertFalse(fake_conn.commit_called)
+
+        # Holtpont a kifizetés egyenlegfrissítésével: visszagörgetés, újrapróbálható 409
+        steps = [
+            {"expect": lock, "params": (7,), "fetch": "one", "result": listing},
+            {"expect": "SELECT 1 FROM user_garages", "params": ("alice", 3), "fetch": "one", "result": {"x": 1}},
+            {"expect": "UPDATE users SET balance = balance -", "params": (120000, "alice", 120000),
+             "raise": DeadlockDetected("deadlock detected")},
+        ]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(market_service, 'get_connection', return_value=fake_conn):
+            res, status = market_service.purchase_listing("alice", 7, garage_id=3)
+        self.assertEqual(status, 409)
+        self.assertEqual(fake_conn.rollback_count, 1)
+        self.assertFalse(fake_conn.commit_called)
 
         # Sikertelen hirdetés vásárlás - hirdetés nem elérhető
-        steps = [{"expect": "FROM market_listings WHERE id = %s FOR UPDATE", "params": (7,), "fetch": "one", "result": {"id": 7, "bus_plate": "AAA-111", "seller_username": "bob", "price": 120000, "status": "sold"}}]
+        steps = [{"expect": lock, "params": (7,), "fetch": "one", "result": {**listing, "status": "sold"}}]
         fake_conn = FakeConnection(steps=steps)
         with patch.object(market_service, 'get_connection', return_value=fake_conn):
             res, status = market_service.purchase_listing("alice", 7)
@@ -142,7 +277,7 @@ class TestMarketService(unittest.TestCase):
         self.assertFalse(fake_conn.commit_called)
 
         # Sikertelen hirdetés vásárlás - a felhasználó a saját hirdetését próbálja megvenni
-        steps = [{"expect": "FROM market_listings WHERE id = %s FOR UPDATE", "params": (7,), "fetch": "one", "result": {"id": 7, "bus_plate": "AAA-111", "seller_username": "alice", "price": 120000, "status": "active"}}]
+        steps = [{"expect": lock, "params": (7,), "fetch": "one", "result": {**listing, "seller_username": "alice", "owner": "alice"}}]
         fake_conn = FakeConnection(steps=steps)
         with patch.object(market_service, 'get_connection', return_value=fake_conn):
             res, status = market_service.purchase_listing("alice", 7)
@@ -151,10 +286,7 @@ class TestMarketService(unittest.TestCase):
         self.assertFalse(fake_conn.commit_called)
 
         # Sikertelen hirdetés vásárlás - az eladó már nem a tulajdonos
-        steps = [
-            {"expect": "FROM market_listings WHERE id = %s FOR UPDATE", "params": (7,), "fetch": "one", "result": {"id": 7, "bus_plate": "AAA-111", "seller_username": "bob", "price": 120000, "status": "active"}},
-            {"expect": "SELECT owner FROM bus", "params": ("AAA-111",), "fetch": "one", "result": {"owner": "charlie"}},
-        ]
+        steps = [{"expect": lock, "params": (7,), "fetch": "one", "result": {**listing, "owner": "charlie"}}]
         fake_conn = FakeConnection(steps=steps)
         with patch.object(market_service, 'get_connection', return_value=fake_conn):
             res, status = market_service.purchase_listing("alice", 7)
@@ -162,24 +294,23 @@ class TestMarketService(unittest.TestCase):
         self.assertIn("Seller no longer owns", res["error"])
         self.assertFalse(fake_conn.commit_called)
 
-        # Sikertelen hirdetés vásárlás - elégtelen egyenleg
+        # Sikertelen hirdetés vásárlás - elégtelen egyenleg (a feltételes levonás nem módosít sort)
         steps = [
-            {"expect": "FROM market_listings WHERE id = %s FOR UPDATE", "params": (7,), "fetch": "one", "result": {"id": 7, "bus_plate": "AAA-111", "seller_username": "bob", "price": 120000, "status": "active"}},
-            {"expect": "SELECT owner FROM bus", "params": ("AAA-111",), "fetch": "one", "result": {"owner": "bob"}},
-            {"expect": "SELECT balance FROM users", "params": ("alice",), "fetch": "one", "result": {"balance": 50000}},
+            {"expect": lock, "params": (7,), "fetch": "one", "result": listing},
+            {"expect": "SELECT 1 FROM user_garages", "params": ("alice", 3), "fetch": "one", "result": {"x": 1}},
+            {"expect": "UPDATE users SET balance = balance -", "params": (120000, "alice", 120000), "rowcount": 0},
         ]
         fake_conn = FakeConnection(steps=steps)
         with patch.object(market_service, 'get_connection', return_value=fake_conn):
-            res, status = market_service.purchase_listing("alice", 7)
+            res, status = market_service.purchase_listing("alice", 7, garage_id=3)
         self.assertEqual(status, 400)
         self.assertIn("Insufficient balance", res["error"])
+        self.assertEqual(fake_conn.rollback_count, 1)
         self.assertFalse(fake_conn.commit_called)
 
         # Sikertelen hirdetés vásárlás - nincs feloldott garázs
         steps = [
-            {"expect": "FROM market_listings WHERE id = %s FOR UPDATE", "params": (7,), "fetch": "one", "result": {"id": 7, "bus_plate": "AAA-111", "seller_username": "bob", "price": 120000, "status": "active"}},
-            {"expect": "SELECT owner FROM bus", "params": ("AAA-111",), "fetch": "one", "result": {"owner": "bob"}},
-            {"expect": "SELECT balance FROM users", "params": ("alice",), "fetch": "one", "result": {"balance": 200000}},
+            {"expect": lock, "params": (7,), "fetch": "one", "result": listing},
             {"expect": "SELECT garage_id FROM user_garages", "params": ("alice",), "fetch": "one", "result": None},
         ]
         fake_conn = FakeConnection(steps=steps)
@@ -192,24 +323,25 @@ class TestMarketService(unittest.TestCase):
     def test_buy_bus(self):
         # Sikeres busz vásárlás
         steps = [
-            {"expect": "FROM bus WHERE plate = %s AND owner IS NULL", "params": ("AAA-111",), "fetch": "one", "result": {"plate": "AAA-111", "km": 0}},
+            {"expect": "FROM bus WHERE plate = %s AND owner IS NULL", "params": ("AAA-111",), "fetch": "one", "result": {"plate": "AAA-111", "km": 50000}},
             {"expect": "SELECT balance FROM users", "params": ("alice",), "fetch": "one", "result": {"balance": 150000}},
             {"expect": "SELECT 1 FROM user_garages", "params": ("alice", 2), "fetch": "one", "result": {"x": 1}},
-            {"expect": "UPDATE users SET balance = balance -", "params": (120000, "alice"), "fetch": None, "result": None},
+            {"expect": "UPDATE users SET balance = balance -", "params": (91000, "alice"), "fetch": None, "result": None},
             {"expect": "UPDATE bus", "params": ("alice", 2, "AAA-111"), "fetch": None, "result": None},
         ]
         fake_conn = FakeConnection(steps=steps)
         with patch.object(market_service, 'get_connection', return_value=fake_conn):
-            res, status = market_service.buy_bus("AAA-111", "alice", 120000, garage_id=2)
+            res, status = market_service.buy_bus("AAA-111", "alice", garage_id=2)
         self.assertEqual(status, 200)
-        self.assertIn("You bought bus AAA-111", res["message"])
+        # Az ár a futott km-ből számolt, nem a kliens által küldött
+        self.assertEqual(res["message"], "You bought bus AAA-111 for 91000")
         self.assertTrue(fake_conn.commit_called)
 
         # Busz sikertelen vásárlása (nem elérhető busz)
         steps = [{"expect": "FROM bus WHERE plate = %s AND owner IS NULL", "params": ("AAA-111",), "fetch": "one", "result": None}]
         fake_conn = FakeConnection(steps=steps)
         with patch.object(market_service, 'get_connection', return_value=fake_conn):
-            res, status = market_service.buy_bus("AAA-111", "alice", 120000)
+            res, status = market_service.buy_bus("AAA-111", "alice")
         self.assertEqual(status, 400)
         self.assertIn("not available", res["error"])
         self.assertFalse(fake_conn.commit_called)
@@ -221,7 +353,7 @@ class TestMarketService(unittest.TestCase):
         ]
         fake_conn = FakeConnection(steps=steps)
         with patch.object(market_service, 'get_connection', return_value=fake_conn):
-            res, status = market_service.buy_bus("AAA-111", "alice", 120000)
+            res, status = market_service.buy_bus("AAA-111", "alice")
         self.assertEqual(status, 404)
         self.assertIn("User not found", res["error"])
         self.assertFalse(fake_conn.commit_called)
@@ -233,7 +365,7 @@ class TestMarketService(unittest.TestCase):
         ]
         fake_conn = FakeConnection(steps=steps)
         with patch.object(market_service, 'get_connection', return_value=fake_conn):
-            res, status = market_service.buy_bus("AAA-111", "alice", 120000)
+            res, status = market_service.buy_bus("AAA-111", "alice")
         self.assertEqual(status, 400)
         self.assertIn("Insufficient balance", res["error"])
         self.assertFalse(fake_conn.commit_called)
@@ -310,5 +442,160 @@ class TestMarketService(unittest.TestCase):
             res, status = market_service.purchase_new_bus({"model_key": "Volvo", "rendszam": "ABC-123", "leiras": "x", "garazs": 1}, "alice")
         self.assertEqual(status, 400)
 
+    def test_buy_buses_batch(self):
+        # Egy lekérdezés a buszokra, egy a garázsokra, egy levonás és egy UPDATE az összes buszra
+        items = [
+            {"rendszam": "AAA-111", "garage_id": 2},
+            {"rendszam": "BBB-222", "garage_id": 9},
+            {"rendszam": "CCC-333"},
+            {"rendszam": "AAA-111"},
+        ]
+        total = market_service.used_bus_price(0) + market_service.used_bus_price(250000)
+        steps = [
+            {"expect": "FROM bus WHERE plate = ANY(%s) AND owner IS NULL ORDER BY plate FOR UPDATE",
+             "params": (["AAA-111", "BBB-222", "CCC-333"],), "fetch": "all",
+             "result": [{"plate": "AAA-111", "km": 0}, {"plate": "BBB-222", "km": 250000}]},
+            {"expect": "SELECT garage_id FROM user_garages", "params": ("alice",), "fetch": "all",
+             "result": [{"garage_id": 1}, {"garage_id": 2}]},
+            {"expect": "AND balance >= %s RETURNING balance", "params": (total, "alice", total),
+             "fetch": "one", "result": {"balance": 5000}},
+            {"expect": "FROM unnest(%s::varchar[], %s::int[]) AS t(plate, garage)",
+             "params": ("alice", ["AAA-111", "BBB-222"], [2, 1])},
+        ]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(market_service, 'get_connection', return_value=fake_conn):
+            res, status = market_service.buy_buses_batch("alice", items)
+        self.assertEqual(status, 200)
+        self.assertEqual([r["ok"] for r in res["results"]], [True, True, False, False])
+        self.assertEqual(res["results"][2]["error"], "Bus not available")
+        self.assertEqual(res["results"][3]["error"], "Duplicate bus in batch")
+        self.assertEqual((res["total_price"], res["new_balance"]), (total, 5000))
+        self.assertEqual(fake_conn.commit_count, 1)
+
+        # Elégtelen egyenleg: semmi sem változik
+        steps = steps[:2] + [{"expect": "AND balance >= %s RETURNING balance", "fetch": "one", "result": None}]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(market_service, 'get_connection', return_value=fake_conn):
+            res, status = market_service.buy_buses_batch("alice", items)
+        self.assertEqual(status, 400)
+        self.assertEqual(res["error"], "Insufficient balance")
+        self.assertFalse(any(r["ok"] for r in res["results"]))
+        self.assertEqual((fake_conn.commit_count, fake_conn.rollback_count), (0, 1))
+
+        # Egyetlen feldolgozható tétel sincs
+        steps = [
+            {"expect": "FROM bus WHERE plate = ANY(%s)", "fetch": "all", "result": []},
+            {"expect": "SELECT garage_id FROM user_garages", "fetch": "all", "result": []},
+        ]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(market_service, 'get_connection', return_value=fake_conn):
+            res, status = market_service.buy_buses_batch("alice", items[:1])
+        self.assertEqual(status, 400)
+        self.assertFalse(fake_conn.commit_called)
+
+        # Hibás kötegek
+        with self.assertRaises(ValueError):
+            market_service.buy_buses_batch("alice", [])
+        with self.assertRaises(ValueError):
+            market_service.buy_buses_batch("alice", [{"rendszam": "X"}] * (market_service.MAX_BATCH_SIZE + 1))
+
+    def test_create_listings_batch(self):
+        items = [
+            {"rendszam": "AAA-111", "price": 1000},
+            {"rendszam": "BBB-222", "price": 2000},
+            {"rendszam": "CCC-333", "price": 3000},
+            {"rendszam": "DDD-444", "price": -5},
+        ]
+        steps = [
+            {"expect": "WHERE b.plate = ANY(%s) ORDER BY b.plate FOR UPDATE OF b",
+             "params": (["AAA-111", "BBB-222", "CCC-333", "DDD-444"],), "fetch": "all",
+             "result": [
+                 {"plate": "AAA-111", "owner": "alice", "listing_id": None},
+                 {"plate": "BBB-222", "owner": "alice", "listing_id": 7},
+                 {"plate": "CCC-333", "owner": "bob", "listing_id": None},
+                 {"plate": "DDD-444", "owner": "alice", "listing_id": None},
+             ]},
+            {"expect": "INSERT INTO market_listings", "params": ("alice", ["AAA-111"], [1000]),
+             "fetch": "all", "result": [{"id": 42, "bus_plate": "AAA-111"}]},
+            {"expect": "pg_notify"},
+        ]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(market_service, 'get_connection', return_value=fake_conn):
+            res, status = market_service.create_listings_batch("alice", items)
+        self.assertEqual(status, 200)
+        self.assertEqual(res["results"][0], {"rendszam": "AAA-111", "ok": True, "price": 1000, "listing_id": 42})
+        self.assertEqual([r.get("error") for r in res["results"][1:]],
+                         ["Bus already listed", "You do not own this bus", "Invalid price"])
+        self.assertEqual(fake_conn.commit_count, 1)
+
+        # Párhuzamos hirdetés ugyanarra a buszra
+        steps[1] = {"expect": "INSERT INTO market_listings", "raise": UniqueViolation()}
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(market_service, 'get_connection', return_value=fake_conn):
+            res, status = market_service.create_listings_batch("alice", items)
+        self.assertEqual(status, 409)
+        self.assertEqual((fake_conn.commit_count, fake_conn.rollback_count), (0, 1))
+
+    def test_purchase_new_buses_batch(self):
+        volvo = market_service.NEW_BUS_MODELS["Volvo"]
+        modulo = market_service.NEW_BUS_MODELS["Modulo"]
+        items = [
+            {"model_key": "Volvo", "rendszam": "abc-123", "leiras": "a", "garazs": 1},
+            {"model_key": "Modulo", "rendszam": "ABD-124", "leiras": "b", "garazs": 1},
+            {"model_key": "Volvo", "rendszam": "ABE-125", "leiras": "c", "garazs": 3},
+            {"model_key": "Volvo", "rendszam": "ABF-126", "leiras": "d", "garazs": 1},
+            {"model_key": "Volvo", "rendszam": "ABC-123", "leiras": "e", "garazs": 1},
+            {"model_key": "Tatra", "rendszam": "ABG-127", "leiras": "f", "garazs": 1},
+        ]
+        total = volvo["price"] + modulo["price"]
+        steps = [
+            {"expect": "FROM user_garages WHERE username = %s AND garage_id = ANY(%s)",
+             "params": ("alice", [1, 3]), "fetch": "all", "result": [{"garage_id": 1}]},
+            {"expect": "SELECT plate FROM bus WHERE plate = ANY(%s)",
+             "params": (["ABC-123", "ABD-124", "ABE-125", "ABF-126", "ABG-127"],),
+             "fetch": "all", "result": [{"plate": "ABF-126"}]},
+            {"expect": "RETURNING balance", "params": (total, "alice", total), "fetch": "one", "result": {"balance": 10}},
+            {"expect": "INSERT INTO bus", "params": (
+                "alice", ["ABC-123", "ABD-124"], [volvo["tipus"], modulo["tipus"]],
+                [volvo["evjarat"], modulo["evjarat"]], [1, 1], ["a", "b"],
+            )},
+        ]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(market_service, 'get_connection', return_value=fake_conn):
+            res, status = market_service.purchase_new_buses_batch("alice", items)
+        self.assertEqual(status, 200)
+        self.assertEqual([r.get("error") for r in res["results"]], [
+            None, None, "Garage not unlocked", "License plate already exists",
+            "Duplicate license plate in batch", "Invalid model selected",
+        ])
+        self.assertEqual((res["total_price"], res["new_balance"]), (total, 10))
+        self.assertEqual(fake_conn.commit_count, 1)
+
+        # Hiányzó mező egy tételben: csak az a tétel hibás, a többi megvásárolható
+        items = [
+            {"model_key": "Volvo", "rendszam": "ABC-123"},
+            {"model_key": "Volvo", "rendszam": "ABD-124", "leiras": "b", "garazs": "1"},
+            {"model_key": "Volvo", "rendszam": "ABE-125", "leiras": "c", "garazs": 1},
+        ]
+        steps = [
+            {"expect": "FROM user_garages WHERE username = %s AND garage_id = ANY(%s)",
+             "params": ("alice", [1]), "fetch": "all", "result": [{"garage_id": 1}]},
+            {"expect": "SELECT plate FROM bus WHERE plate = ANY(%s)",
+             "params": (["ABC-123", "ABD-124", "ABE-125"],), "fetch": "all", "result": []},
+            {"expect": "RETURNING balance", "params": (volvo["price"], "alice", volvo["price"]),
+             "fetch": "one", "result": {"balance": 10}},
+            {"expect": "INSERT INTO bus", "params": (
+                "alice", ["ABE-125"], [volvo["tipus"]], [volvo["evjarat"]], [1], ["c"],
+            )},
+        ]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(market_service, 'get_connection', return_value=fake_conn):
+            res, status = market_service.purchase_new_buses_batch("alice", items)
+        self.assertEqual(status, 200)
+        self.assertEqual([r.get("error") for r in res["results"]], [
+            "leiras is missing; garazs is missing", "garazs must be int", None,
+        ])
+        self.assertEqual(fake_conn.commit_count, 1)
+
 if __name__ == "__main__":
     unittest.main()
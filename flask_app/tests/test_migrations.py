@@ -0,0 +1,58 @@
+import re
+import unittest
+from db import migrations
+from db_fakes import FakeConnection
+
+
+def _steps(done, pending):
+    steps = [
+        {"expect": "CREATE TABLE IF NOT EXISTS schema_migrations"},
+        {"expect": "pg_advisory_xact_lock", "params": (migrations.MIGRATION_LOCK_KEY,)},
+        {"expect": "SELECT version FROM schema_migrations", "fetch": "all",
+         "result": [{"version": v} for v in done]},
+    ]
+    for version, name, _ in migrations.MIGRATIONS:
+        if version in pending:
+            steps.append({})
+            steps.append({"expect": "INSERT INTO schema_migrations", "params": (version, name)})
+    return steps
+
+
+class TestMigrations(unittest.TestCase):
+    def test_versions_are_sequential(self):
+        versions = [version for version, _, _ in migrations.MIGRATIONS]
+        self.assertEqual(versions, list(range(1, len(versions) + 1)))
+
+    def test_applies_only_pending_migrations(self):
+        latest = migrations.MIGRATIONS[-1][0]
+        conn = FakeConnection(steps=_steps(done=range(1, latest), pending=[latest]))
+        self.assertEqual(migrations.migrate(conn), [latest])
+        self.assertEqual(conn.commit_count, 1)
+
+    def test_up_to_date_schema_is_noop(self):
+        done = [version for version, _, _ in migrations.MIGRATIONS]
+        conn = FakeConnection(steps=_steps(done=done, pending=[]))
+        self.assertEqual(migrations.migrate(conn), [])
+
+    def test_hot_query_indexes(self):
+        sql = " ".join(" ".join(m[2].split()) for m in migrations.MIGRATIONS)
+        for table, columns in [
+            ("schedules", "status, frame"),
+            ("schedules", "line_name, frame"),
+            ("schedule_assignments", "bus_plate"),
+            ("market_listings", "bus_plate, status"),
+            ("issues", "bus"),
+            ("bus", "owner"),
+        ]:
+            self.assertRegex(sql, rf"CREATE INDEX IF NOT EXISTS \w+ ON {table} \({re.escape(columns)}\)")
+        self.assertIn("ON market_listings (created_at, id) WHERE status = 'active'", sql)
+        self.assertIn("DROP INDEX IF EXISTS market_listings_active_created_at_idx", sql)
+
+    def test_issue_archive_is_partitioned_by_resolution_time(self):
+        sql = " ".join(" ".join(m[2].split()) for m in migrations.MIGRATIONS)
+        self.assertIn("ALTER TABLE issues ADD COLUMN IF NOT EXISTS reported_at", sql)
+        self.assertIn(") PARTITION BY RANGE (resolved_at);", sql)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import random
+import unittest
+from services.planner import plan_blocks, PlanCache
+from services.schedule_service import generate_slots
+
+
+# A korábbi, minden indulásnál újrarendező mohó tervező, referenciaként
+def reference_plan(slots, travel_time_garage, travel_time_line):
+    def to_min(tstr):
+        h, m = map(int, tstr.split(":"))
+        return h * 60 + m
+
+    def to_str(mins):
+        mins_mod = mins % (24 * 60)
+        return f"{(mins_mod // 60) % 24:02d}:{mins_mod % 60:02d}"
+
+    class Bus:
+        def __init__(self, idx, first_dep):
+            self.idx = idx
+            self.departures = [first_dep]
+            self.breaks = []
+            self.duty_start = first_dep - travel_time_garage
+            self.shift_start = self.duty_start
+            self.last_trip_end = first_dep + 2 * travel_time_line
+            self.next_available = self.last_trip_end
+
+    buses = []
+    for dep in [to_min(s) for s in slots]:
+        assigned = False
+        buses.sort(key=lambda b: b.next_available)
+        for b in buses:
+            if dep < b.next_available:
+                continue
+            if dep - b.shift_start >= 240:
+                if dep - b.last_trip_end >= 30:
+                    break_end = b.last_trip_end + 30
+                    b.breaks.append({"start": b.last_trip_end, "end": break_end})
+                    b.shift_start = break_end
+                    b.next_available = max(b.next_available, break_end)
+                    if dep < b.next_available:
+                        continue
+                else:
+                    continue
+            b.departures.append(dep)
+            b.last_trip_end = dep + 2 * travel_time_line
+            b.next_available = b.last_trip_end
+            assigned = True
+            break
+        if not assigned:
+            buses.append(Bus(len(buses) + 1, dep))
+
+    return [
+        {
+            "bus_id": b.idx,
+            "duty_start": to_str(b.duty_start),
+            "duty_end": to_str(b.last_trip_end + travel_time_garage),
+            "departures": [to_str(t) for t in b.departures],
+            "breaks": [{"start": to_str(br["start"]), "end": to_str(br["end"])} for br in b.breaks],
+        }
+        for b in buses
+    ]
+
+
+class TestPlanner(unittest.TestCase):
+    def test_single_bus(self):
+        slots = generate_slots("08:00", "10:00", 60)
+        blocks = plan_blocks(slots, 10, 30)
+        self.assertEqual(len(blocks), 1)
+        self.assertEqual(blocks[0]["departures"], ["08:00", "09:00", "10:00"])
+        self.assertEqual(blocks[0]["duty_end"], "11:10")
+
+    def test_break_after_continuous_work(self):
+        slots = generate_slots("04:00", "12:00", 20)
+        blocks = plan_blocks(slots, 15, 25)
+        self.assertTrue(any(b["breaks"] for b in blocks))
+        self.assertEqual(blocks, reference_plan(slots, 15, 25))
+
+    def test_matches_reference_planner(self):
+        rng = random.Random(1234)
+        windows = [("04:00", "08:00"), ("08:00", "12:00"), ("20:00", "24:00"), ("00:00", "24:00"), ("22:00", "02:00")]
+        for _ in range(300):
+            start, end = rng.choice(windows)
+            frequency = rng.choice([1, 2, 3, 5, 7, 10, 12, 15, 20, 30, 45, 60, 90])
+            travel_time_garage = rng.randint(0, 40)
+            travel_time_line = rng.randint(1, 150)
+            slots = generate_slots(start, end, frequency)
+            with self.subTest(start=start, end=end, frequency=frequency,
+                              garage=travel_time_garage, line=travel_time_line):
+                self.assertEqual(
+                    plan_blocks(slots, travel_time_garage, travel_time_line),
+                    reference_plan(slots, travel_time_garage, travel_time_line),
+                )
+
+
+class TestPlanCache(unittest.TestCase):
+    def test_hits_and_misses(self):
+        cache = PlanCache(maxsize=4)
+        builds = []
+        build = lambda: builds.append(1) or {"blocks": []}
+        first = cache.get_or_build((10, 30, "08:00", "12:00", 10), build)
+        second = cache.get_or_build((10, 30, "08:00", "12:00", 10), build)
+        self.assertIs(first, second)
+        self.assertEqual(len(builds), 1)
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["hit_rate"]), (1, 1, 0.5))
+
+    def test_lru_eviction(self):
+        cache = PlanCache(maxsize=2)
+        for freq in (10, 20):
+            cache.get_or_build((10, 30, "08:00", "12:00", freq), dict)
+        cache.get_or_build((10, 30, "08:00", "12:00", 10), dict)
+        cache.get_or_build((10, 30, "08:00", "12:00", 30), dict)
+        cache.get_or_build((10, 30, "08:00", "12:00", 10), dict)
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertEqual(cache.stats()["hits"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from services.recompute_queue import WinnerRecomputeQueue
+
+
+class TestWinnerRecomputeQueue(unittest.TestCase):
+    def test_flush_coalesces_duplicate_keys(self):
+        batches = []
+        queue = WinnerRecomputeQueue(batches.append)
+        for _ in range(20):
+            queue.enqueue("7E", "night")
+        queue.enqueue("106", "night")
+        self.assertEqual(queue.stats()["depth"], 2)
+        queue.flush()
+        self.assertEqual(batches, [[("7E", "night"), ("106", "night")]])
+        stats = queue.stats()
+        self.assertEqual((stats["depth"], stats["coalesced"], stats["processed"]), (0, 19, 2))
+        self.assertIsNotNone(stats["last_lag_seconds"])
+
+    def test_worker_processes_in_batches(self):
+        batches = []
+        queue = WinnerRecomputeQueue(batches.append, batch_size=2, coalesce_seconds=0.01)
+        for frame in ("morning", "midday", "evening"):
+            queue.enqueue("9", frame)
+        queue.start()
+        queue.stop()
+        self.assertEqual([len(b) for b in batches], [2, 1])
+        self.assertFalse(queue.stats()["worker_alive"])
+
+    def test_failed_batch_is_retried(self):
+        calls = []
+        def flaky(pairs):
+            calls.append(pairs)
+            if len(calls) < 3:
+                raise RuntimeError("db down")
+        queue = WinnerRecomputeQueue(flaky, retry_seconds=0)
+        queue.enqueue("9", "night")
+        with self.assertLogs("services.recompute_queue", level="ERROR"):
+            queue.flush()
+        self.assertEqual(calls, [[("9", "night")]] * 3)
+        stats = queue.stats()
+        self.assertEqual((stats["errors"], stats["retried"], stats["dropped"], stats["processed"]), (2, 2, 0, 1))
+        self.assertEqual((stats["depth"], stats["retrying"]), (0, 0))
+
+    def test_retry_waits_for_backoff_and_gives_up(self):
+        def fail(_):
+            raise RuntimeError("db down")
+        queue = WinnerRecomputeQueue(fail, max_attempts=2, retry_seconds=60)
+        queue.enqueue("9", "night")
+        with self.assertLogs("services.recompute_queue", level="ERROR"):
+            queue.flush()
+        # A visszatett pár még nem esedékes
+        self.assertEqual((queue.stats()["depth"], queue.stats()["retrying"]), (1, 1))
+        queue._not_before[("9", "night")] = 0
+        with self.assertLogs("services.recompute_queue", level="ERROR") as logs:
+            queue.flush()
+        self.assertIn("Giving up winner recompute after 2 attempts", logs.output[-1])
+        stats = queue.stats()
+        self.assertEqual((stats["depth"], stats["errors"], stats["dropped"]), (0, 2, 1))
+
+if __name__ == "__main__":
+    unittest.main()
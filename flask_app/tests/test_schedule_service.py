@@ -9,6 +9,93 @@ class TestScheduleService(unittest.TestCase):
         slots = schedule_service.generate_slots("08:00", "10:00", 30)
         self.assertEqual(slots, ["08:00", "08:30", "09:00", "09:30", "10:00"])
 
+    def test_payout_for_active_schedules(self):
+        now = datetime(2024, 1, 1, 8, 25)
+        steps = [
+            {
+                "expect": "SELECT MIN(tick_at) AS first_tick FROM payout_ticks",
+                "fetch": "one",
+                "result": {"first_tick": None},
+            },
+            {
+                "expect": "INSERT INTO payout_ticks",
+                "params": ([now.date()], ["midday"], [2], [datetime(2024, 1, 1, 8, 20)]),
+                "fetch": "all",
+                "result": [{"frame": "midday", "tick_idx": 2}],
+            },
+            {
+                "expect": "UPDATE users u SET balance = u.balance + p.amount",
+                "params": (["midday"], [2]),
+                "fetch": "all",
+                "result": [{"username": "alice", "amount": 209, "balance": 10209}],
+                "rowcount": 1,
+            },
+            {
+                "expect": "INSERT INTO bus_km_events (bus_plate, km) SELECT sa.bus_plate, %s * COUNT(*)",
+                "params": (10, ["midday"], [2]),
+                "fetch": None,
+                "rowcount": 3,
+            },
+            {
+                "expect": "SELECT pg_notify",
+                "params": ("bkv_events", ['{"type": "balance_changed", "username": "alice", "delta": 209, '
+                                          '"balance": 10209, "reason": "payout"}']),
+            },
+        ]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(schedule_service, 'get_connection', return_value=fake_conn):
+            paid = schedule_service.payout_for_active_schedules(now)
+        self.assertEqual(paid, [{"frame": "midday", "tick_idx": 2}])
+        self.assertEqual(fake_conn.commit_count, 1)
+        self.assertIn("ON CONFLICT DO NOTHING", fake_conn.cursor().queries[1])
+
+    def test_payout_skips_already_paid_tick(self):
+        steps = [
+            {"expect": "FROM payout_ticks", "fetch": "one", "result": {"first_tick": datetime(2024, 1, 1, 8, 0)}},
+            {"expect": "INSERT INTO payout_ticks", "fetch": "all", "result": []},
+        ]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(schedule_service, 'get_connection', return_value=fake_conn):
+            paid = schedule_service.payout_for_active_schedules(datetime(2024, 1, 1, 8, 25))
+        self.assertEqual(paid, [])
+        # Az idősáv korábbi tickjei is pótlásra jelölődnek
+        self.assertEqual(fake_conn.cursor().params_list[1][2], [0, 1, 2])
+
+    def test_catch_up_missed_payouts(self):
+        first_tick = datetime(2024, 1, 1, 11, 40)
+        steps = [
+            {"expect": "FROM payout_ticks", "fetch": "one", "result": {"first_tick": first_tick}},
+            {
+                "expect": "INSERT INTO payout_ticks",
+                "fetch": "all",
+                "result": [{"frame": "midday", "tick_idx": 23}, {"frame": "afternoon", "tick_idx": 0}],
+            },
+            {"expect": "UPDATE users u", "params": (["midday", "afternoon"], [23, 0]), "fetch": "all", "result": []},
+            {"expect": "INSERT INTO bus_km_events", "params": (10, ["midday", "afternoon"], [23, 0]), "fetch": None},
+        ]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(schedule_service, 'get_connection', return_value=fake_conn):
+            paid = schedule_service.catch_up_missed_payouts(datetime(2024, 1, 1, 12, 5))
+        self.assertEqual(len(paid), 2)
+        ticks = fake_conn.cursor().params_list[1]
+        self.assertEqual(ticks[1], ["midday", "midday", "afternoon"])
+        self.assertEqual(ticks[2], [22, 23, 0])
+
+    def test_catch_up_with_empty_ledger(self):
+        steps = [{"expect": "FROM payout_ticks", "fetch": "one", "result": {"first_tick": None}}]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(schedule_service, 'get_connection', return_value=fake_conn):
+            paid = schedule_service.catch_up_missed_payouts(datetime(2024, 1, 1, 12, 5))
+        self.assertEqual(paid, [])
+        self.assertFalse(fake_conn.commit_called)
+
+    def test_payout_outside_frames(self):
+        fake_conn = FakeConnection(steps=[])
+        with patch.object(schedule_service, 'get_connection', return_value=fake_conn):
+            paid = schedule_service.payout_for_active_schedules(datetime(2024, 1, 1, 2, 0))
+        self.assertEqual(paid, [])
+        self.assertFalse(fake_conn.commit_called)
+
     def test_plan_buses_for_schedule(self):
         schedule_row = {
             "id": 5,
@@ -29,12 +116,6 @@ class TestScheduleService(unittest.TestCase):
                 "fetch": "one",
                 "result": schedule_row,
             },
-            {
-                "expect": "FROM lines WHERE name = %s",
-                "params": ("10",),
-                "fetch": "one",
-                "result": {"travel_time_garage": 10, "travel_time_line": 30},
-            },
             {
                 "expect": "FROM schedule_assignments WHERE schedule_id = %s",
                 "params": (5,),
@@ -43,8 +124,12 @@ class TestScheduleService(unittest.TestCase):
             },
         ]
         fake_conn = FakeConnection(steps=steps)
-        with patch.object(schedule_service, 'get_connection', return_value=fake_conn):
+        line = {"name": "10", "provider_garage_id": 1, "travel_time_garage": 10, "travel_time_line": 30}
+        with patch.object(schedule_service, 'get_connection', return_value=fake_conn), \
+                patch.object(schedule_service.line_catalog, 'get', return_value=line) as catalog_get:
             plan = schedule_service.plan_buses_for_schedule(5)
+        # A menetidők a vonalkatalógusból jönnek, a lines táblát nem kérdezi le
+        catalog_get.assert_called_once_with("10")
         self.assertEqual(plan["schedule_id"], 5)
         self.assertEqual(plan["line_name"], "10")
         self.assertEqual(plan["frequency"], 60)
@@ -52,159 +137,130 @@ class TestScheduleService(unittest.TestCase):
         self.assertEqual(plan["buses_used"], 1)
         self.assertEqual(len(plan["assignments"]), 1)
         self.assertIn("duty_start", plan["assignments"][0])
+        self.assertIn("plan", fake_conn.cursor().queries[0])
+
+    def test_get_schedule_omits_plan(self):
+        # A tárolt terv és blokkszám nem kerül a menetrend-végpontok válaszába
+        steps = [{"expect": "FROM schedules WHERE id = %s", "params": (5,), "fetch": "one", "result": {"id": 5}}]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(schedule_service, 'get_connection', return_value=fake_conn):
+            schedule_service.get_schedule(5)
+        query = fake_conn.cursor().queries[0]
+        self.assertNotIn("plan", query)
+        self.assertNotIn("required_blocks", query)
 
     def test_has_all_assignments(self):
-        schedule_row = {
-            "id": 6,
-            "username": "alice",
-            "line_name": "10",
-            "garage_id": 1,
-            "frame": "midday",
-            "start_time": datetime(2024, 1, 1, 8, 0),
-            "end_time": datetime(2024, 1, 1, 10, 0),
-            "frequency": 120,
-            "bid_price": 4000,
-            "status": "pending"
-        }
         steps = [
             {
-                "expect": "FROM schedules WHERE id = %s",
+                "expect": "LEFT JOIN schedule_assignments sa ON sa.schedule_id = s.id WHERE s.id = %s",
                 "params": (6,),
                 "fetch": "one",
-                "result": schedule_row,
-            },
-            {
-                "expect": "FROM lines WHERE name = %s",
-                "params": ("10",),
-                "fetch": "one",
-                "result": {"travel_time_garage": 10, "travel_time_line": 30},
-            },
-            {
-                "expect": "FROM schedule_assignments WHERE schedule_id = %s",
-                "params": (6,),
-                "fetch": "all",
-                "result": [{"block_idx": 0, "bus_plate": "AAA-111"}],
-            },
-            {
-                "expect": "SELECT COUNT(*) AS count FROM schedule_assignments",
-                "params": (6,),
-                "fetch": "one",
-                "result": {"count": 1},
+                "result": {"required_blocks": 1, "assigned_blocks": 1},
             },
         ]
         fake_conn = FakeConnection(steps=steps)
         with patch.object(schedule_service, 'get_connection', return_value=fake_conn):
             ok = schedule_service.has_all_assignments(6)
         self.assertTrue(ok)
+        self.assertEqual(len(fake_conn.cursor().queries), 1)
 
     def test_select_winner_for_line_frame(self):
         schedules_fetch = [
-            {"id": 1, "frequency": 30, "bid_price": 5000},
-            {"id": 2, "frequency": 60, "bid_price": 4000},
+            {"id": 1, "line_name": "10", "frame": "midday", "frequency": 30, "bid_price": 5000, "status": "pending",
+             "required_blocks": 2, "assigned_blocks": 2},
+            {"id": 2, "line_name": "10", "frame": "midday", "frequency": 60, "bid_price": 4000, "status": "active",
+             "required_blocks": 1, "assigned_blocks": 1},
+            {"id": 3, "line_name": "10", "frame": "midday", "frequency": 20, "bid_price": 3000, "status": "lost",
+             "required_blocks": 3, "assigned_blocks": 1},
         ]
-        schedule_row_1 = {
-            "id": 1,
-            "username": "alice",
-            "line_name": "10",
-            "garage_id": 1,
-            "frame": "midday",
-            "start_time": datetime(2024, 1, 1, 8, 0),
-            "end_time": datetime(2024, 1, 1, 10, 0),
-            "frequency": 30,
-            "bid_price": 5000,
-            "status": "pending"
-        }
-        schedule_row_2 = {
-            "id": 2,
-            "username": "bob",
-            "line_name": "10",
-            "garage_id": 1,
-            "frame": "midday",
-            "start_time": datetime(2024, 1, 1, 8, 0),
-            "end_time": datetime(2024, 1, 1, 10, 0),
-            "frequency": 60,
-            "bid_price": 4000,
-            "status": "pending"
-        }
         steps = [
             {
-                "expect": "FROM schedules",
-                "params": ("10", "midday"),
+                "expect": "JOIN unnest(%s::text[], %s::text[]) AS p(line_name, frame)",
+                "params": (["10"], ["midday"]),
                 "fetch": "all",
                 "result": schedules_fetch,
             },
             {
-                "expect": "FROM schedules WHERE id = %s",
-                "params": (1,),
-                "fetch": "one",
-                "result": schedule_row_1,
+                "expect": "UPDATE schedules s SET status = v.status",
+                "params": ([1, 2], ["active", "lost"]),
+                "fetch": None,
+                "result": None,
             },
             {
-                "expect": "FROM lines WHERE name = %s",
-                "params": ("10",),
-                "fetch": "one",
-                "result": {"travel_time_garage": 10, "travel_time_line": 30},
+                "expect": "SELECT pg_notify",
+                "params": ("bkv_events", ['{"type": "winner_changed", "line_name": "10", "frame": "midday", '
+                                          '"schedule_id": 1, "previous_id": 2}']),
             },
+        ]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(schedule_service, 'get_connection', return_value=fake_conn):
+            winner = schedule_service.select_winner_for_line_frame("10", "midday")
+        self.assertEqual(winner, 1)
+        self.assertTrue(fake_conn.commit_called)
+        self.assertTrue(any("UPDATE schedules s SET status" in q for q in fake_conn.cursor().queries))
+
+    def test_select_winners_for_many_pairs(self):
+        schedules_fetch = [
+            {"id": 1, "line_name": "10", "frame": "midday", "frequency": 30, "bid_price": 5000, "status": "active",
+             "required_blocks": 2, "assigned_blocks": 2},
+            {"id": 5, "line_name": "7E", "frame": "night", "frequency": 30, "bid_price": 5000, "status": "active",
+             "required_blocks": 2, "assigned_blocks": 1},
+        ]
+        steps = [
             {
-                "expect": "FROM schedule_assignments WHERE schedule_id = %s",
-                "params": (1,),
+                "expect": "FROM schedules s JOIN unnest",
+                "params": (["10", "7E", "9"], ["midday", "night", "morning"]),
                 "fetch": "all",
-                "result": [
-                    {"block_idx": 0, "bus_plate": "AAA-111"},
-                    {"block_idx": 1, "bus_plate": "AAA-222"},
-                ],
-            },
-            {
-                "expect": "SELECT COUNT(*) AS count FROM schedule_assignments",
-                "params": (1,),
-                "fetch": "one",
-                "result": {"count": 2},
+                "result": schedules_fetch,
             },
             {
-                "expect": "FROM schedules WHERE id = %s",
-                "params": (2,),
-                "fetch": "one",
-                "result": schedule_row_2,
+                "expect": "UPDATE schedules s SET status = v.status",
+                "params": ([5], ["pending"]),
+                "fetch": None,
             },
+            {"expect": "SELECT pg_notify"},
+        ]
+        fake_conn = FakeConnection(steps=steps)
+        with patch.object(schedule_service, 'get_connection', return_value=fake_conn):
+            winners = schedule_service.select_winners([
+                ("10", "midday"), ("7E", "night"), ("10", "midday"), ("9", "morning"),
+            ])
+        self.assertEqual(winners, {("10", "midday"): 1, ("7E", "night"): None, ("9", "morning"): None})
+        self.assertEqual(len(fake_conn.cursor().queries), 3)
+        # Csak a ténylegesen megváltozott nyertes kerül az eseménybe
+        self.assertEqual(len(fake_conn.cursor().params_list[2][1]), 1)
+
+    def test_select_winner_backfills_invalidated_plan(self):
+        schedules_fetch = [
+            {"id": 4, "line_name": "10", "frame": "midday", "frequency": 60, "bid_price": 4000, "status": "pending",
+             "required_blocks": None, "assigned_blocks": 1,
+             "start_time": datetime(2024, 1, 1, 8, 0), "end_time": datetime(2024, 1, 1, 10, 0)},
+        ]
+        steps = [
+            {"expect": "FROM schedules s", "params": (["10"], ["midday"]), "fetch": "all", "result": schedules_fetch},
             {
                 "expect": "FROM lines WHERE name = %s",
                 "params": ("10",),
                 "fetch": "one",
                 "result": {"travel_time_garage": 10, "travel_time_line": 30},
             },
-            {
-                "expect": "FROM schedule_assignments WHERE schedule_id = %s",
-                "params": (2,),
-                "fetch": "all",
-                "result": [
-                    {"block_idx": 0, "bus_plate": "BBB-333"},
-                ],
-            },
-            {
-                "expect": "SELECT COUNT(*) AS count FROM schedule_assignments",
-                "params": (2,),
-                "fetch": "one",
-                "result": {"count": 1},
-            },
-            {
-                "expect": "UPDATE schedules SET status =",
-                "params": ("active", 1),
-                "fetch": None,
-                "result": None,
-            },
-            {
-                "expect": "UPDATE schedules SET status =",
-                "params": ("lost", 2),
-                "fetch": None,
-                "result": None,
-            },
+            {"expect": "UPDATE schedules SET required_blocks = %s, plan = %s WHERE id = %s", "fetch": None},
+            {"expect": "UPDATE schedules s SET status = v.status", "params": ([4], ["active"]), "fetch": None},
+            {"expect": "SELECT pg_notify"},
         ]
         fake_conn = FakeConnection(steps=steps)
         with patch.object(schedule_service, 'get_connection', return_value=fake_conn):
             winner = schedule_service.select_winner_for_line_frame("10", "midday")
-        self.assertEqual(winner, 1)
-        self.assertTrue(fake_conn.commit_called)
-        self.assertTrue(any("UPDATE schedules SET status" in q for q in fake_conn.cursor().queries))
+        self.assertEqual(winner, 4)
+        self.assertEqual(fake_conn.cursor().params_list[2][0], 1)
+
+    def test_build_plan(self):
+        plan = schedule_service.build_plan(10, 30, "08:00", "10:00", 30)
+        self.assertEqual(plan["slots"], ["08:00", "08:30", "09:00", "09:30", "10:00"])
+        self.assertEqual(len(plan["blocks"]), 2)
+        self.assertEqual(plan["blocks"][0]["departures"], ["08:00", "09:00", "10:00"])
+        self.assertEqual(plan["blocks"][0]["duty_start"], "07:50")
+        self.assertNotIn("assigned_bus", plan["blocks"][0])
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,52 @@
+import json
+import unittest
+from datetime import time
+from unittest.mock import patch
+from services import schedule_service
+from services.winners_snapshot import WinnersSnapshot
+from db_fakes import FakeConnection
+
+
+class FakeVersions:
+    def __init__(self, version):
+        self.version = version
+
+    def current(self, tables):
+        return None if self.version is None else ("epoch", self.version)
+
+
+class TestWinnersSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.rows = [
+            {"line_name": "7E", "id": 2, "username": "bob", "start_time": time(20, 0), "end_time": time(0, 0),
+             "frequency": 40, "bid_price": 900, "frame": "night"},
+            {"line_name": "106", "id": 1, "username": "alice", "start_time": time(6, 0), "end_time": time(10, 0),
+             "frequency": 15, "bid_price": 500, "frame": "morning"},
+        ]
+        self.versions = FakeVersions(1)
+        self.snapshot = WinnersSnapshot(versions=self.versions)
+
+    def winners_step(self):
+        return {"expect": "WHERE status = 'active'", "fetch": "all", "result": self.rows}
+
+    def test_serves_and_filters_without_database_until_winners_change(self):
+        fake_conn = FakeConnection(steps=[self.winners_step(), self.winners_step()])
+        with patch.object(schedule_service, 'get_connection', return_value=fake_conn):
+            everything = json.loads(self.snapshot.serialized())
+            self.assertEqual([w["line_name"] for w in everything], ["106", "7E"])
+            self.assertEqual(everything[0]["start_time"], "06:00")
+            self.assertEqual(everything[1]["end_time"], "00:00")
+            self.assertEqual([w["id"] for w in json.loads(self.snapshot.serialized(line_name="7E"))], [2])
+            self.assertEqual([w["id"] for w in json.loads(self.snapshot.serialized(frame="morning"))], [1])
+            self.assertEqual(self.snapshot.serialized(line_name="7E", frame="morning"), b"[]")
+            self.assertEqual(len(fake_conn.cursor().queries), 1)
+
+            self.versions.version = 2
+            self.snapshot.serialized()
+        self.assertEqual(len(fake_conn.cursor().queries), 2)
+        stats = self.snapshot.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (3, 2, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,17 @@
+# Nagyobb, egyben küldött JSON-dokumentumok (oldalbetöltő végpontok) gzip-tömörítése,
+# ha a kliens elfogadja; a kis válaszokat a tömörítés csak lassítaná
+import gzip
+import json
+from flask import Response, request
+
+MIN_COMPRESS_BYTES = 1024
+
+def compressed_json(payload, status=200):
+    body = json.dumps(payload, default=str, separators=(",", ":")).encode()
+    response = Response(mimetype="application/json", status=status)
+    response.vary.add("Accept-Encoding")
+    if len(body) >= MIN_COMPRESS_BYTES and "gzip" in request.accept_encodings:
+        body = gzip.compress(body, compresslevel=6)
+        response.headers["Content-Encoding"] = "gzip"
+    response.set_data(body)
+    return response
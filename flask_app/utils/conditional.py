@@ -0,0 +1,46 @@
+# Feltételes GET: a válasz ETag-je egy olcsón lekérdezhető verzióból és a kérés paramétereiből képződik,
+# egyező If-None-Match esetén a végpont az adatok lekérdezése nélkül 304-et ad
+import hashlib
+from functools import wraps
+from flask import make_response, request, session
+from db.versions import table_versions
+
+# Mindenkinek azonos válaszok: köztes gyorsítótár is tárolhatja, de minden használat előtt ellenőrizni kell
+SHARED_CACHE_CONTROL = "public, no-cache"
+
+def make_etag(*parts):
+    return hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest()[:24]
+
+def with_etag(response, etag, cache_control="private, no-cache"):
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+# 304-es válasz, ha a kliens már ezt a változatot tárolja; egyébként None
+def not_modified(etag, cache_control="private, no-cache"):
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    return with_etag(make_response("", 304), etag, cache_control)
+
+# Feltételes GET a nézet által olvasott táblák verziói alapján (db/versions.py). Az ETag az útvonalból,
+# a lekérdezési paraméterekből, per_user esetén a felhasználóból és a verziókból képződik; egyező
+# If-None-Match esetén a nézet (és az adatbázis) helyett azonnal 304 a válasz. Csak a 200-as
+# válaszok kapnak ETag-et; amíg a verziók nem követhetők, a nézet feltétel nélkül fut.
+def versioned(*tables, per_user=False, cache_control="private, no-cache"):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            versions = table_versions.current(tables)
+            if versions is None:
+                return view(*args, **kwargs)
+            etag = make_etag(request.path, request.query_string.decode(),
+                             session.get("username") if per_user else "*", *versions)
+            cached = not_modified(etag, cache_control)
+            if cached is not None:
+                return cached
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                with_etag(response, etag, cache_control)
+            return response
+        return wrapper
+    return decorator
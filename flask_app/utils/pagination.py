@@ -0,0 +1,105 @@
+import base64
+import json
+from datetime import date, datetime
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def int_param(params, name):
+    raw = params.get(name)
+    if raw is None or raw == "":
+        return None
+    try:
+        return int(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer")
+
+
+# Rendezési mezők leírása: nyilvános név -> (SQL oszlop, eredménykulcs, nullázható, fordított irány)
+class SortField:
+    def __init__(self, column, key, nullable=False, inverted=False):
+        self.column = column
+        self.key = key
+        self.nullable = nullable
+        self.inverted = inverted
+
+
+# Lapozási paraméterek (sort, order, limit, cursor) értelmezése
+class PageRequest:
+    def __init__(self, params, sorts, default_sort, default_order="asc"):
+        params = params or {}
+        self.sort = params.get("sort") or default_sort
+        if self.sort not in sorts:
+            raise ValueError(f"sort must be one of: {', '.join(sorts)}")
+        self.field = sorts[self.sort]
+
+        self.order = params.get("order") or (default_order if self.sort == default_sort else "asc")
+        if self.order not in ("asc", "desc"):
+            raise ValueError("order must be asc or desc")
+
+        limit = int_param(params, "limit") or DEFAULT_PAGE_SIZE
+        self.limit = max(1, min(MAX_PAGE_SIZE, limit))
+        self.after = self._decode(params.get("cursor"))
+
+    @property
+    def descending(self):
+        return (self.order == "desc") != self.field.inverted
+
+    def _decode(self, cursor):
+        if not cursor:
+            return None
+        try:
+            sort, order, value, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (ValueError, TypeError):
+            raise ValueError("Invalid cursor")
+        if sort != self.sort or order != self.order:
+            raise ValueError("Cursor does not match the requested sort order")
+        return value, last_id
+
+    def encode(self, row, id_key):
+        value = row[self.field.key]
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        payload = json.dumps([self.sort, self.order, value, row[id_key]])
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    # Keyset feltétel és ORDER BY záradék; a NULL értékek mindkét irányban a lista végén állnak
+    def keyset(self, id_column):
+        column = self.field.column
+        op = "<" if self.descending else ">"
+        direction = "DESC" if self.descending else "ASC"
+        order_by = f"{column} {direction}{' NULLS LAST' if self.field.nullable else ''}, {id_column} {direction}"
+
+        if self.after is None:
+            return None, [], order_by
+        value, last_id = self.after
+        if not self.field.nullable:
+            return f"({column}, {id_column}) {op} (%s, %s)", [value, last_id], order_by
+        if value is None:
+            return f"({column} IS NULL AND {id_column} {op} %s)", [last_id], order_by
+        return (
+            f"({column} {op} %s OR ({column} = %s AND {id_column} {op} %s) OR {column} IS NULL)",
+            [value, value, last_id],
+            order_by,
+        )
+
+
+# Egy oldal lekérdezése: a következő oldal létezését egy plusz sor jelzi
+def fetch_page(cur, select_sql, conditions, params, page, id_column, id_key):
+    conditions = list(conditions)
+    params = list(params)
+    keyset, keyset_params, order_by = page.keyset(id_column)
+    if keyset:
+        conditions.append(keyset)
+        params.extend(keyset_params)
+
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    cur.execute(f"{select_sql}{where} ORDER BY {order_by} LIMIT %s", (*params, page.limit + 1))
+    rows = [dict(r) for r in cur.fetchall()]
+
+    next_cursor = None
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        next_cursor = page.encode(rows[-1], id_key)
+    return {"items": rows, "next_cursor": next_cursor}
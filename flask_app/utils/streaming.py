@@ -0,0 +1,29 @@
+import json
+from flask import Response
+from db.connection import detach_connection, return_connection
+
+
+# JSON tömb küldése soronként: a teljes lista nem épül fel a memóriában.
+# A kérés adatbázis-kapcsolata (és rajta a szerveroldali kurzor) a válasz lezárásáig nyitva marad.
+# A lezárás akkor is megtörténik, ha a folyam el sem indul (HEAD kérés, korán bontó kliens).
+def stream_json_array(rows):
+    conn = detach_connection()
+
+    def generate():
+        yield "["
+        for i, row in enumerate(rows):
+            yield ("," if i else "") + json.dumps(row, default=str)
+        yield "]"
+
+    # Előbb a sorok forrása (és vele a kurzor) zárul, csak utána kerül vissza a kapcsolat a készletbe
+    def close():
+        try:
+            if hasattr(rows, "close"):
+                rows.close()
+        finally:
+            if conn is not None:
+                return_connection(conn)
+
+    response = Response(generate(), mimetype="application/json")
+    response.call_on_close(close)
+    return response
@@ -0,0 +1,4 @@
+# Éles belépési pont (pl. gunicorn wsgi:app): az alkalmazás a kifizetési ütemezővel együtt indul
+from app import app, start_schedulers
+
+start_schedulers(app)
@@ -8,6 +8,7 @@ import Issues from "./Issues";
 import Garages from "./Garages";
 import Lines from "./Lines";
 import Schedules from "./Schedules";
+import { subscribe, closeEvents } from "./events";
 import "./App.css";
 
 function EditDescription({ bus, onUpdated }) {
@@ -400,10 +401,18 @@ export default function App() {
       .catch(() => setLoggedIn(false))
       .finally(() => setLoading(false));
   }, []);
+  // Az egyenleg a szerver eseményeiből frissül (vásárlás, eladás, kifizetés), nem kell újra lekérdezni
   useEffect(() => {
-    if (loggedIn) {
-      fetchBalance();
+    if (!loggedIn) {
+      closeEvents();
+      return;
     }
+    fetchBalance();
+    const unsubscribers = [
+      subscribe("balance_changed", e => setBalance(e.balance)),
+      subscribe("resync", fetchBalance),
+    ];
+    return () => unsubscribers.forEach(unsubscribe => unsubscribe());
   }, [loggedIn]);
 
   const fetchBalance = () => {
@@ -2,6 +2,7 @@ import { useState, useEffect } from "react";
 import axios from "axios";
 
 function parseTimeToSeconds(timeStr) {
+  if (!timeStr) return 0;
   const [hh, mm, ss] = timeStr.split(":").map(Number);
   return hh * 3600 + mm * 60 + ss;
 }
@@ -61,7 +62,7 @@ export default function Issues({ balance, fetchBalance }) {
   }, []);
 
   useEffect(() => {
-    axios.get("http://localhost:5000/buszok", { withCredentials: true })
+    axios.get("http://localhost:5000/buszok", { params: { fields: "plate" }, withCredentials: true })
       .then(res => setUserBuses(res.data))
       .catch(() => setUserBuses([]));
   }, []);
@@ -1,10 +1,13 @@
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import axios from "axios";
+import { subscribe } from "./events";
 
 export default function Lines() {
   const [lines, setLines] = useState([]);
   const [loading, setLoading] = useState(true);
   const [schedulesByLine, setSchedulesByLine] = useState({});
+  const schedulesRef = useRef(schedulesByLine);
+  schedulesRef.current = schedulesByLine;
   const [winnersByLine, setWinnersByLine] = useState({});
   const [garagesMap, setGaragesMap] = useState({});
   const frameTagClass = (f) => {
@@ -34,41 +37,63 @@ export default function Lines() {
     return s <= nowMin && nowMin < e;
   };
 
-  useEffect(() => {
-    axios.get("http://localhost:5000/lines", { withCredentials: true })
-      .then(res => setLines(res.data))
-      .catch(() => setLines([]))
-      .finally(() => setLoading(false));
-
+  const loadLineSchedules = (lineName) =>
+    axios.get(`http://localhost:5000/lines/${lineName}/schedules`, { withCredentials: true })
+      .then(schRes => {
+        setSchedulesByLine(prev => ({
+          ...prev,
+          [lineName]: schRes.data
+        }));
+      });
 
-    axios.get("http://localhost:5000/garages", { withCredentials: true })
-      .then(res => {
-        const map = {};
-        (res.data || []).forEach(g => { map[g.id] = g.name || `Garage #${g.id}`; });
-        setGaragesMap(map);
-      })
-      .catch(() => setGaragesMap({}));
-    axios.get("http://localhost:5000/lines/winners", { withCredentials: true })
+  // Vonalak, menetrendjeik és a nyertesek egyetlen kérésben
+  const loadOverview = () =>
+    axios.get("http://localhost:5000/lines/overview", { withCredentials: true })
       .then(res => {
+        const schedules = {};
+        const garages = {};
         const winners = {};
-        res.data.forEach(w => {
+        res.data.lines.forEach(line => {
+          schedules[line.name] = line.schedules;
+          if (line.provider_garage_name) garages[line.provider_garage_id] = line.provider_garage_name;
+        });
+        res.data.winners.forEach(w => {
           winners[w.line_name] = w;
         });
+        setLines(res.data.lines);
+        setSchedulesByLine(schedules);
+        setGaragesMap(garages);
         setWinnersByLine(winners);
       });
 
-    axios.get("http://localhost:5000/lines", { withCredentials: true })
-      .then(res => {
-        res.data.forEach(line => {
-          axios.get(`http://localhost:5000/lines/${line.name}/schedules`, { withCredentials: true })
-            .then(schRes => {
-              setSchedulesByLine(prev => ({
-                ...prev,
-                [line.name]: schRes.data
-              }));
-            });
-        });
-      });
+  // Nyertesváltozás: az érintett idősáv menetrendjeinek státusza helyben frissül;
+  // ismeretlen (időközben létrehozott) nyertes esetén a vonal menetrendjei újratöltődnek
+  useEffect(() => {
+    const unsubscribers = [
+      subscribe("winner_changed", (e) => {
+        const list = schedulesRef.current[e.line_name];
+        if (!list) return;
+        if (e.schedule_id != null && !list.some(s => s.id === e.schedule_id)) {
+          loadLineSchedules(e.line_name);
+          return;
+        }
+        setSchedulesByLine(prev => ({
+          ...prev,
+          [e.line_name]: (prev[e.line_name] || []).map(s => s.frame !== e.frame ? s : {
+            ...s,
+            status: e.schedule_id == null ? "pending" : (s.id === e.schedule_id ? "active" : "lost"),
+          }),
+        }));
+      }),
+      subscribe("resync", loadOverview),
+    ];
+    return () => unsubscribers.forEach(unsubscribe => unsubscribe());
+  }, []);
+
+  useEffect(() => {
+    loadOverview()
+      .catch(() => setLines([]))
+      .finally(() => setLoading(false));
   }, []);
 
   if (loading) return <div className="text-center mt-20">Loading lines...</div>;
@@ -1,10 +1,38 @@
 import { useState, useEffect } from "react";
 import axios from "axios";
+import { subscribe } from "./events";
+
+const EMPTY_FILTERS = { type: "", year_min: "", year_max: "", km_max: "", price_min: "", price_max: "", sort: "" };
+
+// Csak a kitöltött szűrők kerülnek a lekérdezésbe
+const filterParams = (filters) =>
+  Object.fromEntries(Object.entries(filters).filter(([, v]) => v !== "" && v != null));
+
+function IssueSummary({ summary }) {
+  if (!summary) return null;
+  return (
+    <div className="mt-2 flex flex-wrap items-center gap-2">
+      <span className={`badge-status ${summary.open_issues ? "is-broken" : "is-ok"}`}>
+        {summary.open_issues ? `Issues: ${summary.open_issues}` : "No issues"}
+      </span>
+      {summary.total_repair_cost > 0 && (
+        <span className="text-sm text-gray-700">
+          Repair costs: {Number(summary.total_repair_cost).toLocaleString()} 💰
+        </span>
+      )}
+    </div>
+  );
+}
 
 export default function Market({ onPurchase }) {
   const [buses, setBuses] = useState([]);
+  const [busesCursor, setBusesCursor] = useState(null);
   const [loading, setLoading] = useState(true);
   const [listings, setListings] = useState([]);
+  const [listingsCursor, setListingsCursor] = useState(null);
+  const [newListings, setNewListings] = useState(0);
+  const [myListings, setMyListings] = useState([]);
+  const [filters, setFilters] = useState(EMPTY_FILTERS);
   const [models, setModels] = useState([]);
   const [garages, setGarages] = useState([]);
   const [form, setForm] = useState({ model_key: "", rendszam: "", leiras: "", garazs: "" });
@@ -13,7 +41,7 @@ export default function Market({ onPurchase }) {
   const [listForm, setListForm] = useState({ rendszam: "", price: "" });
   const [targetGarageByListing, setTargetGarageByListing] = useState({});
   const [targetGarageByBus, setTargetGarageByBus] = useState({});
-  const [issuesByPlate, setIssuesByPlate] = useState({});
+  const [issueSummary, setIssueSummary] = useState({});
   const selectedModel = models.find(m => m.key === form.model_key);
   const modelPrice = selectedModel ? selectedModel.price : null;
 
@@ -33,46 +61,107 @@ export default function Market({ onPurchase }) {
   const openAlert = (title, message) => setAlertDlg({ open: true, title, message });
   const closeAlert = () => setAlertDlg({ open: false, title: "", message: "" });
 
-  useEffect(() => {
-    axios.get("http://localhost:5000/session", { withCredentials: true })
-      .then(res => setUsername(res.data?.username || null))
-      .catch(() => setUsername(null));
+  // A kártyákon csak a buszonkénti hibaösszesítő jelenik meg, a betöltött oldal buszaira lekérve
+  const loadIssueSummary = (plates) => {
+    if (!plates.length) return;
+    axios.get("http://localhost:5000/hibak/summary", { params: { plates: plates.join(",") }, withCredentials: true })
+      .then(res => setIssueSummary(prev => ({ ...prev, ...res.data })))
+      .catch(() => {});
+  };
 
-    axios.get("http://localhost:5000/market/listings", { withCredentials: true })
-      .then(res => setListings(res.data))
-      .catch(() => setListings([]));
+  // A hirdetések és a használt buszok lapozva érkeznek; cursor nélkül az első oldal töltődik be
+  const loadListings = (user, activeFilters, cursor = null) => {
+    const params = { ...filterParams(activeFilters), ...(user ? { exclude_seller: user } : {}), ...(cursor ? { cursor } : {}) };
+    return axios.get("http://localhost:5000/market/listings", { params, withCredentials: true })
+      .then(res => {
+        loadIssueSummary(res.data.items.map(l => l.bus_plate));
+        setListings(prev => cursor ? [...prev, ...res.data.items] : res.data.items);
+        setListingsCursor(res.data.next_cursor);
+        if (!cursor) setNewListings(0);
+      })
+      .catch(() => { if (!cursor) setListings([]); });
+  };
 
-    axios.get("http://localhost:5000/market", { withCredentials: true })
-      .then((res) => setBuses(res.data))
-      .catch((err) => console.error(err))
-      .finally(() => setLoading(false));
+  const loadMyListings = (user) => {
+    if (!user) {
+      setMyListings([]);
+      return Promise.resolve();
+    }
+    return axios.get("http://localhost:5000/market/listings", { params: { seller: user, limit: 200 }, withCredentials: true })
+      .then(res => {
+        loadIssueSummary(res.data.items.map(l => l.bus_plate));
+        setMyListings(res.data.items);
+      })
+      .catch(() => setMyListings([]));
+  };
 
-    axios.get("http://localhost:5000/market/models", { withCredentials: true })
-      .then(res => setModels(res.data))
-      .catch(() => setModels([]));
+  const loadBuses = (activeFilters, cursor = null) => {
+    const params = { ...filterParams(activeFilters), ...(cursor ? { cursor } : {}) };
+    return axios.get("http://localhost:5000/market", { params, withCredentials: true })
+      .then(res => {
+        loadIssueSummary(res.data.items.map(b => b.plate));
+        setBuses(prev => cursor ? [...prev, ...res.data.items] : res.data.items);
+        setBusesCursor(res.data.next_cursor);
+      })
+      .catch((err) => console.error(err));
+  };
 
-    axios.get("http://localhost:5000/garages", { withCredentials: true })
-      .then(res => setGarages(res.data))
-      .catch(() => setGarages([]));
+  const applyFilters = (e) => {
+    e.preventDefault();
+    loadListings(username, filters);
+    loadBuses(filters);
+  };
 
-    axios.get("http://localhost:5000/buszok", { withCredentials: true })
-      .then(res => setMyBuses(res.data || []))
-      .catch(() => setMyBuses([]));
+  const resetFilters = () => {
+    setFilters(EMPTY_FILTERS);
+    loadListings(username, EMPTY_FILTERS);
+    loadBuses(EMPTY_FILTERS);
+  };
 
-    axios.get("http://localhost:5000/hibak/all", { withCredentials: true })
+  // Az oldal kezdőállapota egyetlen kérésben érkezik; szűréskor és lapozáskor a külön végpontok töltenek
+  useEffect(() => {
+    axios.get("http://localhost:5000/bootstrap/market", { withCredentials: true })
       .then(res => {
-        const list = Array.isArray(res.data) ? res.data : [];
-        const grouped = list.reduce((acc, it) => {
-          const plate = it.bus || it.busz || it.rendszam || it.plate;
-          if (!plate) return acc;
-          (acc[plate] = acc[plate] || []).push(it);
-          return acc;
-        }, {});
-        setIssuesByPlate(grouped);
+        const data = res.data;
+        setUsername(data.session?.username || null);
+        setListings(data.listings.items);
+        setListingsCursor(data.listings.next_cursor);
+        setNewListings(0);
+        setMyListings(data.my_listings);
+        setBuses(data.market.items);
+        setBusesCursor(data.market.next_cursor);
+        setModels(data.models);
+        setGarages(data.garages);
+        setMyBuses(data.my_buses);
+        setIssueSummary(data.issue_summary);
       })
-      .catch(() => setIssuesByPlate({}));
+      .catch((err) => console.error(err))
+      .finally(() => setLoading(false));
   }, []);
 
+  // Mások változásai eseményként érkeznek: az eladott és visszavont hirdetések eltűnnek a listákból,
+  // az új hirdetésekről csak egy számláló jelez, hogy a lapozott lista ne ugráljon
+  useEffect(() => {
+    const removeListing = (e) => {
+      setListings(ls => ls.filter(l => l.listing_id !== e.listing_id));
+      setMyListings(ls => ls.filter(l => l.listing_id !== e.listing_id));
+    };
+    const unsubscribers = [
+      subscribe("listing_sold", removeListing),
+      subscribe("listing_canceled", removeListing),
+      subscribe("listing_created", (e) => {
+        if (e.seller_username === username) loadMyListings(username);
+        else setNewListings(n => n + 1);
+      }),
+      subscribe("resync", () => {
+        loadMyListings(username);
+        loadListings(username, filters);
+        loadBuses(filters);
+      }),
+    ];
+    return () => unsubscribers.forEach(unsubscribe => unsubscribe());
+  }, [username, filters]);
+
   const calculatePrice = (km) => {
     const basePrice = 100000;
     const minPrice = 10000;
@@ -99,7 +188,7 @@ export default function Market({ onPurchase }) {
   const handleCancelListing = (listingId) => {
     axios.post("http://localhost:5000/market/cancel", { listing_id: listingId }, { withCredentials: true })
       .then(res => {
-        setListings(ls => ls.filter(l => l.listing_id !== listingId));
+        setMyListings(ls => ls.filter(l => l.listing_id !== listingId));
       })
       .catch(err => openAlert("Error", err.response?.data?.error || "Cancel failed"));
   };
@@ -170,9 +259,8 @@ export default function Market({ onPurchase }) {
         axios.post("http://localhost:5000/market/list", { rendszam, price: p }, { withCredentials: true })
           .then(res => {
             setListForm({ rendszam: "", price: "" });
-            return axios.get("http://localhost:5000/market/listings", { withCredentials: true });
+            return loadMyListings(username);
           })
-          .then(resp => setListings(resp.data || []))
           .catch(err => openAlert("Error", err.response?.data?.error || "Failed to create listing"))
           .finally(() => closeConfirm());
       }
@@ -182,8 +270,7 @@ export default function Market({ onPurchase }) {
   if (loading) return <div className="text-center mt-10">Loading market...</div>;
 
   const unlockedGarages = (garages || []).filter(g => g.unlocked);
-  const myListings = username ? listings.filter(l => l.seller_username === username) : [];
-  const otherListings = username ? listings.filter(l => l.seller_username !== username) : listings;
+  const setFilter = (key) => (e) => setFilters(f => ({ ...f, [key]: e.target.value }));
 
   return (
     <div className="max-w-6xl mx-auto mt-8">
@@ -350,7 +437,6 @@ export default function Market({ onPurchase }) {
           <div className="grid grid-cols-1 md:grid-cols-2 gap-5">
             {myListings.map(l => {
               const plate = l.bus_plate;
-              const issues = issuesByPlate[plate] || [];
               return (
                 <div key={l.listing_id} className="bus-card bus-card--yellow bg-white p-5 rounded-xl shadow border-4 border-blue-800">
                   <div className="flex items-start justify-between">
@@ -367,23 +453,7 @@ export default function Market({ onPurchase }) {
                     <span className="badge-status is-idle">Your listing</span>
                   </div>
 
-                  <div className="mt-2">
-                    <span className={`badge-status ${issues.length ? "is-broken" : "is-ok"}`}>
-                      {issues.length ? `Issues: ${issues.length}` : "No issues"}
-                    </span>
-                    {issues.length > 0 && (
-                      <ul className="mt-2 list-disc ml-5 text-sm text-gray-800">
-                        {issues.slice(0, 3).map((it, idx) => (
-                          <li key={it.id || idx}>
-                            {it.description}
-                            {it.repair_time ? (
-                              <span className="text-xs text-gray-600"> — repair: {String(it.repair_time)}</span>
-                            ) : null}
-                          </li>
-                        ))}
-                      </ul>
-                    )}
-                  </div>
+                  <IssueSummary summary={issueSummary[plate]} />
 
                   <div className="mt-3 text-2xl font-extrabold text-blue-900">
                     <span className="price-tag">
@@ -415,13 +485,38 @@ export default function Market({ onPurchase }) {
         </div>
       )}
 
+      <form onSubmit={applyFilters} className="panel bg-white border-4 border-blue-800 p-4 rounded-2xl shadow mb-8 grid grid-cols-2 md:grid-cols-4 gap-3">
+        <input className="input-industrial border p-2 rounded" placeholder="Type" value={filters.type} onChange={setFilter("type")} />
+        <input type="number" className="input-industrial border p-2 rounded" placeholder="Year from" value={filters.year_min} onChange={setFilter("year_min")} />
+        <input type="number" className="input-industrial border p-2 rounded" placeholder="Year to" value={filters.year_max} onChange={setFilter("year_max")} />
+        <input type="number" className="input-industrial border p-2 rounded" placeholder="Max km" value={filters.km_max} onChange={setFilter("km_max")} />
+        <input type="number" className="input-industrial border p-2 rounded" placeholder="Min price" value={filters.price_min} onChange={setFilter("price_min")} />
+        <input type="number" className="input-industrial border p-2 rounded" placeholder="Max price" value={filters.price_max} onChange={setFilter("price_max")} />
+        <select className="input-industrial border p-2 rounded" value={filters.sort} onChange={setFilter("sort")}>
+          <option value="">Default order</option>
+          <option value="price">Price</option>
+          <option value="year">Year</option>
+          <option value="km">Km</option>
+          <option value="type">Type</option>
+        </select>
+        <div className="flex gap-2">
+          <button type="submit" className="btn-industrial btn-industrial--primary text-black px-4 py-2 rounded flex-1">Filter</button>
+          <button type="button" className="btn-industrial btn-industrial--secondary px-4 py-2 rounded" onClick={resetFilters}>Reset</button>
+        </div>
+      </form>
+
       <div className="mb-12">
         <h2 className="section-title text-2xl font-semibold mb-4 text-center">Used Bus Listings</h2>
+        {newListings > 0 && (
+          <div className="text-center mb-4">
+            <button className="btn-industrial btn-industrial--secondary px-5 py-2 rounded" onClick={() => loadListings(username, filters)}>
+              Show {newListings} new listing{newListings > 1 ? "s" : ""}
+            </button>
+          </div>
+        )}
         <div className="grid grid-cols-1 md:grid-cols-2 gap-5">
-          {otherListings.map(l => {
+          {listings.map(l => {
             const plate = l.bus_plate;
-            const hasIssuesData = Object.prototype.hasOwnProperty.call(issuesByPlate, plate);
-            const issues = issuesByPlate[plate] || [];
             const selectedGarage = targetGarageByListing[l.listing_id];
             const canBuy = unlockedGarages.length > 0 && typeof selectedGarage === "number" && Number.isFinite(selectedGarage);
             return (
@@ -440,25 +535,7 @@ export default function Market({ onPurchase }) {
                   <span className="badge-status is-ok">Available</span>
                 </div>
 
-                {hasIssuesData && (
-                  <div className="mt-2">
-                    <span className={`badge-status ${issues.length ? "is-broken" : "is-ok"}`}>
-                      {issues.length ? `Issues: ${issues.length}` : "No issues"}
-                    </span>
-                    {issues.length > 0 && (
-                      <ul className="mt-2 list-disc ml-5 text-sm text-gray-800">
-                        {issues.slice(0, 3).map((it, idx) => (
-                          <li key={it.id || idx}>
-                            {it.description}
-                            {it.repair_time ? (
-                              <span className="text-xs text-gray-600"> — repair: {String(it.repair_time)}</span>
-                            ) : null}
-                          </li>
-                        ))}
-                      </ul>
-                    )}
-                  </div>
-                )}
+                <IssueSummary summary={issueSummary[plate]} />
 
                 <div className="mt-3">
                   <label className="text-sm text-gray-700 mr-2">Store in garage:</label>
@@ -505,6 +582,13 @@ export default function Market({ onPurchase }) {
             );
           })}
         </div>
+        {listingsCursor && (
+          <div className="text-center mt-4">
+            <button className="btn-industrial btn-industrial--secondary px-5 py-2 rounded" onClick={() => loadListings(username, filters, listingsCursor)}>
+              Load more listings
+            </button>
+          </div>
+        )}
       </div>
 
       <div className="mb-10">
@@ -512,9 +596,7 @@ export default function Market({ onPurchase }) {
         <div className="grid grid-cols-1 md:grid-cols-2 gap-5">
           {buses.map((bus) => {
             const plate = bus.plate;
-            const hasIssuesData = Object.prototype.hasOwnProperty.call(issuesByPlate, plate);
-            const issues = issuesByPlate[plate] || [];
-            const price = calculatePrice(bus.km);
+            const price = bus.price ?? calculatePrice(bus.km);
             const selectedGarage = targetGarageByBus[plate];
             const canBuy = unlockedGarages.length > 0 && typeof selectedGarage === "number" && Number.isFinite(selectedGarage);
             return (
@@ -532,25 +614,7 @@ export default function Market({ onPurchase }) {
                   <span className="badge-status is-ok">Available</span>
                 </div>
 
-                {hasIssuesData && (
-                  <div className="mt-2">
-                    <span className={`badge-status ${issues.length ? "is-broken" : "is-ok"}`}>
-                      {issues.length ? `Issues: ${issues.length}` : "No issues"}
-                    </span>
-                    {issues.length > 0 && (
-                      <ul className="mt-2 list-disc ml-5 text-sm text-gray-800">
-                        {issues.slice(0, 3).map((it, idx) => (
-                          <li key={it.id || idx}>
-                            {it.description}
-                            {it.repair_time ? (
-                              <span className="text-xs text-gray-600"> — repair: {String(it.repair_time)}</span>
-                            ) : null}
-                          </li>
-                        ))}
-                      </ul>
-                    )}
-                  </div>
-                )}
+                <IssueSummary summary={issueSummary[plate]} />
 
                 <div className="mt-3">
                   <label className="text-sm text-gray-700 mr-2">Store in garage:</label>
@@ -597,6 +661,13 @@ export default function Market({ onPurchase }) {
             );
           })}
         </div>
+        {busesCursor && (
+          <div className="text-center mt-4">
+            <button className="btn-industrial btn-industrial--secondary px-5 py-2 rounded" onClick={() => loadBuses(filters, busesCursor)}>
+              Load more buses
+            </button>
+          </div>
+        )}
       </div>
     </div>
   );
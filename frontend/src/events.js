@@ -0,0 +1,38 @@
+// Közös server-sent events kapcsolat a /events végponthoz.
+// A komponensek eseménytípusonként iratkoznak fel; újracsatlakozás után "resync" eseményt kapnak,
+// mert a kapcsolat nélküli időszak változásai elvesztek.
+const EVENTS_URL = "http://localhost:5000/events";
+
+let source = null;
+let opened = false;
+const handlers = {};
+
+const dispatch = (type, data) => (handlers[type] || new Set()).forEach(h => h(data));
+
+const listen = (type) => source.addEventListener(type, e => dispatch(type, JSON.parse(e.data)));
+
+const connect = () => {
+  if (source) return;
+  source = new EventSource(EVENTS_URL, { withCredentials: true });
+  opened = false;
+  source.onopen = () => {
+    if (opened) dispatch("resync", {});
+    opened = true;
+  };
+  Object.keys(handlers).filter(type => type !== "resync").forEach(listen);
+};
+
+export function subscribe(type, handler) {
+  if (!handlers[type]) {
+    handlers[type] = new Set();
+    if (source && type !== "resync") listen(type);
+  }
+  handlers[type].add(handler);
+  connect();
+  return () => handlers[type].delete(handler);
+}
+
+export function closeEvents() {
+  if (source) source.close();
+  source = null;
+}